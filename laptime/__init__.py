@@ -1,10 +1,15 @@
-import pkg_resources
+from .loader import load, load_many
 
-try:
-    __version__ = pkg_resources.get_distribution(__name__).version
-except:
-    __version__ = 'unknown'
 
-from ._version import get_versions
-__version__ = get_versions()['version']
-del get_versions
+def __getattr__(name):
+    # Working out the version in a source checkout means running git, which
+    # is far too slow to do every time the package is imported. Built and
+    # installed copies have it baked into _version.py by versioneer.
+    if name == '__version__':
+        from ._version import get_versions
+        version = get_versions()['version']
+        globals()['__version__'] = version
+        return version
+
+    raise AttributeError(
+        'module {!r} has no attribute {!r}'.format(__name__, name))
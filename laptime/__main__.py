@@ -1,43 +1,198 @@
 import argparse
-from serial import Serial
+import importlib.util
+import sys
 
-from .reader import record
-from .misc import generate_filename, human_readable
+from .sinks import FORMATS, Tee, open_sink
+from .rotation import COMPRESSION, RotatingSink
+from .misc import generate_filename
 
 
+# Subcommands, and the module whose main() runs each one. Anything else on
+# the command line means record.
+COMMANDS = {
+    'report': 'laptime.report',
+    'bench': 'laptime.bench',
+    'simulate': 'laptime.simulator',
+}
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if argv and argv[0] in COMMANDS:
+        module = importlib.import_module(COMMANDS[argv[0]])
+        return module.main(argv[1:])
 
-def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('-p', '--port', dest='port', type=str,
-            help='The serial port to listen on (default: COM1)')
+            action='append',
+            help=('The serial port to listen on (default: COM1). Repeat it '
+                  'to record several timing gates into one file, numbered '
+                  'from 0 in the order given'))
     parser.add_argument('-o', '--output-file', dest='out', type=str,
             help='The basename of your output file (default: "track_times")')
+    parser.add_argument('-f', '--format', dest='formats', action='append',
+            choices=sorted(FORMATS),
+            help=('The output format to write. Repeat it to write several '
+                  'formats at once (default: csv)'))
+    parser.add_argument('-z', '--compress', dest='compress',
+            choices=sorted(COMPRESSION),
+            help='Compress text output files as they are written')
+    parser.add_argument('--rotate-size', dest='rotate_size', type=float,
+            help=('Start a new output file once the current one reaches '
+                  'this many megabytes'))
+    parser.add_argument('--rotate-every', dest='rotate_every', type=float,
+            help=('Start a new output file after this many minutes'))
+    parser.add_argument('--index', dest='index', action='store_true',
+            help=('Keep a seek index alongside each csv file, for looking '
+                  'up laps by number or time later on'))
+    parser.add_argument('--car', dest='car', type=int,
+            help='The number of the car being timed (saved in sqlite output)')
+    parser.add_argument('-b', '--binary', dest='binary', action='store_true',
+            help=('Expect compact binary frames from the timing gates '
+                  'instead of lines of text'))
+    parser.add_argument('--capture', dest='capture', type=str,
+            help=('Also append every raw chunk read from the serial port(s) '
+                  'to this capture file'))
+    parser.add_argument('--replay', dest='replay', type=str,
+            help='Read from a capture file instead of a serial port')
+    parser.add_argument('--replay-speed', dest='replay_speed', type=float,
+            default=0,
+            help=('How fast to replay a capture, e.g. 1 for real time or 10 '
+                  'for ten times faster (default: as fast as possible)'))
+    parser.add_argument('--metrics-port', dest='metrics_port', type=int,
+            help=('Serve metrics for Prometheus on localhost at this port '
+                  'while recording (e.g. 9464)'))
     parser.add_argument('-v', '--verbose', dest='verbose', action='store_true',
             help='Print recorded results to stderr as they are received')
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    formats = args.formats or ['csv']
+
+    # Checked up front, so nothing's left half opened when a sink can't be
+    if args.index:
+        for fmt in formats:
+            if fmt != 'csv':
+                parser.error("{} output can't be indexed".format(fmt))
+        if args.compress:
+            parser.error("compressed output can't be indexed")
+
+    if args.compress:
+        for fmt in formats:
+            if fmt not in ('csv', 'jsonl'):
+                parser.error("{} output can't be compressed".format(fmt))
+        if (args.compress == 'zstd'
+                and importlib.util.find_spec('zstandard') is None):
+            parser.error('zstd compression needs the "zstandard" package')
+
+    if args.replay:
+        from .capture import capture_channels
+
+        # A ReplaySerial can't be selected on, so there's no replaying
+        # several ports into record_many()
+        if len(capture_channels(args.replay)) > 1:
+            parser.error('{} was captured from several serial ports, which '
+                         "can't be replayed".format(args.replay))
+
+    run(args)
+
+
+def run(args):
+    # The recording stack (and pyserial) is only imported here, so the
+    # other commands don't have to wait for it
+    from .reader import record
+    from .multi import record_many
+    from .capture import CaptureWriter, CapturingSerial, ReplaySerial
+    from .latency import PipelineStats
 
     if args.port:
-        serial_port = args.port
+        serial_ports = args.port
     else:
-        serial_port = 'COM1'  
+        serial_ports = ['COM1']
         
-    if args.out:
-        output_file = generate_filename(base=args.out)
+    base = args.out or 'track_times'
+    formats = args.formats or ['csv']
+
+    capture = None
+    replay_fp = None
+
+    stats = PipelineStats()
+
+    # Before opening anything, in case the port is already taken
+    metrics = None
+    if args.metrics_port is not None:
+        from .metrics import MetricsServer
+
+        metrics = MetricsServer(stats, port=args.metrics_port)
+        metrics.start()
+        print('Serving metrics on {}'.format(metrics.url), file=sys.stderr)
+
+    if args.replay:
+        replay_fp = open(args.replay, 'rb')
+        connections = [ReplaySerial(replay_fp, speed=args.replay_speed or None)]
     else:
-        output_file = generate_filename()
+        from serial import Serial
 
-    # Set the timeout to be some stupidly huge number so the program will
-    # Just block until it receives another entry from the arduino
-    ser = Serial(serial_port, baudrate=19600, timeout=100000)
+        # Set the timeout to be some stupidly huge number so the program will
+        # Just block until it receives another entry from the arduino
+        connections = [Serial(port, baudrate=19600, timeout=100000)
+                       for port in serial_ports]
+
+    if args.capture:
+        capture = CaptureWriter(open(args.capture, 'ab'))
+        connections = [CapturingSerial(ser, capture, channel=i)
+                       for i, ser in enumerate(connections)]
+
+    gate = args.binary or len(connections) > 1
+    if args.rotate_size or args.rotate_every:
+        max_bytes = args.rotate_size and int(args.rotate_size * 1024**2)
+        max_seconds = args.rotate_every and args.rotate_every * 60
+        sinks = [RotatingSink(base, fmt, gate=gate,
+                              compression=args.compress,
+                              max_bytes=max_bytes, max_seconds=max_seconds,
+                              index=args.index, car=args.car)
+                 for fmt in formats]
+    else:
+        suffix = '.' + COMPRESSION[args.compress] if args.compress else ''
+        filenames = [generate_filename(base=base,
+                                       extension=FORMATS[fmt] + suffix)
+                     for fmt in formats]
+        sinks = [open_sink(filename, fmt, gate=gate,
+                           compression=args.compress, index=args.index,
+                           car=args.car)
+                 for filename, fmt in zip(filenames, formats)]
+
+    # A Tee already gives each sink its own writer thread
+    if len(sinks) == 1:
+        sink, background = sinks[0], True
+    else:
+        sink, background = Tee(sinks), False
 
     # Start the actual recording
-    with open(output_file, 'w') as fp:
-        record(ser, fp, verbose=args.verbose)
+    try:
+        if len(connections) == 1:
+            record(connections[0], None, verbose=args.verbose,
+                   background=background, binary=args.binary, sink=sink,
+                   stats=stats)
+        else:
+            record_many(connections, None, verbose=args.verbose,
+                        background=background, binary=args.binary,
+                        sink=sink, stats=stats)
+    finally:
+        sink.close()
+        if capture is not None:
+            capture.close()
+        if replay_fp is not None:
+            replay_fp.close()
+        if metrics is not None:
+            metrics.stop()
+        # Where the time went, even if recording was interrupted
+        stats.report(sys.stderr)
     
 
 if __name__ == '__main__':
     # This line is here so that you can import the file without
     # executing it.
-    main()
+    sys.exit(main())
 
@@ -0,0 +1,171 @@
+"""
+An asyncio version of the recorder, so laptimes can be read on the same
+event loop as everything else (network publishers, dashboards, etc.)
+without needing a thread per serial port.
+"""
+import asyncio
+import sys
+
+from .framing import LineFramer, BinaryFramer
+from .laps import LapTimer, GateLapTimers
+from .sinks import CSVSink
+
+
+# Put on the queue to tell the consumer there are no more laps coming
+_DONE = object()
+
+
+class AsyncRecorder:
+    """
+    Register a serial connection's file descriptor with the event loop and
+    deliver each lap through an async iterator.
+
+    Messages are parsed with the same `LapTimer` used by `record()`, so both
+    produce identical laps.
+
+    Example
+    -------
+    ::
+
+        async with AsyncRecorder(ser) as recorder:
+            async for lap in recorder:
+                print(lap.summary())
+
+    Parameters
+    ----------
+    serial_connection: serial.Serial
+        A serial connection created using the pyserial library. It must
+        have a real file descriptor (i.e. a POSIX serial port or pty).
+    loop: asyncio.AbstractEventLoop
+        The event loop to use (default: the currently running loop).
+    binary: bool
+        Expect binary frames (see `laptime.framing.BinaryFramer`) instead of
+        lines of text.
+    clock: laptime.clock.SessionClock
+        Timestamps each lap (default: a new one).
+
+    Attributes
+    ----------
+    parse_errors: int
+        How many lines weren't a number (and were skipped).
+    """
+    def __init__(self, serial_connection, loop=None, binary=False,
+                 clock=None):
+        self.ser = serial_connection
+        self.loop = loop
+        self.parse_errors = 0
+
+        if binary:
+            self.framer = BinaryFramer()
+            self.timer = GateLapTimers(clock=clock)
+        else:
+            self.framer = LineFramer()
+            self.timer = LapTimer(clock=clock)
+
+        self.queue = None
+        self.fd = None
+
+    def start(self):
+        """
+        Start watching the serial port. This is done automatically when you
+        start iterating.
+        """
+        if self.queue is not None:
+            return
+
+        self.loop = self.loop or asyncio.get_event_loop()
+        self.queue = asyncio.Queue()
+
+        if not self.ser.is_open:
+            self.ser.open()
+
+        # Reads only happen once the loop says there's something there, so
+        # they should never block
+        self.ser.timeout = 0
+
+        self.fd = self.ser.fileno()
+        self.loop.add_reader(self.fd, self._on_readable)
+
+    def stop(self):
+        """
+        Stop watching the serial port. Any laps which have already been
+        received will still be delivered.
+        """
+        if self.fd is not None:
+            self.loop.remove_reader(self.fd)
+            self.fd = None
+            self.queue.put_nowait(_DONE)
+
+    def _on_readable(self):
+        try:
+            for message in self.framer.read_from(self.ser):
+                try:
+                    lap = self.timer.lap(message)
+                except ValueError:
+                    # Line noise, skip it (like the binary framer does)
+                    self.parse_errors += 1
+                    continue
+
+                if lap is None:
+                    self.stop()
+                    return
+
+                self.queue.put_nowait(lap)
+        except Exception as e:
+            # Hand the error to whoever is iterating over us
+            self.queue.put_nowait(e)
+            self.stop()
+
+    def __aiter__(self):
+        self.start()
+        return self
+
+    async def __anext__(self):
+        item = await self.queue.get()
+
+        if item is _DONE:
+            # Make sure anyone else iterating also gets told we're done
+            self.queue.put_nowait(_DONE)
+            raise StopAsyncIteration
+        elif isinstance(item, Exception):
+            raise item
+
+        return item
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.stop()
+
+
+async def record_async(serial_connection, fp, verbose=False, binary=False):
+    """
+    The asyncio equivalent of `laptime.reader.record()`, writing the same
+    csv rows for the same input.
+
+    Parameters
+    ----------
+    serial_connection: serial.Serial
+        A serial connection created using the pyserial library.
+    fp: file-like object
+        An object that behaves like a file (i.e. has a read() and write()
+        method). Most commonly created with `open(some_filename, 'w')`.
+    verbose: bool
+        Print each lap to stderr as it is received.
+    binary: bool
+        Expect binary frames instead of lines of text, adding a "Gate"
+        column to the output.
+    """
+    sink = CSVSink(fp, gate=binary)
+
+    if verbose:
+        print(', '.join(sink.header), file=sys.stderr)
+
+    async with AsyncRecorder(serial_connection, binary=binary) as recorder:
+        async for lap in recorder:
+            sink.writerow(lap)
+
+            if verbose:
+                print(lap.summary(), file=sys.stderr)
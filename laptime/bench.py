@@ -0,0 +1,1172 @@
+"""
+Micro-benchmarks for the performance-sensitive parts of laptime.
+
+Run them with::
+
+    $ laptime bench [name ...]
+
+Nothing here waits on real hardware. The serial port is played by a
+`ChunkedStream` full of seeded random laps, so every run sees the same
+data. Save the results as a baseline with ``--save baseline.json``, then
+check later runs against it with ``--compare baseline.json``. Anything which
+got more than ``--threshold`` worse counts as a regression, and makes the
+command exit with an error. Benchmarks which need an optional module that
+isn't installed (NumPy, or `pty` on Windows) are skipped, and say so.
+"""
+from collections import OrderedDict, deque, namedtuple
+import importlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import sys
+import threading
+import time
+from datetime import datetime
+
+from .framing import LineFramer, BinaryFramer, encode_frame
+from .multi import MultiRecorder
+from .capture import CaptureWriter, ReplaySerial
+from .clock import SessionClock
+from .laps import MULTI_HEADER, LapTimer
+from .reader import Recorder, record
+
+
+BENCHMARKS = OrderedDict()
+
+# The optional modules each benchmark can't run without
+NEEDS = {}
+
+# How much worse a measurement can get before it counts as a regression
+THRESHOLD = 0.1
+
+# The most always-on latency tracking may add to the cost of recording, as a
+# fraction
+LATENCY_OVERHEAD_BUDGET = 0.05
+
+# How long importing each entry point is allowed to take, in seconds
+IMPORT_BUDGETS = OrderedDict([
+    ('laptime', 0.05),
+    ('laptime.misc', 0.05),
+    ('laptime.loader', 0.05),
+    ('laptime.columnar', 0.08),
+    ('laptime.index', 0.08),
+    ('laptime.report', 0.08),
+    ('laptime.__main__', 0.1),
+    ('laptime.reader', 0.15),
+])
+
+
+def benchmark(name, needs=()):
+    """
+    Decorator which registers a benchmark function under `name`.
+
+    A benchmark function takes no arguments and returns a dictionary
+    mapping the name of each measurement to its value. `needs` lists any
+    optional modules it uses, and it's skipped when they're missing.
+    """
+    def decorate(func):
+        BENCHMARKS[name] = func
+        NEEDS[name] = tuple(needs)
+        return func
+    return decorate
+
+
+def missing(name):
+    """
+    The modules benchmark `name` needs which can't be imported here.
+    """
+    absent = []
+    for module in NEEDS.get(name, ()):
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            absent.append(module)
+    return absent
+
+
+def best_of(func, repeat=5):
+    """
+    Call `func` several times and return the fastest run, in seconds.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def import_times(module):
+    """
+    Import `module` in a fresh interpreter, and find out everything that
+    imported along with it.
+
+    Returns
+    -------
+    dict
+        Maps the name of every module imported (as reported by
+        ``python -X importtime``) to how long it took, in seconds, including
+        whatever it imported in turn.
+    """
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        stderr=subprocess.PIPE, universal_newlines=True, check=True).stderr
+
+    times = {}
+    # "import time: self [us] | cumulative | imported package"
+    for line in output.splitlines()[1:]:
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative) / 1e6
+
+    return times
+
+
+def import_time(module, repeat=5):
+    """
+    How long it takes a fresh interpreter to import `module`, in seconds
+    (the fastest of several tries).
+    """
+    return min(import_times(module)[module] for _ in range(repeat))
+
+
+def millis_stream(num_lines, seed=42):
+    """
+    Generate the bytes an arduino would send for `num_lines` laps.
+    """
+    rng = random.Random(seed)
+    current = rng.randint(1, 20000)
+    lines = []
+    for _ in range(num_lines):
+        current += rng.randint(30*1000, 250*1000)
+        lines.append(str(current).encode('ascii'))
+    return b'\n'.join(lines) + b'\n'
+
+
+def frame_stream(num_frames, num_gates=4, seed=42):
+    """
+    Generate the binary frames `num_gates` arduinos would send for
+    `num_frames` laps between them.
+    """
+    rng = random.Random(seed)
+    millis = 0
+    frames = []
+    for sequence in range(num_frames):
+        millis += rng.randint(1000, 20*1000)
+        frames.append(encode_frame(sequence % num_gates, millis,
+                                   sequence % 0x10000))
+    return b''.join(frames)
+
+
+class ChunkedStream:
+    """
+    A serial stand-in which hands out a fixed blob of bytes in chunks of
+    (at most) `chunk_size`, without ever sleeping.
+
+    It has enough of `serial.Serial`'s interface to be recorded from (by
+    `laptime.reader.record()` or a `Recorder`), and runs dry like a serial
+    port timing out once all the data has been read.
+    """
+    def __init__(self, data, chunk_size=8):
+        self.data = data
+        self.chunk_size = chunk_size
+        self.position = 0
+        self.timeout = None
+        self.is_open = True
+
+    def open(self):
+        self.is_open = True
+
+    @property
+    def in_waiting(self):
+        return min(len(self.data) - self.position, self.chunk_size)
+
+    def readline(self):
+        end = self.data.find(b'\n', self.position)
+        end = len(self.data) if end < 0 else end + 1
+        line = self.data[self.position:end]
+        self.position = end
+        return line
+
+    def read(self, num_bytes=1):
+        num_bytes = min(num_bytes, self.chunk_size)
+        chunk = self.data[self.position:self.position + num_bytes]
+        self.position += len(chunk)
+        return chunk
+
+    def readinto(self, buffer):
+        chunk = self.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+    def exhausted(self):
+        return self.position >= len(self.data)
+
+
+class PipeSerial:
+    """
+    A serial stand-in backed by an OS pipe, so it has a real file descriptor
+    which can be waited on with a selector just like a serial port.
+
+    Anything passed to `send()` comes out of `read()` on the other end.
+    """
+    def __init__(self):
+        self.read_fd, self.write_fd = os.pipe()
+        os.set_blocking(self.read_fd, False)
+        self.timeout = 0
+        self.is_open = True
+
+    def fileno(self):
+        return self.read_fd
+
+    def read(self, num_bytes=1):
+        try:
+            return os.read(self.read_fd, num_bytes)
+        except BlockingIOError:
+            return b''
+
+    def send(self, data):
+        os.write(self.write_fd, data)
+
+    def close(self):
+        if self.is_open:
+            os.close(self.read_fd)
+            os.close(self.write_fd)
+            self.is_open = False
+
+
+def deque_frames(stream):
+    """
+    The original per-byte `deque` framing loop from `Recorder.get_millis()`
+    (with its newline comparison fixed so it terminates), kept around as a
+    baseline to compare against.
+    """
+    newline = ord(b'\n')
+    buff = deque()
+    messages = []
+
+    while not stream.exhausted():
+        stuff = stream.read(8)
+        buff.extend(stuff)
+
+        if b'\n' in stuff:
+            next_char = buff.popleft()
+
+            message = bytearray()
+            while next_char != newline:
+                message.append(next_char)
+                next_char = buff.popleft()
+
+            messages.append(message)
+
+    return messages
+
+
+def framer_frames(stream):
+    """
+    Frame everything in `stream` using a `LineFramer`.
+    """
+    framer = LineFramer()
+    messages = []
+
+    while not stream.exhausted():
+        messages.extend(framer.read_from(stream))
+
+    return messages
+
+
+@benchmark('framing')
+def bench_framing(num_lines=20000):
+    data = millis_stream(num_lines)
+    results = OrderedDict()
+
+    for chunk_size in (8, 4096):
+        for name, frame in [('deque', deque_frames),
+                            ('framer', framer_frames)]:
+            if name == 'deque' and chunk_size != 8:
+                # The deque loop only ever reads 8 bytes at a time
+                continue
+
+            duration = best_of(lambda: frame(ChunkedStream(data, chunk_size)))
+            key = '{}_{}b_lines_per_sec'.format(name, chunk_size)
+            results[key] = num_lines / duration
+
+    return results
+
+
+@benchmark('binary_framing')
+def bench_binary_framing(num_frames=100000):
+    data = frame_stream(num_frames)
+    text = millis_stream(num_frames)
+
+    return OrderedDict([
+        ('ascii_bytes_per_event', len(text) / num_frames),
+        ('binary_bytes_per_event', len(data) / num_frames),
+        ('ascii_events_per_sec', num_frames / best_of(
+            lambda: [int(line) for line in LineFramer().feed(text)])),
+        ('binary_events_per_sec', num_frames / best_of(
+            lambda: BinaryFramer().feed(data))),
+    ])
+
+
+@benchmark('int_parse')
+def bench_int_parse(num_lines=200000):
+    messages = LineFramer().feed(millis_stream(num_lines))
+    timer = LapTimer()
+
+    return OrderedDict([
+        ('int_bytes_per_sec', num_lines / best_of(
+            lambda: [int(message) for message in messages])),
+        ('int_decoded_per_sec', num_lines / best_of(
+            lambda: [int(message.decode('ascii')) for message in messages])),
+        ('lap_timer_per_sec', num_lines / best_of(
+            lambda: [timer.lap(message) for message in messages])),
+    ])
+
+
+@benchmark('record')
+def bench_record(num_lines=100000):
+    data = millis_stream(num_lines)
+
+    def per_row(background):
+        fp = io.StringIO()
+        duration = best_of(lambda: record(ChunkedStream(data, 4096), fp,
+                                          background=background), repeat=3)
+        return duration / num_lines
+
+    foreground = per_row(False)
+    background = per_row(True)
+
+    return OrderedDict([
+        ('us_per_row', foreground * 1e6),
+        ('us_per_row_background', background * 1e6),
+        ('rows_per_sec', 1 / foreground),
+    ])
+
+
+@benchmark('latency')
+def bench_latency(num_lines=20000, repeat=41):
+    # What always-on latency tracking costs record(), measured by switching
+    # it on and off in turn so each pair of runs sees the same machine
+    # noise. The overhead is the median over all the pairs, which is much
+    # steadier than comparing the best run of each.
+    from .latency import Histogram
+
+    results = OrderedDict()
+
+    for name, binary, data in [('ascii', False, millis_stream(num_lines)),
+                               ('binary', True, frame_stream(num_lines))]:
+        for background in (False, True):
+            def timed(stats):
+                start = time.perf_counter()
+                record(ChunkedStream(data, 4096), io.StringIO(),
+                       binary=binary, background=background, stats=stats)
+                return time.perf_counter() - start
+
+            off, on = [], []
+            for i in range(repeat):
+                # Take turns going first, so neither always runs straight
+                # after the other (and its garbage)
+                if i % 2:
+                    on.append(timed(None))
+                    off.append(timed(False))
+                else:
+                    off.append(timed(False))
+                    on.append(timed(None))
+
+            key = name + ('_background' if background else '')
+            results[key + '_untracked_ms'] = min(off) * 1000
+            results[key + '_tracked_ms'] = min(on) * 1000
+            results[key + '_overhead_percent'] = 100 * (statistics.median(
+                b / a for a, b in zip(off, on)) - 1)
+
+    results['overhead_budget_percent'] = 100 * LATENCY_OVERHEAD_BUDGET
+
+    histogram = Histogram()
+    values = [random.Random(42).randrange(10**9) for _ in range(100000)]
+    duration = best_of(lambda: [histogram.record(value) for value in values])
+    results['histogram_record_ns'] = duration / len(values) * 1e9
+
+    return results
+
+
+@benchmark('replay')
+def bench_replay(num_lines=200000, lines_per_chunk=4):
+    # Build a capture the way a Recorder would produce one, with a few
+    # lines in each chunk read off the serial port
+    lines = millis_stream(num_lines).split(b'\n')[:-1]
+    fp = io.BytesIO()
+    capture = CaptureWriter(fp)
+    for i in range(0, num_lines, lines_per_chunk):
+        chunk = b'\n'.join(lines[i:i + lines_per_chunk]) + b'\n'
+        capture.write(chunk, timestamp=i*1000*1000)
+
+    def replay():
+        fp.seek(0)
+        ser = ReplaySerial(fp)
+        framer = LineFramer(buffer_size=1 << 16)
+        count = 0
+
+        while True:
+            messages = framer.read_from(ser)
+            if not messages and ser.exhausted:
+                return count
+            count += len([int(message) for message in messages])
+
+    return OrderedDict([
+        ('capture_bytes', len(fp.getvalue())),
+        ('events_per_sec', num_lines / best_of(replay, repeat=3)),
+    ])
+
+
+@benchmark('timestamps')
+def bench_timestamps(num_events=100000):
+    clock = SessionClock()
+
+    def wall_clock():
+        for _ in range(num_events):
+            str(datetime.now())
+
+    def monotonic():
+        for _ in range(num_events):
+            str(clock.now())
+
+    return OrderedDict([
+        ('datetime_now_per_sec', num_events / best_of(wall_clock)),
+        ('session_clock_per_sec', num_events / best_of(monotonic)),
+    ])
+
+
+def measure_waiting(wait, num_events=50, interval=0.01):
+    """
+    Send timestamped lines through a `PipeSerial` at a steady rate and read
+    them back with a `Recorder`, measuring how much CPU time the reader
+    burns and how long each line takes to come out of `get_millis()`.
+    """
+    ser = PipeSerial()
+    recorder = Recorder(ser, io.StringIO(), log_file=os.devnull,
+                        verbose=False, write_header=False, wait=wait,
+                        wait_timeout=0.1)
+
+    def sender():
+        for _ in range(num_events):
+            time.sleep(interval)
+            ser.send(str(time.perf_counter_ns()).encode('ascii') + b'\n')
+
+    thread = threading.Thread(target=sender)
+    latencies = []
+
+    start_wall = time.perf_counter()
+    start_cpu = time.thread_time()
+    thread.start()
+
+    for message in recorder.get_millis():
+        latencies.append(time.perf_counter_ns() - int(message))
+        if len(latencies) == num_events:
+            recorder.stop()
+
+    cpu = time.thread_time() - start_cpu
+    wall = time.perf_counter() - start_wall
+    thread.join()
+    ser.close()
+
+    latencies.sort()
+    return OrderedDict([
+        ('cpu_percent', 100 * cpu / wall),
+        ('latency_median_us', latencies[len(latencies)//2] / 1000),
+        ('latency_max_us', latencies[-1] / 1000),
+    ])
+
+
+@benchmark('waiting')
+def bench_waiting():
+    results = OrderedDict()
+
+    for name, wait in [('busy', False), ('select', True)]:
+        for key, value in measure_waiting(wait).items():
+            results['{}_{}'.format(name, key)] = value
+
+    return results
+
+
+@benchmark('multi_gate')
+def bench_multi_gate(num_gates=4, num_events=20000):
+    connections = [PipeSerial() for _ in range(num_gates)]
+    payload = millis_stream(num_events)
+
+    def sender(ser):
+        # Trickle the data in so the reader has to keep up with it
+        for start in range(0, len(payload), 512):
+            ser.send(payload[start:start + 512])
+        ser.send(b'0\n')
+
+    threads = [threading.Thread(target=sender, args=(ser,))
+               for ser in connections]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    count = sum(1 for _ in MultiRecorder(connections).laps())
+    duration = time.perf_counter() - start
+
+    for thread in threads:
+        thread.join()
+    for ser in connections:
+        ser.close()
+
+    return OrderedDict([
+        ('gates', num_gates),
+        ('laps', count),
+        ('laps_per_sec', count / duration),
+    ])
+
+
+@benchmark('columnar_load', needs=['numpy'])
+def bench_columnar_load(num_laps=1000000):
+    # Imported here so the other benchmarks still work without them
+    import csv
+    from .columnar import convert_csv, read_session
+
+    directory = tempfile.mkdtemp()
+    csv_filename = os.path.join(directory, 'session.csv')
+    session_filename = os.path.join(directory, 'session.laps')
+
+    try:
+        rng = random.Random(42)
+        with open(csv_filename, 'w', newline='') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(MULTI_HEADER)
+            millis = 0
+            for i in range(num_laps):
+                laptime = rng.randint(20000, 90000)
+                millis += laptime
+                writer.writerow([1460000000000000000 + millis * 10**6, millis,
+                                 laptime, '', i % 4])
+        convert_csv(csv_filename, session_filename)
+
+        def load_csv():
+            with open(csv_filename, newline='') as fp:
+                reader = csv.reader(fp)
+                next(reader)
+                laptimes = [int(row[2]) for row in reader]
+            return sum(laptimes)
+
+        def load_columnar():
+            with read_session(session_filename) as session:
+                return int(session['laptime'].sum())
+
+        assert load_csv() == load_columnar()
+        csv_time = best_of(load_csv, repeat=3)
+        columnar_time = best_of(load_columnar, repeat=3)
+    finally:
+        shutil.rmtree(directory)
+
+    return OrderedDict([
+        ('laps', num_laps),
+        ('csv_load_ms', csv_time * 1000),
+        ('columnar_load_ms', columnar_time * 1000),
+        ('speedup', csv_time / columnar_time),
+    ])
+
+
+@benchmark('sqlite')
+def bench_sqlite(num_laps=20000, batch_size=256):
+    from .database import SQLiteSink
+    from .laps import Lap
+
+    laps = [Lap(i * 10**9, i * 1000, 1000, None) for i in range(num_laps)]
+    directory = tempfile.mkdtemp()
+
+    def insert(batch_size, count):
+        filename = os.path.join(directory, 'laps_{}.db'.format(batch_size))
+        sink = SQLiteSink(filename, batch_size=batch_size, batch_interval=60)
+        start = time.perf_counter()
+        for lap in laps[:count]:
+            sink.writerow(lap)
+        sink.close()
+        return count / (time.perf_counter() - start)
+
+    try:
+        # One transaction per lap is slow enough that fewer laps will do
+        per_lap = insert(1, num_laps // 10)
+        batched = insert(batch_size, num_laps)
+    finally:
+        shutil.rmtree(directory)
+
+    return OrderedDict([
+        ('laps_per_sec_commit_every_lap', per_lap),
+        ('laps_per_sec_batched', batched),
+        ('speedup', batched / per_lap),
+    ])
+
+
+@benchmark('seek_index')
+def bench_seek_index(num_laps=500000):
+    from .index import SeekIndex, read_laps, _rows
+    from .laps import Lap
+    from .sinks import open_sink
+
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'session.csv')
+    target = num_laps * 9 // 10
+
+    try:
+        sink = open_sink(filename, index=True)
+        laps = [Lap(i * 10**9, i * 1000, 1000, None) for i in range(num_laps)]
+        sink.writerows(laps)
+        sink.close()
+
+        def scan():
+            for i, lap in enumerate(_rows(filename, None)):
+                if i == target:
+                    return lap
+
+        def seek():
+            return next(read_laps(filename, target, index=SeekIndex(filename)))
+
+        assert scan() == seek() == laps[target]
+        scan_time = best_of(scan, repeat=3)
+        seek_time = best_of(seek)
+    finally:
+        shutil.rmtree(directory)
+
+    return OrderedDict([
+        ('laps', num_laps),
+        ('scan_ms', scan_time * 1000),
+        ('seek_ms', seek_time * 1000),
+        ('speedup', scan_time / seek_time),
+    ])
+
+
+@benchmark('bulk_load')
+def bench_bulk_load(num_laps=1000000, num_files=4):
+    from .laps import Lap
+    from .loader import load, load_many, _parse_rows
+    from .sinks import open_sink
+
+    directory = tempfile.mkdtemp()
+    filenames = [os.path.join(directory, 'session_{}.csv'.format(i))
+                 for i in range(num_files)]
+
+    try:
+        rng = random.Random(42)
+        laps = [Lap(1460000000000000000 + i * 10**9, i * 1000,
+                    rng.randint(20000, 90000), i % 4)
+                for i in range(num_laps)]
+        for filename in filenames:
+            sink = open_sink(filename, gate=True)
+            sink.writerows(laps)
+            sink.close()
+
+        def row_at_a_time():
+            with open(filenames[0], 'rb') as fp:
+                return _parse_rows(fp.read())
+
+        csv_time = best_of(lambda: row_at_a_time(), repeat=1)
+        load_time = best_of(lambda: load(filenames[0]), repeat=3)
+        serial_time = best_of(lambda: load_many(filenames, processes=1),
+                              repeat=1)
+        parallel_time = best_of(lambda: load_many(filenames), repeat=1)
+    finally:
+        shutil.rmtree(directory)
+
+    total = num_laps * num_files
+    return OrderedDict([
+        ('laps', num_laps),
+        ('rows_per_sec_csv_module', num_laps / csv_time),
+        ('rows_per_sec_load', num_laps / load_time),
+        ('rows_per_sec_load_many_serial', total / serial_time),
+        ('rows_per_sec_load_many_parallel', total / parallel_time),
+    ])
+
+
+@benchmark('session_stats')
+def bench_session_stats(num_laps=200000, num_snapshots=100000):
+    from .stats import SessionStats
+
+    rng = random.Random(42)
+    laptimes = [rng.randint(20000, 90000) for _ in range(num_laps)]
+    stats = SessionStats()
+
+    start = time.perf_counter()
+    for laptime in laptimes:
+        stats.update(laptime)
+    update_time = time.perf_counter() - start
+
+    # The first snapshot after a lap does the work, the rest are cached
+    start = time.perf_counter()
+    stats.snapshot()
+    fresh_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(num_snapshots):
+        stats.snapshot()
+    cached_time = time.perf_counter() - start
+
+    return OrderedDict([
+        ('laps_per_sec', num_laps / update_time),
+        ('fresh_snapshot_us', fresh_time * 1e6),
+        ('cached_snapshot_us', cached_time / num_snapshots * 1e6),
+        ('sketch_buckets', len(stats.sketch.buckets)),
+    ])
+
+
+@benchmark('leaderboard')
+def bench_leaderboard(num_cars=10000, num_events=1000000, k=10):
+    from .leaderboard import Leaderboard
+
+    rng = random.Random(42)
+    # Cars gradually improve, so some events are personal bests
+    events = [(rng.randrange(num_cars),
+               rng.randint(60000, 90000) - i * 20000 // num_events)
+              for i in range(num_events)]
+    board = Leaderboard()
+
+    start = time.perf_counter()
+    personal_bests = sum(board.update(car, laptime)
+                         for car, laptime in events)
+    update_time = time.perf_counter() - start
+
+    top_time = best_of(lambda: board.top(k))
+
+    # What it costs to re-sort every car's best lap after each event
+    bests = dict(board.bests)
+    sort_time = best_of(lambda: sorted(bests.items(),
+                                       key=lambda item: item[1])[:k])
+
+    return OrderedDict([
+        ('cars', num_cars),
+        ('events', num_events),
+        ('events_per_sec', num_events / update_time),
+        ('personal_bests', personal_bests),
+        ('top_k_us', top_time * 1e6),
+        ('resort_per_event_us', sort_time * 1e6),
+    ])
+
+
+@benchmark('human_readable', needs=['numpy'])
+def bench_human_readable(num_durations=1000000):
+    import numpy as np
+    from .misc import human_readable, human_readable_many
+
+    rng = np.random.RandomState(42)
+    durations = rng.randint(0, 10 * 60 * 1000, num_durations)
+    as_list = durations.tolist()
+
+    assert human_readable_many(durations[:1000]) == [
+        human_readable(value) for value in as_list[:1000]]
+
+    loop_time = best_of(lambda: [human_readable(value) for value in as_list],
+                        repeat=1)
+    batch_time = best_of(lambda: human_readable_many(durations), repeat=3)
+    padded_time = best_of(lambda: human_readable_many(durations, True),
+                          repeat=3)
+    array_time = best_of(lambda: human_readable_many(durations, array=True),
+                         repeat=3)
+
+    return OrderedDict([
+        ('durations', num_durations),
+        ('loop_ms', loop_time * 1000),
+        ('batch_ms', batch_time * 1000),
+        ('batch_padded_ms', padded_time * 1000),
+        ('batch_array_ms', array_time * 1000),
+        ('speedup', loop_time / batch_time),
+        ('speedup_array', loop_time / array_time),
+    ])
+
+
+class SlowStream:
+    """
+    A file which takes `delay` seconds to write anything, like a busy disk
+    or network share.
+    """
+    def __init__(self, delay):
+        self.delay = delay
+        self.written = 0
+
+    def write(self, text):
+        time.sleep(self.delay)
+        self.written += len(text)
+
+    def flush(self):
+        pass
+
+
+@benchmark('logging')
+def bench_logging(num_records=2000, delay=0.0002):
+    import logging
+    from .logs import get_logger, stop_logging
+
+    directory = tempfile.mkdtemp()
+
+    def per_call(name, queued):
+        logger = get_logger(name, os.path.join(directory, name + '.log'),
+                            log_level=logging.DEBUG, queued=queued)
+
+        # Swap the log file for a slow one, wherever it's being written
+        handlers = logger.handlers
+        if queued:
+            handlers = handlers[0].listener.handlers
+        for handler in handlers:
+            handler.setStream(SlowStream(delay)).close()
+
+        start = time.perf_counter()
+        for i in range(num_records):
+            logger.debug('Got: "%s"', i)
+        duration = time.perf_counter() - start
+
+        stop_logging()
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+        return duration / num_records
+
+    try:
+        direct = per_call('laptime.bench.direct', queued=False)
+        queued = per_call('laptime.bench.queued', queued=True)
+    finally:
+        shutil.rmtree(directory)
+
+    return OrderedDict([
+        ('disk_write_us', delay * 1e6),
+        ('file_handler_us_per_call', direct * 1e6),
+        ('queued_us_per_call', queued * 1e6),
+        ('speedup', direct / queued),
+    ])
+
+
+@benchmark('import')
+def bench_import():
+    results = OrderedDict()
+
+    for module, budget in IMPORT_BUDGETS.items():
+        results[module + '_ms'] = import_time(module) * 1e3
+        results[module + '_budget_ms'] = budget * 1e3
+
+    return results
+
+
+def lap_stream(num_laps, num_gates=4, seed=42):
+    """
+    Seeded random laps, as they'd come out of `record()`.
+    """
+    from .laps import Lap
+
+    rng = random.Random(seed)
+    millis = 0
+    laps = []
+    for i in range(num_laps):
+        laptime = rng.randint(20000, 90000)
+        millis += laptime
+        laps.append(Lap(1460000000000000000 + millis * 10**6, millis,
+                        laptime, i % num_gates))
+    return laps
+
+
+@benchmark('sinks')
+def bench_sinks(num_laps=100000, batch_size=64):
+    from .rotation import COMPRESSION
+    from .sinks import FORMATS, open_sink
+
+    laps = lap_stream(num_laps)
+    outputs = [(fmt, None) for fmt in FORMATS]
+    outputs += [('csv', compression) for compression in COMPRESSION]
+    directory = tempfile.mkdtemp()
+    results = OrderedDict()
+
+    def write(fmt, compression):
+        extension = FORMATS[fmt]
+        if compression is not None:
+            extension += '.' + COMPRESSION[compression]
+        filename = os.path.join(directory, 'laps.' + extension)
+        if os.path.exists(filename):
+            os.remove(filename)
+
+        # In batches, the same as a BackgroundWriter hands them over
+        sink = open_sink(filename, fmt, gate=True, compression=compression)
+        for i in range(0, num_laps, batch_size):
+            sink.writerows(laps[i:i + batch_size])
+        sink.close()
+
+    try:
+        for fmt, compression in outputs:
+            name = fmt if compression is None else '{}_{}'.format(
+                fmt, compression)
+            try:
+                duration = best_of(lambda: write(fmt, compression), repeat=3)
+            except ValueError:
+                # e.g. zstandard isn't installed
+                continue
+            results['{}_laps_per_sec'.format(name)] = num_laps / duration
+    finally:
+        shutil.rmtree(directory)
+
+    return results
+
+
+@benchmark('end_to_end')
+def bench_end_to_end(num_events=200000):
+    from .sinks import open_sink
+
+    directory = tempfile.mkdtemp()
+    filename = os.path.join(directory, 'session.csv')
+    results = OrderedDict()
+
+    try:
+        for name, binary, data in [
+                ('ascii', False, millis_stream(num_events)),
+                ('binary', True, frame_stream(num_events))]:
+
+            # Serial port to csv file, with the file written on a
+            # background thread like the command line recorder does
+            def session():
+                sink = open_sink(filename, gate=binary)
+                record(ChunkedStream(data, 4096), None, background=True,
+                       binary=binary, sink=sink)
+                sink.close()
+
+            duration = best_of(session, repeat=3)
+            with open(filename) as fp:
+                assert sum(1 for _ in fp) == num_events + 1
+            results['{}_events_per_sec'.format(name)] = num_events / duration
+    finally:
+        shutil.rmtree(directory)
+
+    return results
+
+
+@benchmark('pty', needs=['pty'])
+def bench_pty(num_events=50000):
+    # Through a pseudo-terminal and pyserial, like a real timing gate
+    from serial import Serial
+    from .simulator import VirtualGate
+
+    def recorded(binary):
+        with VirtualGate(rate=None, binary=binary, gates=4 if binary else 1,
+                         seed=42) as gate:
+            ser = Serial(gate.port, timeout=5)
+            gate.start(count=num_events)
+
+            start = time.perf_counter()
+            record(ser, io.StringIO(), binary=binary)
+            duration = time.perf_counter() - start
+
+            gate.join()
+            ser.close()
+        return num_events / duration
+
+    def recorder():
+        with VirtualGate(rate=None, seed=42) as gate:
+            ser = Serial(gate.port, timeout=5)
+            gate.start(count=num_events)
+            reader = Recorder(ser, io.StringIO(), log_file=os.devnull,
+                              verbose=False, write_header=False)
+
+            start = time.perf_counter()
+            for message in reader.get_millis():
+                if message == b'0':
+                    reader.stop()
+            duration = time.perf_counter() - start
+
+            gate.join()
+            ser.close()
+        return num_events / duration
+
+    return OrderedDict([
+        ('record_ascii_events_per_sec', recorded(False)),
+        ('record_binary_events_per_sec', recorded(True)),
+        ('recorder_events_per_sec', recorder()),
+    ])
+
+
+def run(names=None):
+    """
+    Run the named benchmarks (or all of them), returning their results.
+
+    Benchmarks which need a module that isn't installed are left out, see
+    `missing()`.
+    """
+    names = names or list(BENCHMARKS)
+    results = OrderedDict()
+
+    for name in names:
+        if name not in BENCHMARKS:
+            raise ValueError('Unknown benchmark: {}'.format(name))
+        if not missing(name):
+            results[name] = BENCHMARKS[name]()
+
+    return results
+
+
+Comparison = namedtuple('Comparison', ['benchmark', 'measurement',
+                                       'baseline', 'current', 'regressed'])
+
+
+def direction(measurement):
+    """
+    Which way is better for a measurement, going by its name: 1 if bigger
+    is better (rates and speedups), -1 if smaller is better (times and
+    percentages) and 0 if it's not a performance number at all (counts,
+    sizes, budgets, ...).
+    """
+    words = measurement.split('_')
+
+    if 'budget' in words:
+        return 0
+    if 'sec' in words or 'speedup' in words:
+        return 1
+    if {'ms', 'us', 'ns', 'percent'}.intersection(words):
+        return -1
+    return 0
+
+
+def save_baseline(filename, results):
+    """
+    Save the results from `run()` as JSON, along with where they came from.
+    """
+    baseline = OrderedDict([
+        ('python', platform.python_version()),
+        ('platform', platform.platform()),
+        ('results', results),
+    ])
+
+    with open(filename, 'w') as fp:
+        json.dump(baseline, fp, indent=2)
+
+
+def load_baseline(filename):
+    """
+    Load the results saved by `save_baseline()`.
+    """
+    with open(filename) as fp:
+        return json.load(fp, object_pairs_hook=OrderedDict)['results']
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """
+    Compare the results from `run()` with a baseline.
+
+    Parameters
+    ----------
+    results: dict
+        The results of each benchmark.
+    baseline: dict
+        Earlier results, e.g. from `load_baseline()`. Benchmarks and
+        measurements missing from either one are skipped.
+    threshold: float
+        How much worse than the baseline (as a fraction, e.g. 0.1 for 10%) a
+        measurement has to be to count as a regression. Percentages are
+        compared in percentage points instead (0.1 allows 10 points), as
+        they're already relative and often close to zero. Any other
+        baseline of zero or less gives nothing to take a fraction of, so
+        those measurements are compared but never count as regressions.
+
+    Returns
+    -------
+    list of Comparison
+    """
+    comparisons = []
+
+    for name, measurements in results.items():
+        for key, value in measurements.items():
+            old = baseline.get(name, {}).get(key)
+            better = direction(key)
+            if old is None or not better:
+                continue
+
+            if 'percent' in key.split('_'):
+                margin = threshold * 100
+            else:
+                margin = old * threshold
+
+            if margin <= 0:
+                regressed = False
+            elif better > 0:
+                regressed = value < old - margin
+            else:
+                regressed = value > old + margin
+            comparisons.append(Comparison(name, key, old, value, regressed))
+
+    return comparisons
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog='laptime bench',
+        description='Benchmark the performance-sensitive parts of laptime')
+    parser.add_argument('names', nargs='*', metavar='name',
+            help='The benchmarks to run (default: all of them)')
+    parser.add_argument('-l', '--list', dest='list', action='store_true',
+            help='List the benchmarks and exit')
+    parser.add_argument('-s', '--save', dest='save', type=str,
+            help='Save the results to this JSON file, as a baseline')
+    parser.add_argument('-c', '--compare', dest='compare', type=str,
+            help='Compare the results with a baseline saved by --save')
+    parser.add_argument('-t', '--threshold', dest='threshold', type=float,
+            default=THRESHOLD,
+            help=('How much worse than the baseline counts as a regression, '
+                  'as a fraction (default: {})'.format(THRESHOLD)))
+
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name in BENCHMARKS:
+            print(name)
+        return 0
+
+    for name in args.names:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: {}'.format(name))
+
+    baseline = load_baseline(args.compare) if args.compare else None
+    results = run(args.names)
+
+    comparisons = {}
+    if baseline is not None:
+        comparisons = {(c.benchmark, c.measurement): c for c in
+                       compare(results, baseline, args.threshold)}
+
+    for name, measurements in results.items():
+        print(name)
+        for key, value in measurements.items():
+            line = '    {:<40} {:>16,.1f}'.format(key, value)
+
+            comparison = comparisons.get((name, key))
+            if comparison is not None:
+                old = comparison.baseline
+                line += ' {:>16,.1f}'.format(old)
+                if 'percent' in key.split('_'):
+                    line += ' {:>+6.1f}pp'.format(value - old)
+                elif old > 0:
+                    line += ' {:>+8.1%}'.format(value / old - 1)
+                else:
+                    line += ' {:>8}'.format('n/a')
+                if comparison.regressed:
+                    line += '  REGRESSION'
+            print(line)
+
+    for name in args.names or BENCHMARKS:
+        absent = missing(name)
+        if absent:
+            print('Skipped {}: needs {}'.format(name, ', '.join(absent)))
+
+    if args.save:
+        save_baseline(args.save, results)
+
+    regressions = [c for c in comparisons.values() if c.regressed]
+    if regressions:
+        print('{} regression(s) worse than {:.0%} of the baseline'.format(
+              len(regressions), args.threshold), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,290 @@
+"""
+Capture the raw bytes read from a serial port to a file, and replay them
+later without any hardware attached.
+
+A capture file starts with the 8 byte magic string `MAGIC`, followed by one
+record per chunk read from the serial port::
+
+    offset  size  field
+    0       8     time.monotonic_ns() when the chunk arrived (uint64)
+    8       2     channel, i.e. which serial port it came from (uint16)
+    10      4     length of the chunk (uint32)
+    14      ...   the chunk itself
+
+All integers are little endian. Records are only ever appended, so if the
+recorder crashes the worst that can happen is a truncated final record,
+which is ignored when reading.
+"""
+import struct
+import time
+
+
+MAGIC = b'LAPCAP\x00\x01'
+RECORD = struct.Struct('<QHI')
+
+
+class CaptureWriter:
+    """
+    Append raw chunks to a capture file.
+
+    Parameters
+    ----------
+    fp: file-like object
+        A file opened in binary append mode, e.g. `open(filename, 'ab')`.
+    """
+    def __init__(self, fp):
+        self.fp = fp
+
+        if self.fp.tell() == 0:
+            self.fp.write(MAGIC)
+
+    def write(self, chunk, channel=0, timestamp=None):
+        """
+        Record a chunk of bytes.
+
+        Parameters
+        ----------
+        chunk: bytes
+            The bytes which were read.
+        channel: int
+            Which serial port they came from.
+        timestamp: int
+            When they arrived, in nanoseconds (default:
+            `time.monotonic_ns()`).
+        """
+        if timestamp is None:
+            timestamp = time.monotonic_ns()
+
+        self.fp.write(RECORD.pack(timestamp, channel, len(chunk)))
+        self.fp.write(chunk)
+
+    def flush(self):
+        self.fp.flush()
+
+    def close(self):
+        self.fp.close()
+
+
+def read_capture(fp, block_size=1 << 20):
+    """
+    Read back every chunk in a capture file.
+
+    Parameters
+    ----------
+    fp: file-like object
+        A capture file opened in binary mode.
+    block_size: int
+        How much of the file to read at a time.
+
+    Yields
+    ------
+    tuple
+        A `(timestamp, channel, chunk)` tuple for each chunk, in the order
+        they were captured.
+
+    Raises
+    ------
+    ValueError
+        If the file isn't a capture file.
+    """
+    if fp.read(len(MAGIC)) != MAGIC:
+        raise ValueError('Not a laptime capture file')
+
+    # Read the file in big blocks and pick the records out of them, rather
+    # than doing two tiny reads per record
+    pending = b''
+
+    while True:
+        block = fp.read(block_size)
+        if not block:
+            return
+
+        data = pending + block if pending else block
+        end = len(data)
+        pos = 0
+
+        while pos + RECORD.size <= end:
+            timestamp, channel, length = RECORD.unpack_from(data, pos)
+            start = pos + RECORD.size
+            if start + length > end:
+                break
+
+            yield timestamp, channel, data[start:start + length]
+            pos = start + length
+
+        pending = data[pos:]
+
+
+def capture_channels(filename):
+    """
+    Find out which channels (i.e. serial ports) a capture file has chunks
+    from.
+
+    Returns
+    -------
+    list of int
+        Every channel, in order.
+    """
+    with open(filename, 'rb') as fp:
+        return sorted({channel for _, channel, _ in read_capture(fp)})
+
+
+class CapturingSerial:
+    """
+    Wrap a serial connection so every chunk read from it is also written to
+    a `CaptureWriter`. Anything else is passed straight through to the
+    wrapped connection.
+
+    Parameters
+    ----------
+    serial_connection: serial.Serial
+        The connection to wrap.
+    capture: CaptureWriter
+        Where the chunks get written.
+    channel: int
+        The channel to record chunks under.
+    """
+    def __init__(self, serial_connection, capture, channel=0):
+        self.ser = serial_connection
+        self.capture = capture
+        self.channel = channel
+
+    def read(self, size=1):
+        data = self.ser.read(size)
+        if data:
+            self.capture.write(data, self.channel)
+        return data
+
+    def readline(self, *args, **kwargs):
+        data = self.ser.readline(*args, **kwargs)
+        if data:
+            self.capture.write(data, self.channel)
+        return data
+
+    def readinto(self, buffer):
+        num_bytes = self.ser.readinto(buffer)
+        if num_bytes:
+            self.capture.write(bytes(buffer[:num_bytes]), self.channel)
+        return num_bytes
+
+    @property
+    def timeout(self):
+        return self.ser.timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self.ser.timeout = value
+
+    def __getattr__(self, name):
+        return getattr(self.ser, name)
+
+
+class ReplaySerial:
+    """
+    A serial stand-in which plays back the chunks from a capture file.
+
+    Parameters
+    ----------
+    fp: file-like object
+        A capture file opened in binary mode.
+    speed: float
+        How fast to replay the capture relative to how it was recorded, e.g.
+        1 for real time or 10 for ten times as fast. None (the default)
+        hands out data as fast as it's asked for.
+    channel: int
+        Only replay the chunks recorded from this channel.
+
+    Note
+    ----
+    Like a real serial port, reads block until there's enough data unless
+    `timeout` is set to 0. Once the capture runs out, reads return whatever
+    is left (possibly nothing) instead of blocking forever.
+    """
+    def __init__(self, fp, speed=None, channel=0):
+        self.chunks = ((timestamp, chunk)
+                       for timestamp, ch, chunk in read_capture(fp)
+                       if ch == channel)
+        self.speed = speed
+        self.buffer = bytearray()
+        self.next_chunk = None
+        self.origin = None
+        self.exhausted = False
+        self.is_open = True
+        self.timeout = None
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def _release(self, wanted, block):
+        # Move chunks which are due into the buffer until there's at least
+        # `wanted` bytes in it (or we run out or would have to wait)
+        if len(self.buffer) >= wanted:
+            return
+
+        if self.speed is None:
+            for timestamp, chunk in self.chunks:
+                self.buffer += chunk
+                if len(self.buffer) >= wanted:
+                    return
+            self.exhausted = True
+            return
+
+        while len(self.buffer) < wanted:
+            if self.next_chunk is None:
+                self.next_chunk = next(self.chunks, None)
+                if self.next_chunk is None:
+                    self.exhausted = True
+                    return
+
+            timestamp, chunk = self.next_chunk
+            now = time.monotonic_ns()
+            if self.origin is None:
+                self.origin = (timestamp, now)
+
+            due = self.origin[1] + (timestamp - self.origin[0])/self.speed
+            if due > now:
+                if not block:
+                    return
+                time.sleep((due - now) / 1e9)
+
+            self.buffer += chunk
+            self.next_chunk = None
+
+    def _take(self, num_bytes):
+        data = bytes(self.buffer[:num_bytes])
+        del self.buffer[:num_bytes]
+        return data
+
+    @property
+    def in_waiting(self):
+        self._release(1, block=False)
+        return len(self.buffer)
+
+    def read(self, size=1):
+        self._release(size, block=self.timeout != 0)
+        return self._take(size)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def readline(self):
+        block = self.timeout != 0
+        searched = 0
+
+        while True:
+            end = self.buffer.find(b'\n', searched)
+            if end >= 0:
+                return self._take(end + 1)
+
+            searched = len(self.buffer)
+            if self.exhausted:
+                return self._take(searched)
+
+            self._release(searched + 1, block)
+            if not block and len(self.buffer) == searched:
+                return b''
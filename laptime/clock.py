@@ -0,0 +1,71 @@
+"""
+Timestamps for recorded events.
+"""
+from datetime import datetime
+import time
+
+
+class SessionClock:
+    """
+    Stamp events using the monotonic clock, anchored to the wall clock once
+    at the start of a session.
+
+    Every timestamp is `time.monotonic_ns()` shifted by a fixed offset so it
+    reads as nanoseconds since the epoch. That makes the gap between any two
+    events exact, even if NTP (or a person) changes the system clock halfway
+    through a session, and is a lot cheaper than creating a `datetime` for
+    every event. Turning a timestamp into something a human can read is
+    left until somebody actually needs to read it.
+
+    Parameters
+    ----------
+    wall_anchor: int
+        The wall-clock time the session started, in nanoseconds since the
+        epoch (default: `time.time_ns()`).
+    monotonic_anchor: int
+        The `time.monotonic_ns()` reading taken at the same moment.
+    """
+    def __init__(self, wall_anchor=None, monotonic_anchor=None):
+        if wall_anchor is None:
+            wall_anchor = time.time_ns()
+        if monotonic_anchor is None:
+            monotonic_anchor = time.monotonic_ns()
+
+        self.wall_anchor = wall_anchor
+        self.monotonic_anchor = monotonic_anchor
+        self.offset = wall_anchor - monotonic_anchor
+
+    def now(self):
+        """
+        The current time, in nanoseconds since the epoch.
+        """
+        return time.monotonic_ns() + self.offset
+
+    def from_monotonic(self, monotonic_ns):
+        """
+        Convert a `time.monotonic_ns()` reading (e.g. the arrival time of a
+        captured chunk) into this session's timescale.
+        """
+        return monotonic_ns + self.offset
+
+    def started(self):
+        """
+        When the session started, as a `datetime.datetime`.
+        """
+        return to_datetime(self.wall_anchor)
+
+
+def to_datetime(timestamp):
+    """
+    Turn a timestamp in nanoseconds since the epoch into a (local time)
+    `datetime.datetime`.
+    """
+    seconds, nanos = divmod(timestamp, 10**9)
+    return datetime.fromtimestamp(seconds).replace(microsecond=nanos // 1000)
+
+
+def format_timestamp(timestamp, timestamp_format='%x %X'):
+    """
+    Format a timestamp in nanoseconds since the epoch for a human to read.
+    """
+    return to_datetime(timestamp).strftime(timestamp_format)
@@ -0,0 +1,372 @@
+"""
+A compact columnar file format for recorded sessions, designed to be
+memory-mapped and read without parsing or copying anything.
+
+Layout::
+
+    offset  size  field
+    0       8     magic string (b'LAPCOL\\x00\\x02')
+    8       8     number of laps, n (uint64)
+    16      4     number of columns, c (uint32)
+    20      4     length of the metadata, m (uint32)
+    24      8     room for laps in each column, k (uint64)
+    32      8     where the first column starts, d (uint64)
+    40      m     metadata as UTF-8 JSON, padded with spaces to a multiple
+                  of 8 bytes
+    d       8*n   the first column (int64), then room for k-n more laps
+    d+8*k   ...   the remaining c-1 columns, each 8*k bytes after the last
+
+All integers are little endian. A finished file normally has its columns
+packed together straight after the metadata (k = n and d = 40+m), but
+while `ColumnarSink` is recording there's room left at the end of each
+column. Version 1 files (magic ending in 1) have no k or d, and are always
+packed. The metadata is a JSON object whose
+"columns" entry lists the column names in the order they appear in the
+file. The standard columns are "timestamp" (nanoseconds since the epoch),
+"millis", "laptime" and, for multi-gate sessions, "gate" (-1 where there
+isn't one).
+
+NumPy is used when reading if it is installed, otherwise columns come back
+as `memoryview` objects (which are just as zero-copy, if less convenient).
+"""
+from array import array
+import csv
+import json
+import mmap
+import struct
+import sys
+import time
+
+from .laps import parse_timestamp
+from .sink import Sink
+
+
+MAGIC = b'LAPCOL\x00\x02'
+MAGIC_V1 = b'LAPCOL\x00\x01'
+HEADER = struct.Struct('<QII')
+# Follows the header in version 2 files
+EXTENT = struct.Struct('<QQ')
+COLUMNS = ['timestamp', 'millis', 'laptime']
+EXTENSION = 'laps'
+
+# Stored in the gate column for laps which didn't come from a specific gate
+NO_GATE = -1
+
+
+def _column_bytes(values):
+    if hasattr(values, 'astype'):
+        # A numpy array
+        return values.astype('<i8').tobytes()
+
+    column = values if isinstance(values, array) else array('q', values)
+    if sys.byteorder == 'big':
+        column = array('q', column)
+        column.byteswap()
+    return column.tobytes()
+
+
+# Where the metadata starts
+_DATA_START = len(MAGIC) + HEADER.size + EXTENT.size
+
+
+def _encode_metadata(metadata, names):
+    meta = dict(metadata or {}, columns=names)
+    encoded = json.dumps(meta).encode('utf-8')
+    return encoded + b' ' * (-len(encoded) % 8)
+
+
+def write_session(fp, columns, metadata=None):
+    """
+    Write a session file.
+
+    Parameters
+    ----------
+    fp: file-like object
+        A file opened for writing in binary mode.
+    columns: dict
+        Maps each column's name to its values, which can be any sequence of
+        integers (e.g. a list, `array.array` or NumPy array). Every column
+        must be the same length.
+    metadata: dict
+        Anything else worth saving with the session, which must be JSON
+        serializable.
+    """
+    names = list(columns)
+    lengths = set(len(columns[name]) for name in names)
+    if len(lengths) > 1:
+        raise ValueError('Every column must be the same length')
+    count = lengths.pop() if lengths else 0
+
+    encoded = _encode_metadata(metadata, names)
+
+    fp.write(MAGIC)
+    fp.write(HEADER.pack(count, len(names), len(encoded)))
+    fp.write(EXTENT.pack(count, _DATA_START + len(encoded)))
+    fp.write(encoded)
+
+    for name in names:
+        fp.write(_column_bytes(columns[name]))
+
+
+class SessionFile:
+    """
+    A memory-mapped session file.
+
+    Columns are views straight onto the mapped file, so opening a session
+    costs the same no matter how many laps are in it, and only the pages
+    which are actually looked at get read from disk.
+
+    Parameters
+    ----------
+    filename: str
+        The session file to open.
+
+    Attributes
+    ----------
+    metadata: dict
+        Whatever metadata was saved with the session.
+    columns: dict
+        Maps each column's name to a NumPy array (or `memoryview` if NumPy
+        isn't installed) of its values.
+    """
+    def __init__(self, filename):
+        with open(filename, 'rb') as fp:
+            self._mmap = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic = self._mmap[:len(MAGIC)]
+        if magic not in (MAGIC, MAGIC_V1):
+            self._mmap.close()
+            raise ValueError('Not a laptime session file: {}'.format(filename))
+
+        count, num_columns, meta_length = HEADER.unpack_from(self._mmap,
+                                                              len(MAGIC))
+        offset = len(MAGIC) + HEADER.size
+        if magic == MAGIC:
+            capacity, data_offset = EXTENT.unpack_from(self._mmap, offset)
+            offset += EXTENT.size
+        else:
+            capacity, data_offset = count, offset + meta_length
+
+        self.metadata = json.loads(
+            self._mmap[offset:offset + meta_length].decode('utf-8'))
+
+        self.count = count
+        self.columns = {}
+
+        for name in self.metadata['columns']:
+            self.columns[name] = _view(self._mmap, data_offset, count)
+            data_offset += 8 * capacity
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def close(self):
+        """
+        Release the memory map. Any columns taken from the session must not
+        be used afterwards.
+        """
+        self.columns = {}
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Somebody is still holding on to a view, so the map will be
+            # released once they let it go
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _view(buffer, offset, count):
+    try:
+        import numpy as np
+    except ImportError:
+        view = memoryview(buffer)[offset:offset + 8*count]
+        if sys.byteorder == 'big':
+            raise ValueError('Reading without NumPy needs a little endian '
+                             'machine')
+        return view.cast('q')
+
+    return np.frombuffer(buffer, dtype='<i8', count=count, offset=offset)
+
+
+def read_session(filename):
+    """
+    Open a session file. See `SessionFile`.
+    """
+    return SessionFile(filename)
+
+
+class ColumnarSink(Sink):
+    """
+    Write laps straight into a session file as they arrive.
+
+    Room for `capacity` laps is set aside in each column, and every batch
+    of laps is written into place, with the lap count in the header brought
+    up to date each time the sink is flushed. Once the columns are full
+    they're copied to somewhere twice the size further along the file, and
+    the header is only pointed at the copy once it's complete. So however
+    the recorder dies, it leaves a session file with every lap up to the
+    last flush in it. Closing the sink packs the columns back together
+    where it can.
+
+    Parameters
+    ----------
+    fp: file-like object
+        A file opened for reading and writing in binary mode, e.g.
+        `open(filename, 'w+b')`.
+    gate: bool
+        Save which timing gate each lap came from.
+    metadata: dict
+        Extra metadata to save with the session.
+    capacity: int
+        How many laps to make room for to begin with.
+    """
+    def __init__(self, fp, gate=False, metadata=None, capacity=1024):
+        super().__init__()
+        self.fp = fp
+        self.names = COLUMNS + ['gate'] if gate else COLUMNS
+        encoded = _encode_metadata(metadata, self.names)
+
+        self.meta_length = len(encoded)
+        # Where the columns go once they're packed together
+        self.packed = _DATA_START + len(encoded)
+        self.count = 0
+        self.capacity = capacity
+        self.offset = self.packed
+
+        fp.write(MAGIC)
+        self._write_header()
+        fp.write(encoded)
+        fp.truncate(self.offset + 8 * len(self.names) * capacity)
+        fp.flush()
+
+    def _write_header(self):
+        self.fp.seek(len(MAGIC))
+        self.fp.write(HEADER.pack(self.count, len(self.names),
+                                  self.meta_length))
+        self.fp.write(EXTENT.pack(self.capacity, self.offset))
+
+    def _write(self, laps):
+        columns = {
+            'timestamp': [lap.timestamp for lap in laps],
+            'millis': [lap.millis for lap in laps],
+            'laptime': [lap.laptime for lap in laps],
+        }
+        if 'gate' in self.names:
+            columns['gate'] = [NO_GATE if lap.gate is None else lap.gate
+                               for lap in laps]
+
+        needed = self.count + len(laps)
+        if needed > self.capacity:
+            # After everything else, so the columns being copied are left
+            # alone until the header points at their new home
+            self._move(self.offset + 8 * len(self.names) * self.capacity,
+                       max(2 * self.capacity, needed))
+
+        fp = self.fp
+        for i, name in enumerate(self.names):
+            fp.seek(self.offset + 8 * (self.capacity * i + self.count))
+            fp.write(_column_bytes(columns[name]))
+
+        self.count = needed
+
+    def _move(self, offset, capacity):
+        # Copy the columns to `offset`, with room for `capacity` laps each
+        fp = self.fp
+        end = offset + 8 * len(self.names) * capacity
+        fp.seek(0, 2)
+        if fp.tell() < end:
+            fp.truncate(end)
+
+        for i in range(len(self.names)):
+            fp.seek(self.offset + 8 * self.capacity * i)
+            data = fp.read(8 * self.count)
+            fp.seek(offset + 8 * capacity * i)
+            fp.write(data)
+        fp.flush()
+
+        self.offset, self.capacity = offset, capacity
+        self._write_header()
+        fp.flush()
+
+    def _flush(self):
+        self._write_header()
+        self.fp.flush()
+
+    def close(self):
+        if self.fp.closed:
+            return
+
+        start = time.perf_counter()
+        self._flush()
+
+        # Pack the columns together if they can be copied there without
+        # overwriting themselves, then drop the room left at the end
+        size = 8 * len(self.names) * self.count
+        if self.offset != self.packed and self.packed + size <= self.offset:
+            self._move(self.packed, self.count)
+        self.fp.truncate(self.offset + 8 * (
+            self.capacity * (len(self.names) - 1) + self.count))
+        self.write_time += time.perf_counter() - start
+
+        super().close()
+        self.fp.close()
+
+
+def convert_csv(csv_filename, session_filename):
+    """
+    Convert a csv file written by `laptime.reader.record()` (old or new
+    style timestamps, with or without a "Gate" column) into a session file.
+
+    Returns
+    -------
+    int
+        The number of laps converted.
+    """
+    with open(csv_filename, newline='') as fp:
+        reader = csv.reader(fp)
+        header = next(reader)
+        has_gate = 'Gate' in header
+
+        names = COLUMNS + ['gate'] if has_gate else COLUMNS
+        columns = {name: array('q') for name in names}
+
+        for row in reader:
+            if not row:
+                continue
+            columns['timestamp'].append(parse_timestamp(row[0]))
+            columns['millis'].append(int(row[1]))
+            columns['laptime'].append(int(row[2]))
+            if has_gate:
+                columns['gate'].append(int(row[4]) if row[4] else NO_GATE)
+
+    with open(session_filename, 'wb') as fp:
+        write_session(fp, columns, {'source': csv_filename})
+
+    return len(columns['millis'])
+
+
+def main(argv=None):
+    """
+    Convert csv files to session files, e.g.::
+
+        $ python -m laptime.columnar track_times_2016-04-19_1216.csv
+    """
+    filenames = sys.argv[1:] if argv is None else argv
+
+    for filename in filenames:
+        base = filename[:-4] if filename.endswith('.csv') else filename
+        target = '{}.{}'.format(base, EXTENSION)
+        count = convert_csv(filename, target)
+        print('{} -> {} ({} laps)'.format(filename, target, count))
+
+
+if __name__ == '__main__':
+    main()
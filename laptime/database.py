@@ -0,0 +1,227 @@
+"""
+Record laps into a SQLite database, so they can be queried (e.g. by a
+dashboard) while a session is still being recorded.
+
+The schema is::
+
+    sessions(id, started, name)
+    laps(id, session, gate, car, timestamp, millis, laptime)
+
+where `started` and `timestamp` are nanoseconds since the epoch and `gate`
+and `car` are NULL when they aren't known (the car is set with the
+recorder's `--car` option). The laps table is indexed on session, car and
+laptime, so things like "the 10 best laps of this session", "the last 10
+laps of this session" or "car 7's best lap" never have to scan (or sort)
+the whole table.
+
+The database is put into WAL mode, which lets any number of readers query
+it without blocking (or being blocked by) the recorder.
+"""
+import sqlite3
+import time
+
+from .sink import Sink
+
+
+EXTENSION = 'db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    started INTEGER NOT NULL,
+    name TEXT
+);
+
+CREATE TABLE IF NOT EXISTS laps (
+    id INTEGER PRIMARY KEY,
+    session INTEGER NOT NULL REFERENCES sessions(id),
+    gate INTEGER,
+    car INTEGER,
+    timestamp INTEGER NOT NULL,
+    millis INTEGER NOT NULL,
+    laptime INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS laps_session ON laps(session, laptime);
+CREATE INDEX IF NOT EXISTS laps_session_id ON laps(session, id);
+CREATE INDEX IF NOT EXISTS laps_car ON laps(car, laptime);
+CREATE INDEX IF NOT EXISTS laps_laptime ON laps(laptime);
+"""
+
+INSERT_LAP = """
+INSERT INTO laps (session, gate, car, timestamp, millis, laptime)
+VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+def connect(filename, timeout=5.0):
+    """
+    Open (and if necessary create) a laps database.
+
+    Parameters
+    ----------
+    filename: str
+        The database file.
+    timeout: float
+        How long to wait for another connection's lock, in seconds.
+
+    Returns
+    -------
+    sqlite3.Connection
+        A connection in autocommit mode, i.e. transactions have to be
+        started explicitly with "BEGIN".
+    """
+    # The connection may be handed to a BackgroundWriter's thread, but it's
+    # only ever used by one thread at a time
+    db = sqlite3.connect(filename, timeout=timeout, isolation_level=None,
+                         check_same_thread=False)
+    db.execute('PRAGMA journal_mode=WAL')
+    # Safe in WAL mode, only the last few commits can be lost on power loss
+    db.execute('PRAGMA synchronous=NORMAL')
+    db.executescript(SCHEMA)
+    return db
+
+
+class SQLiteSink(Sink):
+    """
+    Insert laps into a SQLite database (see `connect()`), as a new session.
+
+    Laps are inserted in batches, with one transaction committed every
+    `batch_size` laps or once the oldest uncommitted lap is
+    `batch_interval` seconds old (checked whenever more laps are written),
+    rather than one transaction per lap. `flush()` always commits, so when
+    the sink is run by a `laptime.writer.BackgroundWriter` each of the
+    writer's batches ends up in a single transaction.
+
+    Parameters
+    ----------
+    filename: str
+        The database file.
+    gate: bool
+        Whether laps will come from more than one timing gate. Only here so
+        this has the same signature as the other sinks, the gate is always
+        saved.
+    car: int
+        The car being timed, if it's known.
+    name: str
+        A name for the session.
+    batch_size: int
+        The most laps inserted in one transaction.
+    batch_interval: float
+        The longest a lap may wait to be committed, in seconds.
+
+    Attributes
+    ----------
+    session: int
+        The id of this session in the sessions table.
+    """
+    def __init__(self, filename, gate=False, car=None, name=None,
+                 batch_size=256, batch_interval=0.5):
+        super().__init__()
+        self.db = connect(filename)
+        self.car = car
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+
+        self.pending = 0
+        self.deadline = None
+        self.transactions = 0
+
+        cursor = self.db.execute(
+            'INSERT INTO sessions (started, name) VALUES (?, ?)',
+            (time.time_ns(), name))
+        self.session = cursor.lastrowid
+
+    def _write(self, laps):
+        db = self.db
+        # Going by the connection rather than `pending`, so a transaction
+        # left open by a failed write (or commit) is carried on with
+        if not db.in_transaction:
+            db.execute('BEGIN')
+            self.deadline = time.monotonic() + self.batch_interval
+
+        rows = [(self.session, lap.gate, self.car, lap.timestamp, lap.millis,
+                 lap.laptime) for lap in laps]
+        if len(rows) == 1:
+            db.execute(INSERT_LAP, rows[0])
+        else:
+            # A batch which fails part way through is undone, without
+            # losing the laps already waiting to be committed
+            db.execute('SAVEPOINT batch')
+            try:
+                db.executemany(INSERT_LAP, rows)
+            except Exception:
+                db.execute('ROLLBACK TO batch')
+                raise
+            finally:
+                db.execute('RELEASE batch')
+        self.pending += len(laps)
+
+        if (self.pending >= self.batch_size
+                or time.monotonic() >= self.deadline):
+            self._flush()
+
+    def _flush(self):
+        if self.db.in_transaction:
+            self.db.execute('COMMIT')
+            self.pending = 0
+            self.deadline = None
+            self.transactions += 1
+
+    def close(self):
+        super().close()
+        self.db.close()
+
+    def stats(self):
+        stats = super().stats()
+        stats['transactions'] = self.transactions
+        return stats
+
+
+def best_laps(db, limit=10, session=None, car=None):
+    """
+    The fastest laps, optionally only those from one session and/or car.
+
+    Returns
+    -------
+    list
+        `(session, gate, car, timestamp, millis, laptime)` tuples, fastest
+        first.
+    """
+    query = 'SELECT session, gate, car, timestamp, millis, laptime FROM laps'
+    conditions, parameters = [], []
+
+    if session is not None:
+        conditions.append('session = ?')
+        parameters.append(session)
+    if car is not None:
+        conditions.append('car = ?')
+        parameters.append(car)
+
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY laptime LIMIT ?'
+
+    return db.execute(query, parameters + [limit]).fetchall()
+
+
+def last_laps(db, limit=10, session=None):
+    """
+    The most recently recorded laps, optionally only those from one
+    session.
+
+    Returns
+    -------
+    list
+        `(session, gate, car, timestamp, millis, laptime)` tuples, newest
+        first.
+    """
+    query = 'SELECT session, gate, car, timestamp, millis, laptime FROM laps'
+    parameters = []
+
+    if session is not None:
+        query += ' WHERE session = ?'
+        parameters.append(session)
+    query += ' ORDER BY id DESC LIMIT ?'
+
+    return db.execute(query, parameters + [limit]).fetchall()
@@ -0,0 +1,244 @@
+"""
+Helpers for turning the raw byte stream coming off a serial port into
+individual messages.
+
+Two wire formats are supported:
+
+* ASCII, where the arduino prints each millis reading as a decimal number
+  followed by a newline (see `LineFramer`)
+* A compact fixed-width binary frame (see `BinaryFramer`)
+"""
+import abc
+from binascii import crc_hqx
+from collections import namedtuple
+import struct
+
+
+class _Framer(abc.ABC):
+    """
+    The parts common to every framer, mainly reading from a stream into a
+    preallocated buffer. Subclasses split the bytes into messages in
+    `_frame()`.
+    """
+    def __init__(self, buffer_size):
+        self.buffer = bytearray(buffer_size)
+        self.pending = bytearray()
+        self.discarded = 0
+        self.received = 0
+
+    def feed(self, data):
+        """
+        Add some bytes to the framer.
+
+        Parameters
+        ----------
+        data: bytes or bytearray
+            The bytes which were just received.
+
+        Returns
+        -------
+        list
+            Every message completed by `data`.
+        """
+        self.received += len(data)
+        return self._frame(data, len(data))
+
+    @abc.abstractmethod
+    def _frame(self, data, end):
+        """
+        Add the first `end` bytes of `data` to whatever was left over last
+        time, and return every message that completes.
+        """
+
+    def read_from(self, stream):
+        """
+        Do a single read from `stream` and frame whatever came back.
+
+        Parameters
+        ----------
+        stream: file-like object
+            Anything with a `readinto()` method (e.g. `serial.Serial`) or,
+            failing that, a `read()` method.
+
+        Returns
+        -------
+        list
+            Every message completed by this read (possibly empty).
+        """
+        readinto = getattr(stream, 'readinto', None)
+
+        if readinto is not None:
+            num_bytes = readinto(self.buffer)
+            if not num_bytes:
+                return []
+            self.received += num_bytes
+            return self._frame(self.buffer, num_bytes)
+        else:
+            data = stream.read(len(self.buffer))
+            if not data:
+                return []
+            return self.feed(data)
+
+    def reset(self):
+        """
+        Throw away any partially received message.
+        """
+        self.pending = bytearray()
+
+
+class LineFramer(_Framer):
+    """
+    Incrementally split a stream of bytes into newline-delimited messages.
+
+    Bytes are read into a preallocated buffer (using `readinto()` when the
+    stream supports it) and split on the delimiter in bulk, so the cost per
+    read is a couple of C-level calls instead of a Python operation per
+    byte. Every complete line in a chunk is returned, and any trailing
+    partial line is kept until the rest of it arrives.
+
+    Parameters
+    ----------
+    buffer_size: int
+        The size of the receive buffer, i.e. the most bytes taken from the
+        stream in a single read.
+    delimiter: bytes
+        The byte sequence which terminates each message.
+    max_line_length: int
+        If a partial line grows past this many bytes without seeing a
+        delimiter it is assumed to be line noise and thrown away.
+    """
+    def __init__(self, buffer_size=4096, delimiter=b'\n',
+                 max_line_length=1024):
+        super().__init__(buffer_size)
+        self.delimiter = delimiter
+        self.max_line_length = max_line_length
+
+    def _frame(self, data, end):
+        # Only the newly received bytes need to be searched, anything in
+        # `pending` is already known not to contain a delimiter
+        if data.find(self.delimiter, 0, end) < 0:
+            self.pending += memoryview(data)[:end]
+            if len(self.pending) > self.max_line_length:
+                self.discarded += len(self.pending)
+                self.pending = bytearray()
+            return []
+
+        lines = bytes(memoryview(data)[:end]).split(self.delimiter)
+        if self.pending:
+            lines[0] = bytes(self.pending) + lines[0]
+
+        self.pending = bytearray(lines.pop())
+        return lines
+
+
+SYNC = 0xA5
+
+# sync byte, gate id, millis, sequence number, CRC-16 (all little endian)
+FRAME = struct.Struct('<BBIHH')
+
+# The CRC covers the gate id, millis and sequence number
+_CRC_START = 1
+_CRC_END = FRAME.size - 2
+
+
+class Frame(namedtuple('Frame', ['gate', 'millis', 'sequence'])):
+    """
+    A single decoded binary frame.
+
+    Attributes
+    ----------
+    gate: int
+        The id of the timing gate which sent the frame.
+    millis: int
+        The gate's millis() reading.
+    sequence: int
+        A counter which the gate increments (mod 2**16) for every frame, so
+        dropped frames can be noticed.
+    """
+    __slots__ = ()
+
+
+def encode_frame(gate, millis, sequence):
+    """
+    Pack a single binary frame, exactly as the arduino would send it.
+    """
+    body = struct.pack('<BIH', gate, millis, sequence)
+    return bytes([SYNC]) + body + struct.pack('<H', crc_hqx(body, 0))
+
+
+class BinaryFramer(_Framer):
+    """
+    Decode the compact binary wire format.
+
+    Each frame is 10 bytes::
+
+        offset  size  field
+        0       1     sync byte (0xA5)
+        1       1     gate id
+        2       4     millis (uint32, little endian)
+        6       2     sequence number (uint16, little endian)
+        8       2     CRC-16/XMODEM of bytes 1-7 (uint16, little endian)
+
+    Runs of whole frames are decoded in bulk with `struct.iter_unpack()`.
+    If a frame has a bad sync byte or CRC it is skipped and the framer
+    resynchronises on the next sync byte, counting the bad frames in
+    `errors` and the bytes thrown away in `discarded`. Gaps in each gate's
+    sequence numbers are counted in `missed`.
+
+    Parameters
+    ----------
+    buffer_size: int
+        The size of the receive buffer, i.e. the most bytes taken from the
+        stream in a single read.
+    """
+    def __init__(self, buffer_size=4096):
+        super().__init__(buffer_size)
+        self.errors = 0
+        self.missed = 0
+        self.sequences = {}
+
+    def _frame(self, data, end):
+        buf = self.pending + memoryview(data)[:end]
+        view = memoryview(buf)
+        size = FRAME.size
+        sequences = self.sequences
+        frames = []
+        pos = 0
+
+        while True:
+            if pos < len(buf) and buf[pos] != SYNC:
+                next_sync = buf.find(SYNC, pos)
+                if next_sync < 0:
+                    next_sync = len(buf)
+                self.discarded += next_sync - pos
+                pos = next_sync
+
+            count = (len(buf) - pos) // size
+            if count == 0:
+                break
+
+            stop = pos + count*size
+            start = pos
+            for sync, gate, millis, seq, crc in FRAME.iter_unpack(
+                    view[pos:stop]):
+                if (sync != SYNC or crc != crc_hqx(
+                        view[start + _CRC_START:start + _CRC_END], 0)):
+                    # Corrupted, skip the sync byte and look for another one
+                    self.errors += 1
+                    self.discarded += 1
+                    pos = start + 1
+                    break
+
+                previous = sequences.get(gate)
+                if previous is not None and seq != (previous + 1) & 0xFFFF:
+                    self.missed += (seq - previous - 1) & 0xFFFF
+                sequences[gate] = seq
+
+                frames.append(Frame(gate, millis, seq))
+                start += size
+            else:
+                pos = stop
+
+        view.release()
+        self.pending = buf[pos:]
+        return frames
@@ -0,0 +1,252 @@
+"""
+A sparse "seek index" kept alongside a csv session file, so a particular
+lap (or the laps from a particular time range) can be found without
+reading the whole file.
+
+The index lives in a sidecar file with the same name plus ".idx", which
+starts with the 8 byte magic string `MAGIC` and then holds one entry for
+every `every`-th lap::
+
+    offset  size  field
+    0       8     lap number, counting from 0 (uint64)
+    8       8     the lap's timestamp, nanoseconds since the epoch (int64)
+    16      8     where the lap's row starts in the csv file (uint64)
+
+All integers are little endian. Like capture files, entries are only ever
+appended, so an index written by a recorder which crashed is still good
+for every lap it covers.
+
+An index can be (re)built for any csv file with `build_index()`, or from
+the command line::
+
+    $ python -m laptime.index track_times_2016-04-19_1216.csv
+"""
+from array import array
+from bisect import bisect_right
+import csv
+import struct
+import sys
+
+from .laps import Lap, parse_timestamp
+
+
+MAGIC = b'LAPIDX\x00\x01'
+ENTRY = struct.Struct('<QqQ')
+SUFFIX = '.idx'
+
+# The default number of laps between index entries
+EVERY = 1000
+
+
+def index_filename(csv_filename):
+    return csv_filename + SUFFIX
+
+
+class IndexWriter:
+    """
+    Append entries to an index file.
+
+    Parameters
+    ----------
+    fp: file-like object
+        The index file, opened for writing in binary mode.
+    every: int
+        How many laps apart entries should be.
+    """
+    def __init__(self, fp, every=EVERY):
+        self.fp = fp
+        self.every = every
+        self.fp.write(MAGIC)
+
+    def wants(self, lap_number):
+        """
+        Should the lap with this number get an entry?
+        """
+        return lap_number % self.every == 0
+
+    def add(self, lap_number, timestamp, offset):
+        self.fp.write(ENTRY.pack(lap_number, timestamp, offset))
+
+    def flush(self):
+        self.fp.flush()
+
+    def close(self):
+        self.fp.close()
+
+
+def build_index(csv_filename, every=EVERY):
+    """
+    Scan a csv file written by `laptime.reader.record()` (old or new style)
+    and write a fresh index for it.
+
+    Returns
+    -------
+    int
+        The number of laps in the file.
+    """
+    count = 0
+
+    with open(csv_filename, 'rb') as fp, \
+            open(index_filename(csv_filename), 'wb') as index_fp:
+        index = IndexWriter(index_fp, every)
+        fp.readline()
+        offset = fp.tell()
+
+        for line in fp:
+            if line.strip():
+                if index.wants(count):
+                    timestamp = line.split(b',', 1)[0].decode('utf-8')
+                    index.add(count, parse_timestamp(timestamp), offset)
+                count += 1
+            offset += len(line)
+
+    return count
+
+
+class SeekIndex:
+    """
+    The entries of an index file, for looking up where to start reading a
+    csv file.
+
+    Parameters
+    ----------
+    csv_filename: str
+        The csv file whose index should be loaded.
+
+    Attributes
+    ----------
+    laps, timestamps, offsets: array.array
+        The lap number, timestamp and byte offset of each entry.
+    """
+    def __init__(self, csv_filename):
+        self.csv_filename = csv_filename
+        self.laps = array('q')
+        self.timestamps = array('q')
+        self.offsets = array('q')
+
+        with open(index_filename(csv_filename), 'rb') as fp:
+            if fp.read(len(MAGIC)) != MAGIC:
+                raise ValueError('Not a laptime index file')
+            data = fp.read()
+
+        # Ignore a partly written final entry
+        end = len(data) - len(data) % ENTRY.size
+        for lap, timestamp, offset in ENTRY.iter_unpack(data[:end]):
+            self.laps.append(lap)
+            self.timestamps.append(timestamp)
+            self.offsets.append(offset)
+
+    def __len__(self):
+        return len(self.laps)
+
+    def _entry(self, i):
+        if i < 0:
+            # Before the first entry, so start from the first row
+            return 0, None
+        return self.laps[i], self.offsets[i]
+
+    def find_lap(self, lap_number):
+        """
+        The closest entry at or before a lap.
+
+        Returns
+        -------
+        tuple
+            `(lap_number, offset)` of the entry, or `(0, None)` if the lap
+            comes before every entry (i.e. read from the start of the file).
+        """
+        return self._entry(bisect_right(self.laps, lap_number) - 1)
+
+    def find_time(self, timestamp):
+        """
+        The last entry stamped before a time.
+
+        Returns
+        -------
+        tuple
+            `(lap_number, offset)` of the entry, or `(0, None)` if every
+            entry is at or after that time.
+        """
+        # bisect_right(...) - 1 could land on an entry stamped at exactly
+        # `timestamp`, while an earlier lap (between the entries) has the
+        # same timestamp, so step back one more
+        i = bisect_right(self.timestamps, timestamp - 1) - 1
+        return self._entry(i)
+
+
+def _rows(csv_filename, offset):
+    # Read rows from a byte offset, or from just after the header
+    with open(csv_filename, 'rb') as fp:
+        if offset is None:
+            fp.readline()
+        else:
+            fp.seek(offset)
+
+        lines = (line.decode('utf-8') for line in fp if line.strip())
+        for row in csv.reader(lines):
+            yield Lap.from_row(row)
+
+
+def read_laps(csv_filename, start=0, stop=None, index=None):
+    """
+    Read laps `start` up to (but not including) `stop` from a csv file,
+    counting from 0, seeking straight to them using the file's index.
+
+    Parameters
+    ----------
+    csv_filename: str
+        The csv file to read.
+    start, stop: int
+        Which laps to read. `stop` defaults to the end of the file.
+    index: SeekIndex
+        The file's index, if it's already been loaded.
+
+    Yields
+    ------
+    laptime.laps.Lap
+    """
+    index = index or SeekIndex(csv_filename)
+    lap_number, offset = index.find_lap(start)
+
+    for lap in _rows(csv_filename, offset):
+        if stop is not None and lap_number >= stop:
+            return
+        if lap_number >= start:
+            yield lap
+        lap_number += 1
+
+
+def read_between(csv_filename, start, end, index=None):
+    """
+    Read the laps recorded at or after `start` but before `end` (both in
+    nanoseconds since the epoch) from a csv file, seeking straight to them
+    using the file's index.
+
+    Yields
+    ------
+    laptime.laps.Lap
+    """
+    index = index or SeekIndex(csv_filename)
+    _, offset = index.find_time(start)
+
+    for lap in _rows(csv_filename, offset):
+        if lap.timestamp >= end:
+            return
+        if lap.timestamp >= start:
+            yield lap
+
+
+def main(argv=None):
+    """
+    Rebuild the index for each csv file named on the command line.
+    """
+    filenames = sys.argv[1:] if argv is None else argv
+
+    for filename in filenames:
+        count = build_index(filename)
+        print('{} -> {} ({} laps)'.format(filename, index_filename(filename),
+                                          count))
+
+
+if __name__ == '__main__':
+    main()
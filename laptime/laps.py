@@ -0,0 +1,164 @@
+"""
+The laps themselves, and the logic for turning the millis readings sent by
+a timing gate into laps.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from .misc import human_readable
+from .clock import SessionClock, format_timestamp
+
+
+HEADER = ['Timestamp', 'Millis', 'Laptime', 'Human Readable']
+
+# Used whenever laps from more than one timing gate end up in the same file
+MULTI_HEADER = HEADER + ['Gate']
+
+
+class Lap(namedtuple('Lap', ['timestamp', 'millis', 'laptime', 'gate'])):
+    """
+    A single lap, as timed by the arduino.
+
+    Attributes
+    ----------
+    timestamp: int
+        When the lap was received, in nanoseconds since the epoch (see
+        `laptime.clock.SessionClock`).
+    millis: int
+        The arduino's millis() reading at the end of the lap.
+    laptime: int
+        How long the lap took, in milliseconds.
+    gate: int
+        Which timing gate the lap came from (None when only one gate is
+        being recorded).
+    """
+    __slots__ = ()
+
+    def row(self):
+        """
+        The lap as a row of the csv output (see `HEADER`).
+        """
+        return [self.timestamp, self.millis, self.laptime,
+                human_readable(self.laptime)]
+
+    def summary(self):
+        """
+        A short human-friendly description of the lap, as printed in
+        verbose mode.
+        """
+        row = self.row()
+        row[0] = format_timestamp(self.timestamp)
+        if self.gate is not None:
+            row.append('gate {}'.format(self.gate))
+        return ', '.join(str(cell) for cell in row)
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Turn a row of the csv output (with or without a "Gate" column) back
+        into a lap.
+        """
+        gate = int(row[4]) if len(row) > 4 and row[4] else None
+        return cls(parse_timestamp(row[0]), int(row[1]), int(row[2]), gate)
+
+
+def parse_timestamp(text):
+    """
+    Parse the timestamp column of the csv output, in nanoseconds since the
+    epoch.
+
+    Files recorded before timestamps were integers have a `str(datetime)`
+    instead, which is converted (as local time).
+    """
+    try:
+        return int(text)
+    except ValueError:
+        moment = datetime.fromisoformat(text)
+        return int(moment.timestamp()) * 10**9 + moment.microsecond * 1000
+
+
+class LapTimer:
+    """
+    Turn the stream of millis readings sent by the arduino into laps by
+    keeping track of the previous reading.
+
+    Parameters
+    ----------
+    gate: int
+        The timing gate these readings come from, if there's more than one.
+    clock: laptime.clock.SessionClock
+        Used to timestamp each lap (default: a new one).
+    """
+    def __init__(self, gate=None, clock=None):
+        self.previous_entry = 0
+        self.gate = gate
+        self.clock = clock or SessionClock()
+
+    def lap(self, message, timestamp=None):
+        """
+        Parse a single message from the arduino.
+
+        Parameters
+        ----------
+        message: bytes
+            A millis reading, as sent over the serial port.
+        timestamp: int
+            When the message was received, in nanoseconds since the epoch
+            (default: now, according to the timer's clock).
+
+        Returns
+        -------
+        Lap
+            The completed lap, or None if the arduino sent a 0 to tell us to
+            stop recording.
+
+        Raises
+        ------
+        ValueError
+            If the message isn't an integer.
+        """
+        entry = int(message)
+
+        # Let us stop recording when we want (useful for testing)
+        if entry == 0:
+            return None
+
+        duration = entry - self.previous_entry
+        self.previous_entry = entry
+        if timestamp is None:
+            timestamp = self.clock.now()
+
+        return Lap(timestamp, entry, duration, self.gate)
+
+
+class GateLapTimers:
+    """
+    Keep a separate `LapTimer` for every gate, for when binary frames from
+    several timing gates arrive over the same serial connection.
+
+    Parameters
+    ----------
+    clock: laptime.clock.SessionClock
+        Shared by every gate's timer (default: a new one).
+    """
+    def __init__(self, clock=None):
+        self.timers = {}
+        self.clock = clock or SessionClock()
+
+    def lap(self, frame, timestamp=None):
+        """
+        Turn a `laptime.framing.Frame` into a `Lap`, using the timer for
+        the gate it came from.
+
+        Returns
+        -------
+        Lap
+            The completed lap, or None if the gate sent a 0 to tell us to
+            stop recording.
+        """
+        timer = self.timers.get(frame.gate)
+        if timer is None:
+            timer = self.timers[frame.gate] = LapTimer(gate=frame.gate,
+                                                       clock=self.clock)
+
+        return timer.lap(frame.millis, timestamp)
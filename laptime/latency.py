@@ -0,0 +1,346 @@
+"""
+Where the time goes between a beam being broken and its lap being safely
+on disk.
+
+Every lap passes through the same stages while it's being recorded:
+
+* framed: its bytes have arrived and been split into a message
+* parsed: the message has been turned into a `laptime.laps.Lap`
+* written: a sink has written the lap (e.g. to a file's buffer)
+* flushed: the sink has pushed it out to its destination
+
+`PipelineStats` keeps a latency histogram for each stage (how long it took
+since the stage before), plus a few counters. `laptime.reader.record()`
+and `laptime.multi.record_many()` fill them in as they go.
+
+Reading the clock and updating a histogram for every single lap would cost
+about as much as recording it, so only every `sample_every`th lap is timed
+(and counted `sample_every` times over). The counters are exact, although
+the text reader only brings them up to date every `sample_every` laps,
+whenever it runs out of waiting data, or once they're `max_delay` behind
+by the time it next checks what's waiting.
+"""
+from collections import OrderedDict
+import time
+
+
+class Histogram:
+    """
+    An HDR-style histogram of (non-negative integer) latencies, in
+    nanoseconds.
+
+    Each value is counted in a bucket which keeps its `significant_bits`
+    highest bits, so every bucket is within 1% (at the default of 7 bits)
+    of the values in it whether they're microseconds or minutes. Working
+    out the bucket is just a couple of shifts, so counting a value is about
+    as cheap as updating a dict.
+
+    Parameters
+    ----------
+    significant_bits: int
+        How precisely values are kept.
+    """
+    def __init__(self, significant_bits=7):
+        self.significant_bits = significant_bits
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+
+    def record(self, value, count=1):
+        """
+        Count a value (`count` times).
+        """
+        if not count:
+            return
+        if value < 0:
+            value = 0
+        self.total += value * count
+        self.count += count
+
+        shift = value.bit_length() - self.significant_bits
+        if shift > 0:
+            value = value >> shift << shift
+
+        counts = self.counts
+        counts[value] = counts.get(value, 0) + count
+
+    def merge(self, other):
+        """
+        Add everything counted by another histogram to this one.
+        """
+        for value, count in other.counts.copy().items():
+            self.counts[value] = self.counts.get(value, 0) + count
+        self.count += other.count
+        self.total += other.total
+
+    def _width(self, bucket):
+        return 1 << max(bucket.bit_length() - self.significant_bits, 0)
+
+    def quantile(self, q):
+        """
+        Estimate the value below which a fraction `q` of the values fall,
+        e.g. 0.99 for the 99th percentile. Returns None when the histogram
+        is empty.
+        """
+        counts = self.counts.copy()
+        total = sum(counts.values())
+        if not total:
+            return None
+
+        rank = q * (total - 1)
+        seen = 0
+        for bucket in sorted(counts):
+            seen += counts[bucket]
+            if rank < seen:
+                break
+
+        return bucket + self._width(bucket) // 2
+
+    def summary(self):
+        """
+        The count, mean, minimum, maximum and a few percentiles, in
+        nanoseconds (None for an empty histogram).
+        """
+        counts = self.counts.copy()
+        count = self.count
+        buckets = sorted(counts)
+
+        return OrderedDict([
+            ('count', count),
+            ('mean', self.total // count if count else None),
+            ('min', buckets[0] if buckets else None),
+            ('p50', self.quantile(0.5)),
+            ('p90', self.quantile(0.9)),
+            ('p99', self.quantile(0.99)),
+            ('p999', self.quantile(0.999)),
+            ('max', buckets[-1] + self._width(buckets[-1]) - 1
+                    if buckets else None),
+        ])
+
+    def __len__(self):
+        return self.count
+
+
+class SinkLatency:
+    """
+    How long a sink takes to write and flush laps, from the moment each lap
+    was parsed. Attached to a sink by `PipelineStats.watch()`.
+
+    Attributes
+    ----------
+    written: Histogram
+        From being parsed to being written.
+    flushed: Histogram
+        From being written to being flushed.
+    """
+    # The most sampled writes remembered between flushes, anything after
+    # that is lumped in with the last one
+    MAX_UNFLUSHED = 1024
+
+    def __init__(self, clock, sample_every=16):
+        self.clock = clock
+        self.sample_every = sample_every
+        self.written = Histogram()
+        self.flushed = Histogram()
+        self.flushes = 0
+        # How many laps until the next sampled one (counted down by the
+        # sink, which only calls on_write() once it reaches 0)
+        self.countdown = 1
+        # (when, weight) for each sampled lap written since the last flush
+        self._unflushed = []
+
+    def on_write(self, laps):
+        """
+        Called once a batch of laps with a sampled lap in it has been
+        written (with `countdown` already reduced by the size of the batch).
+        """
+        first = self.countdown + len(laps) - 1
+        now = self.clock.now()
+        every = self.sample_every
+        sampled = laps[first::every]
+        for lap in sampled:
+            self.written.record(now - lap.timestamp, every)
+
+        self.countdown = first + len(sampled) * every - len(laps) + 1
+
+        unflushed = self._unflushed
+        if len(unflushed) < self.MAX_UNFLUSHED:
+            unflushed.append((now, len(sampled) * every))
+        else:
+            when, weight = unflushed[-1]
+            unflushed[-1] = (when, weight + len(sampled) * every)
+
+    def on_flush(self):
+        """
+        Called after each flush.
+        """
+        self.flushes += 1
+        if not self._unflushed:
+            return
+
+        now = self.clock.now()
+        unflushed, self._unflushed = self._unflushed, []
+        for when, weight in unflushed:
+            self.flushed.record(now - when, weight)
+
+
+class PipelineStats:
+    """
+    Latency histograms and throughput counters for a recording session.
+
+    This is cheap enough to leave on all the time: laps are only timed now
+    and then (see `sample_every`), and the sinks' histograms are updated
+    from whichever thread writes to them, away from the serial port.
+    Anything can be read at any time, from any thread.
+
+    Parameters
+    ----------
+    sample_every: int
+        How often a lap is timed, e.g. 16 for one lap in every 16.
+    max_delay: float
+        The longest the counters may fall behind, in seconds.
+
+    Attributes
+    ----------
+    framed: Histogram
+        From bytes arriving to them being split into messages. The text
+        reader times its `readline()` calls, but only for lines which had
+        started to arrive, so this can count fewer laps than `parsed`.
+    parsed: Histogram
+        From a message being framed to its lap being made.
+    sinks: dict
+        The `SinkLatency` for each sink being watched, by name.
+    laps: int
+        How many laps have been parsed.
+    reads: int
+        How many reads returned data.
+    bytes_read: int
+        How many bytes they returned.
+    parse_errors: int
+        How many lines couldn't be parsed (binary frames with a bad CRC are
+        counted by their framer instead, see `framers`).
+    last_event: int
+        When the latest lap arrived, according to the session's clock.
+    queues: dict
+        The `laptime.writer.BackgroundWriter` feeding each sink, by name.
+    framers: list
+        Every `laptime.framing.BinaryFramer` in use.
+    """
+    def __init__(self, sample_every=16, max_delay=0.05):
+        self.sample_every = sample_every
+        # In the clock's nanoseconds
+        self.max_delay = int(max_delay * 1e9)
+        self.laps = 0
+        self.framed = Histogram()
+        self.parsed = Histogram()
+        self.sinks = OrderedDict()
+        self.queues = OrderedDict()
+        self.framers = []
+        self.reads = 0
+        self.bytes_read = 0
+        self.parse_errors = 0
+        self.last_event = None
+        self.clock = None
+        self.started = None
+
+    def start(self, clock):
+        """
+        Start the session's clock, with the clock its laps are stamped by.
+        """
+        self.clock = clock
+        self.started = time.monotonic()
+
+    def watch(self, sink, name=None, writer=None):
+        """
+        Measure how long a sink takes to write and flush laps (and keep an
+        eye on the `writer` queueing laps for it, if there is one). Each of
+        a `laptime.sinks.Tee`'s sinks is watched separately.
+        """
+        if hasattr(sink, 'sinks'):
+            for inner, inner_writer in zip(sink.sinks, sink.writers):
+                self.watch(inner, writer=inner_writer)
+            return
+
+        name = name or type(sink).__name__
+        unique, number = name, 1
+        while unique in self.sinks:
+            number += 1
+            unique = '{}_{}'.format(name, number)
+
+        sink.latency = self.sinks[unique] = SinkLatency(self.clock,
+                                                        self.sample_every)
+        if writer is not None:
+            self.queues[unique] = writer
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return time.monotonic() - self.started
+
+    def last_event_age(self):
+        """
+        How many seconds ago the latest lap arrived (None if none have).
+        """
+        if self.last_event is None:
+            return None
+        return max(self.clock.now() - self.last_event, 0) / 1e9
+
+    def stats(self):
+        """
+        Everything measured so far. Latencies are in nanoseconds.
+        """
+        elapsed = self.elapsed()
+        laps = self.laps
+        framers = list(self.framers)
+
+        stats = OrderedDict([
+            ('elapsed', elapsed),
+            ('laps', laps),
+            ('reads', self.reads),
+            ('bytes_read', self.bytes_read),
+            ('laps_per_sec', laps / elapsed if elapsed else 0.0),
+            ('parse_errors', self.parse_errors +
+                             sum(framer.errors for framer in framers)),
+            ('missed', sum(framer.missed for framer in framers)),
+            ('last_event_age', self.last_event_age()),
+            ('framed', self.framed.summary()),
+            ('parsed', self.parsed.summary()),
+            ('sinks', OrderedDict()),
+        ])
+
+        for name, latency in self.sinks.items():
+            stats['sinks'][name] = OrderedDict([
+                ('flushes', latency.flushes),
+                ('written', latency.written.summary()),
+                ('flushed', latency.flushed.summary()),
+            ])
+            writer = self.queues.get(name)
+            if writer is not None:
+                stats['sinks'][name]['queue'] = writer.stats()
+
+        return stats
+
+    def report(self, fp):
+        """
+        Write a table of the latencies, for a human to read.
+        """
+        stats = self.stats()
+        print('{laps} laps in {elapsed:.1f}s ({laps_per_sec:.1f}/s), '
+              '{bytes_read} bytes in {reads} reads'.format(**stats), file=fp)
+
+        columns = ['count', 'mean', 'p50', 'p90', 'p99', 'p999', 'max']
+        print('{:<24}'.format('latency (us)') + ''.join(
+              '{:>10}'.format(column) for column in columns), file=fp)
+
+        rows = [('framed', stats['framed']), ('parsed', stats['parsed'])]
+        for name, sink in stats['sinks'].items():
+            rows.append((name + ' written', sink['written']))
+            rows.append((name + ' flushed', sink['flushed']))
+
+        for name, summary in rows:
+            cells = ['{:>10}'.format(summary['count'])]
+            for column in columns[1:]:
+                value = summary[column]
+                cells.append('{:>10}'.format('-') if value is None
+                             else '{:>10.1f}'.format(value / 1000))
+            print('{:<24}'.format(name) + ''.join(cells), file=fp)
@@ -0,0 +1,134 @@
+"""
+A live leaderboard of each car's best lap.
+"""
+from bisect import bisect_left, insort
+from collections import namedtuple
+from operator import attrgetter
+
+from .sink import Sink
+
+
+Standing = namedtuple('Standing', ['position', 'car', 'best', 'gap'])
+
+
+class Leaderboard(Sink):
+    """
+    Rank cars by their best lap as laps come in.
+
+    Each car's best lap is kept in a dict, and the cars are kept in a list
+    sorted by best lap. Most laps aren't a personal best, and those only
+    cost a dict lookup. A personal best moves the car in the sorted list
+    (a binary search plus a single `memmove`, which is much quicker than a
+    Python heap or tree for the few thousand cars on a track). That way
+    the top K can be read straight off the front of the list without
+    sorting anything.
+
+    Cars which set the same best lap are ranked by who set it first.
+
+    Being a `laptime.sinks.Sink`, a leaderboard can be fed laps by
+    `record()` or a `laptime.sinks.Tee`.
+
+    Parameters
+    ----------
+    key: callable
+        Picks out which car a `laptime.laps.Lap` belongs to (default: the
+        timing gate or transponder it came from, `lap.gate`).
+    """
+    def __init__(self, key=attrgetter('gate')):
+        super().__init__()
+        self.key = key
+        self.bests = {}
+        self.laps = {}
+        # (best, sequence, car), kept sorted
+        self._ranking = []
+        self._entries = {}
+        self._sequence = 0
+
+    def _write(self, laps):
+        key = self.key
+        for lap in laps:
+            self.update(key(lap), lap.laptime)
+
+    def update(self, car, laptime):
+        """
+        Record a lap for a car.
+
+        Returns
+        -------
+        bool
+            Whether it was the car's best lap so far.
+        """
+        self.laps[car] = self.laps.get(car, 0) + 1
+
+        best = self.bests.get(car)
+        if best is not None and laptime >= best:
+            return False
+
+        ranking = self._ranking
+        if best is not None:
+            old = self._entries[car]
+            del ranking[bisect_left(ranking, old)]
+
+        self._sequence += 1
+        entry = (laptime, self._sequence, car)
+        insort(ranking, entry)
+        self._entries[car] = entry
+        self.bests[car] = laptime
+
+        return True
+
+    def __len__(self):
+        return len(self._ranking)
+
+    def __contains__(self, car):
+        return car in self.bests
+
+    def leader(self):
+        """
+        The car with the best lap, or None if nobody has set one.
+        """
+        if not self._ranking:
+            return None
+        return self._ranking[0][2]
+
+    def top(self, k=10):
+        """
+        The `k` cars with the best laps, fastest first.
+
+        Returns
+        -------
+        list of Standing
+            Each car's position (from 1), best lap and gap to the leader,
+            in milliseconds.
+        """
+        ranking = self._ranking[:k]
+        if not ranking:
+            return []
+
+        fastest = ranking[0][0]
+        return [Standing(i + 1, car, best, best - fastest)
+                for i, (best, _, car) in enumerate(ranking)]
+
+    def position(self, car):
+        """
+        Where a car is on the leaderboard, counting from 1.
+
+        Raises
+        ------
+        KeyError
+            If the car hasn't set a lap.
+        """
+        return bisect_left(self._ranking, self._entries[car]) + 1
+
+    def gap(self, car):
+        """
+        How far behind the leader a car's best lap is, in milliseconds.
+        """
+        return self.bests[car] - self._ranking[0][0]
+
+    def standing(self, car):
+        """
+        A car's `Standing`.
+        """
+        return Standing(self.position(car), car, self.bests[car],
+                        self.gap(car))
@@ -0,0 +1,242 @@
+"""
+Load whole recorded sessions into memory as quickly as possible, for
+analysis.
+
+Sessions are loaded as columns (a dict mapping "timestamp", "millis",
+"laptime" and, where there is one, "gate" to arrays of integers), the same
+as `laptime.columnar` stores them. With NumPy installed the columns are
+NumPy arrays and csv files are parsed a column at a time instead of a row
+at a time, otherwise they're `array.array`s (or `memoryview`s for session
+files).
+"""
+from array import array
+import csv
+import io
+import mmap
+import os
+
+from .laps import parse_timestamp
+
+
+COLUMNS = ['timestamp', 'millis', 'laptime', 'gate']
+
+# Stored in the gate column for laps which didn't come from a specific gate
+NO_GATE = -1
+
+# The longest number which can be parsed, int64 has 19 digits
+MAX_DIGITS = 19
+INT64_MAX = 2**63 - 1
+
+_COMMA, _NEWLINE, _ZERO = ord(','), ord('\n'), ord('0')
+
+
+def load(path):
+    """
+    Load a recorded session.
+
+    Parameters
+    ----------
+    path: str
+        A csv file written by `laptime.reader.record()` (optionally gzip or
+        zstd compressed), or a `laptime.columnar` session file.
+
+    Returns
+    -------
+    dict
+        Maps each column's name to its values.
+    """
+    if path.endswith('.laps'):
+        from .columnar import read_session
+
+        # The columns are views onto the file, which stays mapped until
+        # they've all gone
+        with read_session(path) as session:
+            return session.columns
+
+    from .rotation import COMPRESSION, read_partial
+
+    if any(path.endswith('.' + suffix) for suffix in COMPRESSION.values()):
+        return parse_csv(read_partial(path))
+
+    if os.path.getsize(path) == 0:
+        return parse_csv(b'')
+
+    with open(path, 'rb') as fp:
+        data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    try:
+        return parse_csv(data)
+    finally:
+        data.close()
+
+
+def parse_csv(data):
+    """
+    Parse the contents of a csv file written by `laptime.reader.record()`
+    into columns (see `load()`).
+
+    Parameters
+    ----------
+    data: bytes-like object
+        The whole file, e.g. `bytes` or an `mmap.mmap`.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return _parse_rows(data)
+
+    columns = _parse_vectorized(numpy, data)
+    if columns is None:
+        # Something unusual (e.g. old style timestamps), do it the slow way
+        columns = {name: numpy.array(values, dtype=numpy.int64)
+                   for name, values in _parse_rows(data).items()}
+    return columns
+
+
+def _parse_rows(data):
+    lines = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8', newline='')
+    reader = csv.reader(lines)
+    header = next(reader, [])
+    has_gate = 'Gate' in header
+
+    names = COLUMNS if has_gate else COLUMNS[:-1]
+    columns = {name: array('q') for name in names}
+
+    for row in reader:
+        if not row:
+            continue
+        columns['timestamp'].append(parse_timestamp(row[0]))
+        columns['millis'].append(int(row[1]))
+        columns['laptime'].append(int(row[2]))
+        if has_gate:
+            columns['gate'].append(int(row[4]) if row[4] else NO_GATE)
+
+    return columns
+
+
+def _parse_int(np, data, starts, ends, chunk_size=1 << 16):
+    # Parse every field of a column at once: line the digits up on the
+    # right (with zeros on the left as padding), then it's just a matrix
+    # product with the powers of ten. Returns None if anything isn't a plain
+    # unsigned integer, and raises ValueError if one is too big for int64.
+    lengths = ends - starts
+    width = int(lengths.max()) if len(lengths) else 0
+    if width > MAX_DIGITS:
+        return None
+
+    if width == MAX_DIGITS:
+        limit = np.array([int(digit) for digit in str(INT64_MAX)],
+                         dtype=np.int8)
+
+    values = np.empty(len(starts), dtype=np.int64)
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    offsets = np.arange(-width, 0)
+
+    # A chunk at a time, to keep the digit matrix small
+    for i in range(0, len(starts), chunk_size):
+        positions = ends[i:i + chunk_size, None] + offsets
+        # Padding may pick up bytes from before the start of the data (a
+        # negative index), but they get zeroed anyway
+        digits = data[positions]
+        digits -= np.uint8(_ZERO)
+        digits[positions < starts[i:i + chunk_size, None]] = 0
+
+        if (digits > 9).any():
+            return None
+
+        if width == MAX_DIGITS:
+            # The product would silently wrap around, so compare the longest
+            # numbers with the limit a digit at a time: the first digit that
+            # differs decides which is bigger
+            longest = digits[lengths[i:i + chunk_size] == MAX_DIGITS]
+            difference = longest.astype(np.int8) - limit
+            first = (difference != 0).argmax(axis=1)
+            if (difference[np.arange(len(first)), first] > 0).any():
+                raise ValueError('Number too big for a 64-bit integer')
+
+        values[i:i + chunk_size] = digits @ powers
+
+    return values
+
+
+def _parse_vectorized(np, data):
+    data = np.frombuffer(data, dtype=np.uint8)
+    newlines = np.flatnonzero(data == _NEWLINE)
+    if not len(newlines):
+        return None
+
+    header = bytes(data[:newlines[0]]).decode('utf-8').strip().split(',')
+    if header[:3] != ['Timestamp', 'Millis', 'Laptime']:
+        return None
+    num_fields = len(header)
+    has_gate = num_fields == 5 and header[4] == 'Gate'
+
+    body = data[newlines[0] + 1:]
+    # Make sure the last row ends with a newline, like all the others
+    if len(body) and body[-1] != _NEWLINE:
+        body = np.append(body, np.uint8(_NEWLINE))
+
+    separators = np.flatnonzero((body == _COMMA) | (body == _NEWLINE))
+    if not len(separators) or len(separators) % num_fields:
+        return None
+    separators = separators.reshape(-1, num_fields)
+
+    # Every row must have the same number of fields (e.g. no blank lines)
+    if (body[separators[:, -1]] != _NEWLINE).any():
+        return None
+
+    starts = np.empty_like(separators)
+    starts[0, 0] = 0
+    starts[1:, 0] = separators[:-1, -1] + 1
+    starts[:, 1:] = separators[:, :-1] + 1
+    ends = separators
+
+    names = COLUMNS if has_gate else COLUMNS[:-1]
+    columns = {}
+
+    for i, name in enumerate(names):
+        field = 4 if name == 'gate' else i
+        field_starts, field_ends = starts[:, field], ends[:, field]
+
+        if field == num_fields - 1:
+            # Don't trip over the "\r" in "\r\n" line endings
+            carriage = body[np.maximum(field_ends - 1, 0)] == ord('\r')
+            field_ends = field_ends - (carriage & (field_ends > field_starts))
+
+        values = _parse_int(np, body, field_starts, field_ends)
+        if values is None:
+            return None
+
+        if name == 'gate':
+            values[field_ends == field_starts] = NO_GATE
+        columns[name] = values
+
+    return columns
+
+
+def load_many(paths, processes=None):
+    """
+    Load several sessions in parallel, one per process.
+
+    Parameters
+    ----------
+    paths: list of str
+        The files to load, see `load()`.
+    processes: int
+        How many processes to use (default: one per CPU). With 1 everything
+        is loaded in this process.
+
+    Returns
+    -------
+    list of dict
+        The columns of each session, in the same order as `paths`.
+    """
+    paths = list(paths)
+
+    if processes == 1 or len(paths) < 2:
+        return [load(path) for path in paths]
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(processes) as pool:
+        return list(pool.map(load, paths))
@@ -0,0 +1,114 @@
+"""
+Logging set up the same way everywhere, optionally through a background
+thread so a slow disk never holds up whoever is logging.
+"""
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
+import sys
+
+
+def get_logger(name, log_file, log_level=None, queued=False):
+    """
+    Get a logger object which is set up properly with the correct formatting,
+    logfile, etc.
+
+    Parameters
+    ----------
+    name: str
+        The __name__ of the module calling this function.
+    log_file: str
+        The filename of the file to log to.
+    log_level: int
+        The lowest level of message to log (default: logging.INFO).
+    queued: bool
+        Don't format or write anything on the calling thread, just put each
+        record on a queue for a background thread (shared by every logger
+        writing to the same file) to deal with. Use this from anywhere a
+        slow disk mustn't hold things up, like the serial reading loop.
+        Queued records are written out when the program exits, or by
+        `stop_logging()`.
+
+    Returns
+    -------
+    logging.Logger
+        A logging.Logger object that can be used to log to a common file.
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(log_level or logging.INFO)
+
+    if not len(logger.handlers):
+        if queued:
+            handler = _queue_handler(log_file, logger)
+        else:
+            handler = _handler(log_file)
+        logger.addHandler(handler)
+
+    return logger
+
+
+def _handler(log_file):
+    if log_file == 'stdout':
+        handler = logging.StreamHandler(sys.stdout)
+    elif log_file == 'stderr':
+        handler = logging.StreamHandler(sys.stderr)
+    else:
+        handler = logging.FileHandler(log_file)
+
+    formatter = logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s: %(message)s',
+        datefmt='%Y/%m/%d %I:%M:%S %p'
+    )
+    handler.setFormatter(formatter)
+    return handler
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    A QueueHandler which leaves formatting the message to whoever takes
+    the record off the queue. (The standard one formats it first, on the
+    thread doing the logging, in case the record has to be pickled.)
+    """
+    def prepare(self, record):
+        return record
+
+
+# The queue and listener thread for each log file in queued mode, and the
+# loggers feeding them
+_LISTENERS = {}
+
+
+def _queue_handler(log_file, logger):
+    if log_file not in _LISTENERS:
+        records = queue.SimpleQueue()
+        listener = QueueListener(records, _handler(log_file),
+                                 respect_handler_level=True)
+        listener.start()
+
+        if not _LISTENERS:
+            atexit.register(stop_logging)
+        _LISTENERS[log_file] = (records, listener, [])
+
+    records, listener, loggers = _LISTENERS[log_file]
+    handler = _DeferredQueueHandler(records)
+    handler.listener = listener
+    loggers.append((logger, handler))
+    return handler
+
+
+def stop_logging():
+    """
+    Write out everything logged in queued mode (see `get_logger()`) and
+    stop the background threads writing it. The loggers involved are
+    reset, so `get_logger()` will set them up again if they're needed.
+    """
+    while _LISTENERS:
+        _, (_, listener, loggers) = _LISTENERS.popitem()
+
+        for logger, handler in loggers:
+            logger.removeHandler(handler)
+
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
@@ -0,0 +1,278 @@
+"""
+Serve a recording's health over HTTP, in the text format Prometheus scrapes,
+so an unattended recorder can be watched (and alerted on) from elsewhere::
+
+    $ laptime --port /dev/ttyUSB0 --metrics-port 9464
+    $ curl http://127.0.0.1:9464/metrics
+
+Everything comes from the recording's `laptime.latency.PipelineStats`. The
+server runs on its own thread and only ever reads the stats, so a scrape
+never holds up reading from the serial port.
+"""
+from collections import deque
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import threading
+import time
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# The quantiles reported for each latency summary
+QUANTILES = [('0.5', 'p50'), ('0.9', 'p90'), ('0.99', 'p99'),
+             ('0.999', 'p999')]
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels) + '}'
+
+
+def _value(value):
+    if value is None:
+        return 'NaN'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metrics:
+    def __init__(self):
+        self.lines = []
+
+    def add(self, name, kind, help_text, samples):
+        """
+        Add a metric, given a list of `(labels, value)` for its samples.
+        """
+        self.lines.append('# HELP {} {}'.format(name, help_text))
+        self.lines.append('# TYPE {} {}'.format(name, kind))
+        for labels, value in samples:
+            self.lines.append('{}{} {}'.format(name, _labels(labels),
+                                               _value(value)))
+
+    def summary(self, name, help_text, summaries):
+        """
+        Add a latency summary, given a list of `(labels, summary)` where
+        each summary is a `laptime.latency.Histogram.summary()`.
+        """
+        self.lines.append('# HELP {} {}'.format(name, help_text))
+        self.lines.append('# TYPE {} summary'.format(name))
+        for labels, summary in summaries:
+            for quantile, key in QUANTILES:
+                value = summary[key]
+                self.lines.append('{}{} {}'.format(
+                    name, _labels(labels + [('quantile', quantile)]),
+                    _value(None if value is None else value / 1e9)))
+
+            total = (summary['mean'] or 0) * summary['count']
+            self.lines.append('{}_sum{} {}'.format(name, _labels(labels),
+                                                   _value(total / 1e9)))
+            self.lines.append('{}_count{} {}'.format(name, _labels(labels),
+                                                     summary['count']))
+
+    def text(self):
+        return '\n'.join(self.lines) + '\n'
+
+
+def render(pipeline, event_rate=None):
+    """
+    Write out a `laptime.latency.PipelineStats` in the Prometheus text
+    format.
+
+    Parameters
+    ----------
+    pipeline: laptime.latency.PipelineStats
+        The recording's stats.
+    event_rate: float
+        The current number of laps per second (default: the average since
+        recording started).
+
+    Returns
+    -------
+    str
+    """
+    stats = pipeline.stats()
+    if event_rate is None:
+        event_rate = stats['laps_per_sec']
+
+    metrics = _Metrics()
+    metrics.add('laptime_events_total', 'counter', 'Laps recorded.',
+                [([], stats['laps'])])
+    metrics.add('laptime_parse_errors_total', 'counter',
+                'Lines or frames which could not be parsed.',
+                [([], stats['parse_errors'])])
+    metrics.add('laptime_frames_missed_total', 'counter',
+                'Binary frames lost in transit, going by sequence numbers.',
+                [([], stats['missed'])])
+    metrics.add('laptime_reads_total', 'counter',
+                'Reads from the serial port(s) which returned data.',
+                [([], stats['reads'])])
+    metrics.add('laptime_bytes_read_total', 'counter',
+                'Bytes read from the serial port(s).',
+                [([], stats['bytes_read'])])
+    metrics.add('laptime_event_rate', 'gauge',
+                'Laps recorded per second, recently.', [([], event_rate)])
+    metrics.add('laptime_last_event_age_seconds', 'gauge',
+                'How long ago the latest lap arrived.',
+                [([], stats['last_event_age'])])
+    metrics.add('laptime_uptime_seconds', 'gauge',
+                'How long recording has been running.',
+                [([], stats['elapsed'])])
+
+    sinks = stats['sinks']
+    queued = [(name, sink['queue']) for name, sink in sinks.items()
+              if 'queue' in sink]
+    metrics.add('laptime_queue_depth', 'gauge',
+                'Laps waiting to be written to each sink.',
+                [([('sink', name)], queue['depth']) for name, queue in queued])
+    metrics.add('laptime_queue_high_water', 'gauge',
+                'The most laps which have been waiting for each sink.',
+                [([('sink', name)], queue['high_water'])
+                 for name, queue in queued])
+    metrics.add('laptime_queue_dropped_total', 'counter',
+                'Laps thrown away because a sink could not keep up.',
+                [([('sink', name)], queue['dropped'])
+                 for name, queue in queued])
+
+    metrics.summary('laptime_stage_latency_seconds',
+                    'Time taken by each stage of reading laps (sampled).',
+                    [([('stage', 'framed')], stats['framed']),
+                     ([('stage', 'parsed')], stats['parsed'])])
+    metrics.summary('laptime_sink_write_latency_seconds',
+                    'From a lap being parsed to a sink writing it (sampled).',
+                    [([('sink', name)], sink['written'])
+                     for name, sink in sinks.items()])
+    metrics.summary('laptime_sink_flush_latency_seconds',
+                    'From a lap being written to a sink flushing it '
+                    '(sampled).',
+                    [([('sink', name)], sink['flushed'])
+                     for name, sink in sinks.items()])
+    metrics.add('laptime_sink_flushes_total', 'counter',
+                'Flushes by each sink.',
+                [([('sink', name)], sink['flushes'])
+                 for name, sink in sinks.items()])
+
+    return metrics.text()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Don't let a client which stops talking hold up the next scrape
+    timeout = 5
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        metrics = self.server.metrics
+        body = render(metrics.stats, metrics.event_rate()).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scraped every few seconds, for hours, so keep quiet
+        pass
+
+
+class _Server(HTTPServer):
+    def service_actions(self):
+        # Called every time around serve_forever()'s loop
+        self.metrics.sample()
+
+
+class MetricsServer:
+    """
+    Serve a `laptime.latency.PipelineStats` over HTTP on a background
+    thread, for Prometheus to scrape.
+
+    The current event rate is worked out from how many laps were recorded
+    over the last `window` seconds, going by a reading of the lap counter
+    taken every second.
+
+    Parameters
+    ----------
+    stats: laptime.latency.PipelineStats
+        The stats to serve (usually passed on to `laptime.reader.record()`
+        as well).
+    port: int
+        The port to listen on (default: any free one, see `url`).
+    host: str
+        The address to listen on. Only the local machine can connect by
+        default.
+    window: float
+        How far back the event rate looks, in seconds.
+
+    Attributes
+    ----------
+    url: str
+        Where the metrics can be found, e.g. "http://127.0.0.1:9464/metrics".
+    """
+    def __init__(self, stats, port=0, host='127.0.0.1', window=10.0):
+        self.stats = stats
+        self.window = window
+        # (time.monotonic(), laps) readings, oldest first
+        self.samples = deque()
+
+        self.server = _Server((host, port), _Handler)
+        self.server.metrics = self
+        host, port = self.server.server_address[:2]
+        self.url = 'http://{}:{}/metrics'.format(host, port)
+        self.thread = None
+
+    def sample(self):
+        """
+        Take a reading of the lap counter, if the last one was more than a
+        second ago.
+        """
+        now = time.monotonic()
+        samples = self.samples
+        if samples and now - samples[-1][0] < 1:
+            return
+
+        samples.append((now, self.stats.laps))
+        # Keep one reading from before the window, to measure from
+        while len(samples) > 2 and now - samples[1][0] >= self.window:
+            samples.popleft()
+
+    def event_rate(self):
+        """
+        Laps per second over the last `window` seconds (or since recording
+        started, if that was more recent).
+        """
+        self.sample()
+        now, laps = time.monotonic(), self.stats.laps
+
+        if len(self.samples) < 2:
+            elapsed = self.stats.elapsed()
+            return laps / elapsed if elapsed else 0.0
+
+        then, before = self.samples[0]
+        return (laps - before) / (now - then)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       kwargs={'poll_interval': 0.5},
+                                       name='laptime-metrics', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop serving and close the socket.
+        """
+        if self.thread is not None:
+            self.server.shutdown()
+            self.thread.join()
+            self.thread = None
+        self.server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -1,9 +1,8 @@
 from datetime import datetime
-import logging
-import sys
 
 
-def generate_filename(base='track_times', timestamp_format=None):
+def generate_filename(base='track_times', timestamp_format=None,
+                      extension='csv'):
     """
     Create a unique filename that incorporates a timestamp. 
     
@@ -17,6 +16,8 @@ def generate_filename(base='track_times', timestamp_format=None):
     timestamp_format: str
         A strftime formatting string. See "http://strfti.me/" for more
         details.
+    extension: str
+        The file extension to use.
         
     Returns
     -------
@@ -27,17 +28,20 @@ def generate_filename(base='track_times', timestamp_format=None):
         timestamp_format = '%Y-%m-%d_%H%M'
     time_stamp = datetime.now().strftime(timestamp_format)
 
-    name = '{}_{}.csv'.format(base, time_stamp)
+    name = '{}_{}.{}'.format(base, time_stamp, extension)
     if '/' in name:
         raise ValueError('Invalid filename: {}'.format(name))
 
     return name
 
 
-def human_readable(millis): 
+def human_readable(millis, padded=False):
     """ 
     Take a number of milliseconds and turn it into a string with the format
     "min:sec.millis".
+
+    With `padded` the seconds and milliseconds are zero padded, i.e.
+    "m:ss.mmm", so 5 seconds is "0:05.000" instead of "0:5.0".
     """
     if not isinstance(millis, int):
         raise TypeError('millis must be a positive integer')
@@ -48,42 +52,152 @@ def human_readable(millis):
     seconds, ms = divmod(millis, 1000)
     minutes, seconds = divmod(seconds, 60)
 
+    if padded:
+        return '{}:{:02}.{:03}'.format(minutes, seconds, ms)
     return '{}:{}.{}'.format(minutes, seconds, int(ms))
-    
 
-def get_logger(name, log_file, log_level=None):
+
+def human_readable_many(millis, padded=False, array=False):
     """
-    Get a logger object which is set up properly with the correct formatting,
-    logfile, etc.
+    Format a whole sequence of millisecond durations at once, the same way
+    as `human_readable()`.
+
+    With NumPy installed every string is assembled in one go as a block of
+    bytes, which is much faster than calling `human_readable()` in a loop
+    for big sessions.
 
     Parameters
     ----------
-    name: str
-        The __name__ of the module calling this function.
-    log_file: str
-        The filename of the file to log to.
+    millis: sequence of int
+        The durations, e.g. a list or a NumPy array (such as a column from
+        `laptime.load()`).
+    padded: bool
+        Zero pad the seconds and milliseconds, see `human_readable()`.
+    array: bool
+        Return a NumPy array of byte strings instead of a list. Making a
+        Python string for every duration takes longer than all of the
+        formatting, so this is much quicker again (requires NumPy).
 
     Returns
     -------
-    logging.Logger
-        A logging.Logger object that can be used to log to a common file.
+    list of str
+        Or a NumPy array of byte strings, with `array`.
     """
-    logger = logging.getLogger(name)
-    logger.setLevel(log_level or logging.INFO)
-
-    if log_file == 'stdout':
-        handler = logging.StreamHandler(sys.stdout)
-    elif log_file == 'stderr':
-        handler = logging.StreamHandler(sys.stderr)
-    else:
-        handler = logging.FileHandler(log_file)
-
-    if not len(logger.handlers):
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s: %(message)s',
-            datefmt='%Y/%m/%d %I:%M:%S %p'
-        )
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-
-    return logger
+    try:
+        import numpy as np
+    except ImportError:
+        if array:
+            raise
+        return [human_readable(value, padded) for value in millis]
+
+    values = np.asarray(millis)
+    if values.dtype.kind not in 'iu' and len(values):
+        raise TypeError('millis must be a positive integer')
+    if not len(values):
+        return np.array([], dtype='S1') if array else []
+    if values.min() < 0:
+        raise ValueError('millis must be a positive integer')
+
+    minutes, rest = np.divmod(values.astype(np.int64), 60000)
+    count = len(values)
+
+    # Lay every string out as a row of bytes, with NULs wherever a digit
+    # isn't needed, then strip out the NULs and split the rows apart. Every
+    # possible ":ss.mmm" (or ":s.ms") is looked up from a table of 8 byte
+    # rows, each packed into a uint64 so it's a single number to look up.
+    minute_width = len(str(int(minutes.max())))
+    characters = np.empty((count, minute_width + 8), dtype=np.uint8)
+
+    tails = _tail_table(np, padded, b'' if array else b'\n')
+    characters[:, minute_width:] = tails.take(rest).view(np.uint8).reshape(
+        count, 8)
+    ragged = _minute_digits(np, minutes, characters[:, :minute_width])
+
+    if array:
+        # NumPy byte strings are NUL padded on the right anyway, as long as
+        # there aren't any NULs at the start (from the minutes)
+        characters = characters[:, :-1]
+        if ragged:
+            return _byte_strings(np, characters, characters != 0)
+        width = characters.shape[1]
+        return np.ascontiguousarray(characters).view(
+            'S{}'.format(width)).ravel()
+
+    text = characters.tobytes()
+    if ragged or not padded:
+        text = text.replace(b'\0', b'')
+
+    return text.decode('ascii').split('\n')[:-1]
+
+
+def _minute_digits(np, minutes, out):
+    # Write the digits of each number of minutes, right aligned with NULs on
+    # the left, and say whether any NULs were needed
+    width = out.shape[1]
+
+    if width == 1:
+        out[:, 0] = minutes
+        out += ord('0')
+        return False
+
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    out[:] = minutes[:, None] // powers % 10 + ord('0')
+
+    if len(str(int(minutes.min()))) == width:
+        return False
+
+    leading = ~np.logical_or.accumulate(out != ord('0'), axis=1)
+    leading[:, -1] = False
+    out[leading] = 0
+    return True
+
+
+def _byte_strings(np, characters, keep):
+    # Turn rows of bytes into a NumPy byte string array, with the kept bytes
+    # of each row moved to the front and NULs after them
+    count, width = characters.shape
+    lengths = keep.sum(axis=1)
+    packed = np.zeros(characters.shape, dtype=np.uint8)
+    packed[np.arange(width) < lengths[:, None]] = characters[keep]
+
+    return packed.view('S{}'.format(width)).ravel()
+
+
+_TAILS = {}
+
+
+def _tail_table(np, padded, end):
+    # ":ss.mmm" (or ":s.ms") followed by `end` for every number of
+    # milliseconds in a minute, NUL padded to 8 bytes and packed into a
+    # uint64
+    key = (padded, end)
+
+    if key not in _TAILS:
+        template = ':{:02}.{:03}' if padded else ':{}.{}'
+        tails = b''.join((template.format(*divmod(ms, 1000)).encode()
+                          + end).ljust(8, b'\0')
+                         for ms in range(60000))
+        _TAILS[key] = np.frombuffer(tails, dtype=np.uint64)
+
+    return _TAILS[key]
+
+
+def parse_human_readable(text):
+    """
+    Turn a string made by `human_readable()` (padded or not) back into a
+    number of milliseconds.
+    """
+    minutes, rest = text.split(':')
+    seconds, ms = rest.split('.')
+    return (int(minutes) * 60 + int(seconds)) * 1000 + int(ms)
+
+
+def __getattr__(name):
+    # The logging helpers live in laptime.logs, so nothing that only wants
+    # to format laptimes has to import the logging package
+    if name in ('get_logger', 'stop_logging'):
+        from . import logs
+        return getattr(logs, name)
+
+    raise AttributeError(
+        'module {!r} has no attribute {!r}'.format(__name__, name))
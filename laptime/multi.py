@@ -0,0 +1,254 @@
+"""
+Record several timing gates (e.g. start/finish plus sector beams) from a
+single process, multiplexing all of their serial ports in one selector loop.
+"""
+import io
+import selectors
+import sys
+import time
+
+from .framing import LineFramer, BinaryFramer
+from .laps import MULTI_HEADER, LapTimer, GateLapTimers
+from .writer import BackgroundWriter
+from .sinks import CSVSink
+from .clock import SessionClock
+from .latency import PipelineStats
+
+
+class _Gate:
+    def __init__(self, gate_id, serial_connection, clock, binary=False):
+        self.id = gate_id
+        self.ser = serial_connection
+
+        if binary:
+            self.framer = BinaryFramer()
+            self.timer = GateLapTimers(clock=clock)
+        else:
+            self.framer = LineFramer()
+            self.timer = LapTimer(gate=gate_id, clock=clock)
+
+
+class MultiRecorder:
+    """
+    Read laps from several serial connections at once.
+
+    Each connection is a separate timing gate with its own arduino, so laps
+    are calculated per gate and tagged with the gate's id. Whenever any of
+    the ports becomes readable everything waiting on it is drained in one
+    go, so a busy gate can't starve the others.
+
+    Note
+    ----
+    If every serial connection has a file descriptor (as `serial.Serial`
+    does on POSIX) they are all waited on with a selector. Otherwise (e.g.
+    on Windows) each port's `in_waiting` is checked every `poll_interval`
+    seconds instead, like `laptime.reader.SerialWaiter` does.
+
+    Parameters
+    ----------
+    serial_connections: list of serial.Serial
+        The serial connection for each gate.
+    gates: list
+        The id of each gate (default: 0, 1, 2, ... in the same order as
+        `serial_connections`).
+    wait_timeout: float
+        The longest we'll sleep for before checking whether `stop()` was
+        called.
+    binary: bool
+        Expect binary frames (see `laptime.framing.BinaryFramer`) instead of
+        lines of text. Laps are then tagged with the gate id in each frame
+        rather than the one given in `gates`.
+    clock: laptime.clock.SessionClock
+        Timestamps laps from every gate (default: a new one).
+    stats: laptime.latency.PipelineStats
+        Where to keep track of how long framing and parsing take, if
+        anywhere.
+    poll_interval: float
+        How long to sleep between `in_waiting` checks when a selector can't
+        be used.
+    """
+    def __init__(self, serial_connections, gates=None, wait_timeout=0.5,
+                 binary=False, clock=None, stats=None, poll_interval=0.005):
+        if gates is None:
+            gates = range(len(serial_connections))
+
+        self.clock = clock or SessionClock()
+        self.gates = [_Gate(gate_id, ser, self.clock, binary=binary)
+                      for gate_id, ser in zip(gates, serial_connections)]
+        if len(self.gates) != len(serial_connections):
+            raise ValueError('Every serial connection needs a gate id')
+
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.running = False
+        self.stats = stats
+
+    def laps(self):
+        """
+        Yield every lap from every gate, in the order they arrive.
+
+        A gate which sends a 0 is finished with, and this stops once every
+        gate has finished (or `stop()` is called).
+        """
+        for gate in self.gates:
+            if not gate.ser.is_open:
+                gate.ser.open()
+            gate.ser.timeout = 0
+
+        # The gates which haven't finished yet
+        active = list(self.gates)
+        selector = selectors.DefaultSelector()
+        try:
+            for gate in active:
+                selector.register(gate.ser.fileno(), selectors.EVENT_READ,
+                                  gate)
+        except (AttributeError, io.UnsupportedOperation, OSError):
+            # No file descriptors to wait on, so poll instead
+            selector.close()
+            selector = None
+
+        self.running = True
+        stats = self.stats
+        clock = self.clock
+        if stats is not None:
+            if stats.started is None:
+                stats.start(clock)
+            stats.framers.extend(gate.framer for gate in self.gates
+                                 if isinstance(gate.framer, BinaryFramer))
+
+        try:
+            while self.running and active:
+                for gate in self._ready(selector, active):
+                    if stats is None:
+                        messages = gate.framer.read_from(gate.ser)
+                    else:
+                        received = gate.framer.received
+                        arrived = clock.now()
+                        messages = gate.framer.read_from(gate.ser)
+                        framed = clock.now()
+                        stats.framed.record(framed - arrived, len(messages))
+                        stats.reads += 1
+                        stats.bytes_read += gate.framer.received - received
+                        if messages:
+                            stats.last_event = framed
+
+                    for message in messages:
+                        try:
+                            lap = gate.timer.lap(message)
+                        except ValueError:
+                            # Line noise, skip it (like the binary framer
+                            # does)
+                            if stats is not None:
+                                stats.parse_errors += 1
+                            continue
+
+                        if lap is None:
+                            active.remove(gate)
+                            if selector is not None:
+                                selector.unregister(gate.ser.fileno())
+                            break
+
+                        if stats is not None:
+                            stats.laps += 1
+                            if not stats.laps % stats.sample_every:
+                                stats.parsed.record(lap.timestamp - framed,
+                                                    stats.sample_every)
+                        yield lap
+        finally:
+            if selector is not None:
+                selector.close()
+
+    def _ready(self, selector, gates):
+        # The gates with something to read, waiting up to wait_timeout for
+        # one to have
+        if selector is not None:
+            return [key.data for key, _ in selector.select(self.wait_timeout)]
+
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            ready = [gate for gate in gates if gate.ser.in_waiting]
+            if ready or time.monotonic() >= deadline:
+                return ready
+            time.sleep(self.poll_interval)
+
+    def stop(self):
+        """
+        Tell `laps()` to stop reading.
+        """
+        self.running = False
+
+
+def record_many(serial_connections, fp, gates=None, verbose=False,
+                background=False, binary=False, sink=None, stats=None):
+    """
+    Record several timing gates into one merged csv, with an extra "Gate"
+    column saying where each lap came from.
+
+    Parameters
+    ----------
+    serial_connections: list of serial.Serial
+        The serial connection for each gate.
+    fp: file-like object
+        An object that behaves like a file (i.e. has a read() and write()
+        method). Most commonly created with `open(some_filename, 'w')`.
+    gates: list
+        The id of each gate (default: 0, 1, 2, ...).
+    verbose: bool
+        Print each lap to stderr as it is received.
+    background: bool
+        Write rows to `fp` from a `BackgroundWriter` thread so a slow disk
+        can't hold up reading from the serial ports.
+    binary: bool
+        Expect binary frames instead of lines of text.
+    sink: laptime.sinks.Sink
+        Where to write laps to instead of writing csv to `fp`. It is
+        flushed, but not closed, once recording stops.
+    stats: laptime.latency.PipelineStats
+        Where to keep track of how long each stage of recording takes
+        (default: a new one). Pass False to skip measuring altogether.
+
+    Returns
+    -------
+    laptime.latency.PipelineStats
+        The latencies and throughput of the recording (None if `stats` was
+        False).
+    """
+    if sink is None:
+        sink = CSVSink(fp, gate=True)
+
+    if verbose:
+        print(', '.join(MULTI_HEADER), file=sys.stderr)
+
+    writer = sink
+    if background:
+        writer = BackgroundWriter(sink, flush=sink.flush)
+        writer.start()
+
+    clock = SessionClock()
+    if stats is False:
+        stats = None
+    else:
+        stats = stats or PipelineStats()
+        stats.start(clock)
+        stats.watch(sink, writer=writer if background else None)
+
+    recorder = MultiRecorder(serial_connections, gates=gates, binary=binary,
+                             clock=clock, stats=stats)
+
+    failed = True
+    try:
+        try:
+            for lap in recorder.laps():
+                writer.writerow(lap)
+
+                if verbose:
+                    print(lap.summary(), file=sys.stderr)
+        except KeyboardInterrupt:
+            pass
+        failed = False
+    finally:
+        if background:
+            writer.stop(raise_error=not failed)
+        sink.flush()
+
+    return stats
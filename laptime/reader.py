@@ -1,30 +1,124 @@
 import csv
+import io
 import logging
-from datetime import datetime
+import selectors
 import sys
-import argparse
-from collections import deque
-from serial import Serial
+import time
 
-from .misc import human_readable, get_logger
+from .logs import get_logger
+from .clock import SessionClock
+from .laps import HEADER, MULTI_HEADER, Lap, LapTimer, GateLapTimers
+from .framing import LineFramer, BinaryFramer, FRAME
+from .writer import BackgroundWriter
+from .sinks import CSVSink
+from .latency import PipelineStats
+
+
+class SerialWaiter:
+    """
+    Sleep until a serial connection has bytes waiting to be read.
+
+    If the connection exposes a file descriptor (as `serial.Serial` does on
+    POSIX) it is registered with a selector so the OS wakes us up as soon as
+    data arrives. Otherwise we fall back to checking `in_waiting` every
+    `poll_interval` seconds, and if the connection doesn't even have that
+    then there's no choice but to let the caller go ahead and read.
+
+    Parameters
+    ----------
+    serial_connection: serial.Serial
+        The connection to wait on.
+    poll_interval: float
+        How long to sleep between `in_waiting` checks when a selector can't
+        be used.
+    """
+    def __init__(self, serial_connection, poll_interval=0.005):
+        self.ser = serial_connection
+        self.poll_interval = poll_interval
+        self.selector = None
+
+        try:
+            fd = self.ser.fileno()
+        except (AttributeError, io.UnsupportedOperation, OSError):
+            fd = None
+
+        if fd is not None:
+            self.selector = selectors.DefaultSelector()
+            self.selector.register(fd, selectors.EVENT_READ)
+
+    def wait(self, timeout=None):
+        """
+        Block until there is something to read or `timeout` seconds have
+        elapsed.
+
+        Returns
+        -------
+        bool
+            Whether the connection is (probably) readable.
+        """
+        if self.selector is not None:
+            return bool(self.selector.select(timeout))
+
+        if not hasattr(self.ser, 'in_waiting'):
+            return True
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.ser.in_waiting:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self.poll_interval)
+
+        return True
+
+    def close(self):
+        if self.selector is not None:
+            self.selector.close()
+            self.selector = None
 
 
 class Recorder:
+    """
+    Read laptimes from a non-blocking serial connection.
+
+    Parameters
+    ----------
+    serial_connection: serial.Serial
+        A serial connection created using the pyserial library.
+    fp: file-like object
+        Where the csv output will be written to.
+    log_file: str
+        The file to log to (default: "timer.log").
+    verbose: bool
+        Log every message received.
+    write_header: bool
+        Write the csv header to `fp` straight away.
+    wait: bool
+        Sleep (using a `SerialWaiter`) until the serial port has data
+        instead of continually polling it. Turning this off gives you the
+        old behaviour of spinning on `read()`, which keeps a CPU core busy.
+    wait_timeout: float
+        The longest we'll sleep for before checking whether `stop()` was
+        called.
+    """
     def __init__(self, serial_connection, fp, log_file=None, verbose=True, 
-                 write_header=True):
+                 write_header=True, wait=True, wait_timeout=0.5):
         self.ser = serial_connection
         self.fp = fp
         self.log_file = log_file or 'timer.log'
         self.verbose = verbose
         self.running = False
         self.entries = []
+        self.wait = wait
+        self.wait_timeout = wait_timeout
     
         # Make sure the serial connection is in non-blocking mode
         self.ser.timeout = 0
 
+        # Queued, so writing the log never holds up reading the serial port
         self.logger = get_logger(__name__, 
                 self.log_file,
-                log_level=logging.DEBUG if verbose else logging.INFO)
+                log_level=logging.DEBUG if verbose else logging.INFO,
+                queued=True)
 
         if not self.ser.is_open:
             self.ser.open()
@@ -33,44 +127,201 @@ class Recorder:
         self.writer = csv.writer(self.fp)
 
         if write_header:
-            header = ['Timestamp', 'Millis', 'Laptime', 'Human Readable']
-            writer.writerow(header)
+            self.writer.writerow(HEADER)
 
     def get_millis(self):
-        buff = deque()
-        while self.running:
-            # Read in up to 8 bytes
-            stuff = self.ser.read(8)
+        """
+        Keep reading from the serial port, yielding each newline-delimited
+        message as it is completed (without the trailing newline).
+        """
+        framer = LineFramer()
+        waiter = SerialWaiter(self.ser) if self.wait else None
+        self.running = True
 
-            if stuff:
-                self.logger.debug('Got: "{}"'.format(stuff))
-                buff.extend(stuff)
-                
-            if b'\n' in stuff:
-                next_char = buff.popleft()
+        try:
+            while self.running:
+                if waiter is not None and not waiter.wait(self.wait_timeout):
+                    continue
 
-                message = bytearray()
-                while next_char != b'\n':
-                    message.append(next_char)
-                    next_char = buff.popleft()
+                # Once woken up, drain everything that's available in one go
+                for message in framer.read_from(self.ser):
+                    self.logger.debug('Got: "%s"', message)
+                    yield message
+        finally:
+            if waiter is not None:
+                waiter.close()
 
-                yield message
-                    
+    def stop(self):
+        """
+        Tell `get_millis()` to stop reading.
+        """
+        self.running = False
+
+
+def _line_laps(serial_connection, clock, stats=None):
+    timer = LapTimer(clock=clock)
+
+    if stats is None:
+        while True:
+            line = serial_connection.readline()
+            if not line:
+                # Timed out (or, when replaying a capture, ran out of data)
+                return
+            try:
+                lap = timer.lap(line)
+            except ValueError:
+                # Line noise, skip it (like the binary framer does)
+                continue
+            if lap is None:
+                return
+            yield lap
+
+    every = stats.sample_every
+    # Laps and bytes read so far, and how many of each there were when the
+    # stats were last brought up to date. That's done every `every` laps,
+    # before waiting for the next line or when they're getting out of date.
+    number = position = 0
+    published = published_bytes = 0
+    # The number of the next lap to time
+    sampled = every - 1
+    last = None
+    updated = 0
+    # How far into the stream bytes are known to be waiting on the port.
+    # in_waiting (an ioctl, with pyserial) is only checked again once
+    # they've all been read, rather than before every line.
+    available = 0
+
+    try:
+        while True:
+            if position >= available:
+                waiting = getattr(serial_connection, 'in_waiting', 0)
+                available = position + waiting
+                if number > published and (
+                        not waiting
+                        or last.timestamp - updated > stats.max_delay):
+                    # readline() is about to block, perhaps until the next
+                    # lap
+                    stats.reads += number - published
+                    stats.laps += number - published
+                    stats.bytes_read += position - published_bytes
+                    stats.last_event = updated = last.timestamp
+                    published, published_bytes = number, position
+
+            if number != sampled:
+                line = serial_connection.readline()
+                if not line:
+                    # Timed out (or, when replaying a capture, ran out of
+                    # data)
+                    return
+                try:
+                    lap = timer.lap(line)
+                except ValueError:
+                    # Line noise, count it and carry on
+                    position += len(line)
+                    stats.reads += 1
+                    stats.parse_errors += 1
+                    continue
+                if lap is None:
+                    break
+            else:
+                sampled += every
+                # Only time the framing of lines which have started to
+                # arrive, not however long it is until the next lap
+                arrived = clock.now() if position < available else None
+                line = serial_connection.readline()
+                if not line:
+                    return
+                # readline() frames the line itself, so the call is timed
+                framed = clock.now()
+                if arrived is not None:
+                    stats.framed.record(framed - arrived, every)
+                try:
+                    lap = timer.lap(line)
+                except ValueError:
+                    position += len(line)
+                    stats.reads += 1
+                    stats.parse_errors += 1
+                    continue
+                if lap is None:
+                    break
+                stats.parsed.record(lap.timestamp - framed, every)
+
+                stats.reads += number + 1 - published
+                stats.laps += number + 1 - published
+                stats.bytes_read += position + len(line) - published_bytes
+                stats.last_event = updated = lap.timestamp
+                published, published_bytes = number + 1, position + len(line)
+
+            number += 1
+            position += len(line)
+            last = lap
+            yield lap
+
+        # The 0 is read, but isn't a lap
+        stats.reads += 1
+        stats.bytes_read += len(line)
+    finally:
+        if number > published:
+            stats.reads += number - published
+            stats.laps += number - published
+            stats.bytes_read += position - published_bytes
+            stats.last_event = last.timestamp
+
+
+def _binary_laps(serial_connection, clock, stats=None):
+    framer = BinaryFramer()
+    timers = GateLapTimers(clock=clock)
+    if stats is not None:
+        stats.framers.append(framer)
+
+    while True:
+        # Block until there's at least one frame, then also take whatever
+        # else is already waiting so it can all be decoded in one go
+        waiting = getattr(serial_connection, 'in_waiting', 0)
+        data = serial_connection.read(max(waiting, FRAME.size))
+        if not data:
+            return
 
+        if stats is None:
+            frames = framer.feed(data)
+        else:
+            arrived = clock.now()
+            frames = framer.feed(data)
+            framed = clock.now()
+            stats.framed.record(framed - arrived, len(frames))
+            stats.reads += 1
+            stats.bytes_read += len(data)
+            if frames:
+                stats.last_event = framed
 
-def record(serial_connection, fp, verbose=False):
+        for frame in frames:
+            lap = timers.lap(frame)
+            if lap is None:
+                return
+            if stats is not None:
+                stats.laps += 1
+                if not stats.laps % stats.sample_every:
+                    stats.parsed.record(lap.timestamp - framed,
+                                        stats.sample_every)
+            yield lap
+
+
+def record(serial_connection, fp, verbose=False, background=False,
+           binary=False, clock=None, sink=None, stats=None):
     """
     Read in a line from the serial connection and write a timestamp plus
     the data to a csv file. 
     
     Each line from the serial connection is written as a new row in the csv. 
-    If the time outputted by the arduino is 0 at any time, then stop the 
-    recording.
+    If the time outputted by the arduino is 0 at any time, or the serial
+    connection times out, then stop the recording. Lines which aren't a
+    number (e.g. garbled by line noise) are skipped, and counted in the
+    stats' `parse_errors`.
     
     Note
     ----
     The recorder assumes that your serial connection will be giving times 
-    delimited by a newline character ('\n').     
+    delimited by a newline character ('\n'), unless `binary` is set.
 
     Parameters
     ----------
@@ -79,41 +330,82 @@ def record(serial_connection, fp, verbose=False):
     fp: file-like object
         An object that behaves like a file (i.e. has a read() and write()
         method). Most commonly created with `open(some_filename, 'w')`.
+    verbose: bool
+        Print each lap to stderr as it is received.
+    background: bool
+        Write rows to `fp` from a `BackgroundWriter` thread so a slow disk
+        can't hold up reading from the serial port.
+    binary: bool
+        Expect the compact binary frames described in
+        `laptime.framing.BinaryFramer` instead of lines of text. Frames say
+        which gate they came from, so an extra "Gate" column is written.
+    clock: laptime.clock.SessionClock
+        Timestamps each lap (default: a new one, anchored to the wall clock
+        when recording starts). Timestamps are written as nanoseconds since
+        the epoch.
+    sink: laptime.sinks.Sink
+        Where to write laps to instead of writing csv to `fp` (e.g. a
+        `laptime.sinks.Tee` to write them to several places at once). It
+        is flushed, but not closed, once recording stops.
+    stats: laptime.latency.PipelineStats
+        Where to keep track of how long each stage of recording takes
+        (default: a new one). Pass False to skip measuring altogether.
+
+    Returns
+    -------
+    laptime.latency.PipelineStats
+        The latencies and throughput of the recording (None if `stats` was
+        False).
     """
     # Make sure the connection is open
     if not serial_connection.is_open:
         serial_connection.open()
-        
-    # Create a writer object
-    writer = csv.writer(fp)
 
-    row = ['Timestamp', 'Millis', 'Laptime', 'Human Readable']
-    writer.writerow(row)
+    clock = clock or SessionClock()
 
-    if verbose:
-        print(', '.join(row), file=sys.stderr)
-    
-    previous_entry = 0
-    while True:
-        # Wrap it in a try-except that will catch when the user
-        # hits <ctrl-C> and break out of the while loop
-        try:
-            entry = serial_connection.readline()
-            entry = int(entry)
+    if sink is None:
+        sink = CSVSink(fp, gate=binary)
+
+    writer = sink
+    if background:
+        writer = BackgroundWriter(sink, flush=sink.flush)
+        writer.start()
+
+    if stats is False:
+        stats = None
+    else:
+        stats = stats or PipelineStats()
+        stats.start(clock)
+        stats.watch(sink, writer=writer if background else None)
 
-            # Let us stop recording when we want (useful for testing)
-            if entry == 0:
-                break
+    if binary:
+        header = MULTI_HEADER
+        laps = _binary_laps(serial_connection, clock, stats)
+    else:
+        header = HEADER
+        laps = _line_laps(serial_connection, clock, stats)
 
-            duration = entry - previous_entry
-            row = [datetime.now(), entry, duration, human_readable(duration)]
-            writer.writerow(row)
+    if verbose:
+        print(', '.join(header), file=sys.stderr)
 
-            if verbose:
-                row[0] = row[0].strftime('%x %X')
-                print(', '.join(str(cell) for cell in row), file=sys.stderr)
+    failed = True
+    try:
+        # Wrap it in a try-except that will catch when the user
+        # hits <ctrl-C> and stop recording
+        try:
+            for lap in laps:
+                writer.writerow(lap)
 
-            previous_entry = entry
+                if verbose:
+                    print(lap.summary(), file=sys.stderr)
         except KeyboardInterrupt:
-            break
+            pass
+        failed = False
+    finally:
+        if background:
+            # Make sure everything still queued ends up in the file,
+            # without hiding whatever stopped the recording
+            writer.stop(raise_error=not failed)
+        sink.flush()
 
+    return stats
@@ -0,0 +1,195 @@
+"""
+Summarise a whole archive of recorded sessions, e.g.::
+
+    $ laptime report sessions/ > season.csv
+
+Every session file found under the directory (csv, compressed csv or
+columnar) gets a row with its lap count, best, mean and percentile
+laptimes and how many outlying laps it had, followed by a row for each day
+combining all of that day's sessions. Outliers are judged within each
+session, so a day's outliers are just its sessions' added up.
+
+Sessions are loaded and summarised in a pool of worker processes, and each
+session's row is written as soon as it's ready. Only the small summary of
+each session is sent back from the workers (never its laps), so memory use
+doesn't grow with the size of the archive.
+"""
+import csv
+import os
+import sys
+
+from .clock import to_datetime
+from .stats import SessionStats
+
+
+# The files which are picked up as sessions
+SUFFIXES = ('.csv', '.csv.gz', '.csv.zst', '.laps')
+
+REPORT_HEADER = ['Scope', 'Name', 'Sessions', 'Laps', 'Best', 'Mean',
+                 'Stdev', 'Median', 'P90', 'Worst', 'Outliers']
+
+# How far outside the interquartile range a lap has to be to count as an
+# outlier (Tukey's fences)
+FENCE = 1.5
+
+
+def find_sessions(directory):
+    """
+    Every session file under a directory, in sorted order.
+    """
+    found = []
+
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        found.extend(os.path.join(root, name) for name in sorted(files)
+                     if name.endswith(SUFFIXES))
+
+    return found
+
+
+def count_outliers(laptimes):
+    """
+    How many laptimes are further than `FENCE` interquartile ranges below
+    the lower quartile or above the upper quartile.
+    """
+    # The quartiles need to be exact here, a sketch's buckets can be wider
+    # than the whole interquartile range
+    ordered = sorted(laptimes)
+    if len(ordered) < 4:
+        return 0
+
+    lower = ordered[len(ordered) // 4]
+    upper = ordered[3 * len(ordered) // 4]
+    spread = FENCE * (upper - lower)
+    low, high = lower - spread, upper + spread
+
+    return sum(1 for laptime in ordered if laptime < low or laptime > high)
+
+
+def summarise(path):
+    """
+    Load one session and summarise it.
+
+    Returns
+    -------
+    tuple
+        `(path, day, stats, outliers)`, where `day` is the date the session
+        started on (None if it has no laps).
+    """
+    # Imported here so worker processes only load what they need
+    from .loader import load
+
+    columns = load(path)
+    laptimes = columns['laptime'].tolist()
+
+    stats = SessionStats()
+    stats.update_many(laptimes)
+
+    day = None
+    if laptimes:
+        day = to_datetime(int(columns['timestamp'][0])).date().isoformat()
+
+    return path, day, stats, count_outliers(laptimes)
+
+
+def _try_summarise(path):
+    # Anything else with a session's suffix (e.g. an old report) shouldn't
+    # stop the rest of the archive being summarised
+    try:
+        return summarise(path), None
+    except Exception as e:
+        return (path, None, None, 0), e
+
+
+def report_row(scope, name, sessions, stats, outliers):
+    snapshot = stats.snapshot()
+
+    def rounded(value):
+        return None if value is None else round(value)
+
+    return [scope, name, sessions, snapshot.count, snapshot.best,
+            rounded(snapshot.mean), rounded(snapshot.stdev),
+            rounded(snapshot.median), rounded(snapshot.p90), snapshot.worst,
+            outliers]
+
+
+def report(paths, fp, processes=None):
+    """
+    Write a report covering several sessions.
+
+    Parameters
+    ----------
+    paths: list of str
+        The session files to include.
+    fp: file-like object
+        Where to write the report (as csv).
+    processes: int
+        How many worker processes to use (default: one per CPU). With 1
+        everything is done in this process.
+
+    Returns
+    -------
+    list
+        A `(path, error)` for every file which couldn't be summarised, and
+        was left out of the report (with a warning on stderr).
+    """
+    writer = csv.writer(fp)
+    writer.writerow(REPORT_HEADER)
+    days = {}
+    skipped = []
+
+    if processes == 1:
+        results = map(_try_summarise, paths)
+        pool = None
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(processes)
+        results = pool.map(_try_summarise, paths, chunksize=4)
+
+    try:
+        for (path, day, stats, outliers), error in results:
+            if error is not None:
+                print('Skipping {}: {}'.format(path, error), file=sys.stderr)
+                skipped.append((path, error))
+                continue
+
+            writer.writerow(report_row('session', path, 1, stats, outliers))
+            fp.flush()
+
+            if day is not None:
+                total, sessions, total_outliers = days.get(
+                    day, (SessionStats(), 0, 0))
+                total.merge(stats)
+                days[day] = (total, sessions + 1, total_outliers + outliers)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    for day in sorted(days):
+        total, sessions, outliers = days[day]
+        writer.writerow(report_row('day', day, sessions, total, outliers))
+
+    return skipped
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog='laptime report',
+        description='Summarise every recorded session in a directory')
+    parser.add_argument('directory',
+            help='Where to look for session files')
+    parser.add_argument('-o', '--output-file', dest='out', type=str,
+            help='Where to write the report (default: stdout)')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int,
+            help='How many processes to use (default: one per CPU)')
+
+    args = parser.parse_args(argv)
+    paths = find_sessions(args.directory)
+
+    if args.out:
+        with open(args.out, 'w', newline='') as fp:
+            report(paths, fp, processes=args.jobs)
+    else:
+        report(paths, sys.stdout, processes=args.jobs)
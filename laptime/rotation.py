@@ -0,0 +1,225 @@
+"""
+Compressed output files, and splitting long recordings into several
+files so no single one grows without bound.
+
+Compressed files get a sync point every time they're flushed (which the
+`laptime.writer.BackgroundWriter` does after each batch), so if the
+recorder dies halfway through a file everything up to the last flush can
+still be recovered with `read_partial()`.
+"""
+import gzip
+import io
+import os
+import time
+import zlib
+
+from .misc import generate_filename
+from .sinks import FORMATS, Sink, open_sink
+
+
+# Each supported compression scheme and the suffix added to filenames
+COMPRESSION = {
+    'gzip': 'gz',
+    'zstd': 'zst',
+}
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError('zstd compression needs the "zstandard" package')
+    return zstandard
+
+
+def open_output(filename, compression=None, level=None):
+    """
+    Open a file for writing text, optionally compressing it on the fly.
+
+    Parameters
+    ----------
+    filename: str
+        The file to write to.
+    compression: str
+        None, or one of the keys of `COMPRESSION`.
+    level: int
+        The compression level (default: whatever suits streaming).
+
+    Returns
+    -------
+    file-like object
+        A text file. Flushing it ends the current compressed block, so the
+        file can be read up to that point even if it's never closed.
+    """
+    if compression is None:
+        return open(filename, 'w')
+    elif compression == 'gzip':
+        # GzipFile.flush() does a Z_SYNC_FLUSH
+        return gzip.open(filename, 'wt', compresslevel=level or 6)
+    elif compression == 'zstd':
+        zstandard = _zstandard()
+        compressor = zstandard.ZstdCompressor(level=level or 3)
+        # The writer's flush() ends the current block (FLUSH_BLOCK)
+        writer = compressor.stream_writer(open(filename, 'wb'), closefd=True)
+        return io.TextIOWrapper(writer)
+    else:
+        raise ValueError('Unknown compression: {}'.format(compression))
+
+
+def read_partial(filename, compression=None, block_size=1 << 16):
+    """
+    Read back everything which can be recovered from a (possibly truncated)
+    output file.
+
+    Parameters
+    ----------
+    filename: str
+        The file to read.
+    compression: str
+        How it was compressed (default: guess from the file extension).
+
+    Returns
+    -------
+    bytes
+        The decompressed contents, up to the last sync point that made it
+        to disk.
+    """
+    if compression is None:
+        for name, suffix in COMPRESSION.items():
+            if filename.endswith('.' + suffix):
+                compression = name
+
+    if compression is None:
+        with open(filename, 'rb') as fp:
+            return fp.read()
+    elif compression == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif compression == 'zstd':
+        decompressor = _zstandard().ZstdDecompressor().decompressobj()
+    else:
+        raise ValueError('Unknown compression: {}'.format(compression))
+
+    chunks = []
+    with open(filename, 'rb') as fp:
+        for block in iter(lambda: fp.read(block_size), b''):
+            chunks.append(decompressor.decompress(block))
+
+    return b''.join(chunks)
+
+
+class RotatingSink(Sink):
+    """
+    Write laps to a series of files, starting a new one whenever the
+    current file gets too big or too old.
+
+    Each file is named with `laptime.misc.generate_filename()` and is a
+    complete file in its own right (e.g. every csv file has a header).
+    Rotating is just closing one sink and opening another, so when this is
+    run by a `laptime.writer.BackgroundWriter` it happens on the writer's
+    thread and never holds up the serial port.
+
+    Parameters
+    ----------
+    base: str
+        The base name for each file.
+    fmt: str
+        The output format, one of the keys of `laptime.sinks.FORMATS`.
+    gate: bool
+        Whether laps will come from more than one timing gate.
+    compression: str
+        None, or one of the keys of `COMPRESSION`.
+    max_bytes: int
+        Start a new file once the current one is this big on disk.
+    max_seconds: float
+        Start a new file once the current one has been open this long.
+    timestamp_format: str
+        The strftime format used to name each file. It needs seconds in it
+        if files will be rotated more than once a minute.
+    index: bool
+        Keep a seek index alongside each file (plain csv files only).
+    car: int
+        The car being timed, if it's known (sqlite files only).
+
+    Attributes
+    ----------
+    filenames: list of str
+        Every file written so far, the last one being the current file.
+    """
+    def __init__(self, base='track_times', fmt='csv', gate=False,
+                 compression=None, max_bytes=None, max_seconds=None,
+                 timestamp_format='%Y-%m-%d_%H%M%S', index=False, car=None):
+        super().__init__()
+        self.base = base
+        self.fmt = fmt
+        self.gate = gate
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.timestamp_format = timestamp_format
+        self.index = index
+        self.car = car
+
+        self.extension = FORMATS[fmt]
+        if compression is not None:
+            self.extension += '.' + COMPRESSION[compression]
+
+        self.filenames = []
+        self.sink = None
+        self.opened = None
+        self._open()
+
+    def _next_filename(self):
+        filename = generate_filename(self.base, self.timestamp_format,
+                                     self.extension)
+        part = 1
+
+        while os.path.exists(filename):
+            part += 1
+            filename = generate_filename('{}_{}'.format(self.base, part),
+                                         self.timestamp_format,
+                                         self.extension)
+
+        return filename
+
+    def _open(self):
+        filename = self._next_filename()
+        self.sink = open_sink(filename, self.fmt, gate=self.gate,
+                              compression=self.compression, index=self.index,
+                              car=self.car)
+        self.filenames.append(filename)
+        self.opened = time.monotonic()
+
+    def rotate(self):
+        """
+        Close the current file and start a new one.
+        """
+        self.sink.close()
+        self._open()
+
+    def _due(self):
+        if (self.max_seconds is not None
+                and time.monotonic() - self.opened >= self.max_seconds):
+            return True
+
+        if self.max_bytes is not None:
+            current = self.filenames[-1]
+            return os.path.getsize(current) >= self.max_bytes
+
+        return False
+
+    def _write(self, laps):
+        if self._due():
+            self.rotate()
+        self.sink.writerows(laps)
+
+    def _flush(self):
+        self.sink.flush()
+
+    def close(self):
+        super().close()
+        self.sink.close()
+
+    def stats(self):
+        stats = super().stats()
+        stats['files'] = len(self.filenames)
+        return stats
@@ -0,0 +1,384 @@
+"""
+A virtual timing gate for load testing without any hardware.
+
+It creates a pseudo-terminal and plays the part of the arduino on it, so
+the recorder can be pointed at the other end exactly as if it were a real
+serial port::
+
+    $ python -m laptime.simulator --rate 2000 --count 100000
+    Virtual timing gate on /dev/pts/5
+    $ laptime --port /dev/pts/5
+
+Everything goes through the real pyserial and tty code. Events can be sent
+at a steady rate or as fast as the reader will take them, with random jitter,
+bursts, pauses and line noise thrown in, to see how fast `record()` can
+really go. (Linux and other Unixes only, since it needs `pty`.)
+"""
+import os
+import random
+import select
+import sys
+import threading
+import time
+
+from .framing import encode_frame
+
+
+# What line noise turns a byte of text into: anything that stops the line
+# being read as a number. Lines have no checksum, so noise which made one
+# reading look like another could never be spotted by the recorder.
+_TEXT_NOISE = bytes(byte for byte in range(256)
+                    if byte not in b'0123456789+-_ \t\n\r\x0b\x0c')
+
+
+class VirtualGate:
+    """
+    Pretend to be an arduino timing gate on a pseudo-terminal.
+
+    Like the real thing, it sends the arduino's millis reading (how long
+    it's been running) every time the beam is broken. Readings are either
+    lines of text or `laptime.framing` binary frames, and a 0 at the end
+    tells the recorder to stop.
+
+    Parameters
+    ----------
+    rate: float
+        The average number of events per second, or None to send them as
+        fast as they can be read.
+    jitter: float
+        How much each gap between events varies, as a fraction of the
+        average gap (e.g. 0.5 means anything from half to one and a half
+        times as long).
+    burst: float
+        The chance of each event starting a burst of `burst_size` events all
+        sent at once, like an arduino catching up after being busy.
+    burst_size: int
+        How many events are in a burst.
+    corruption: float
+        The chance of each event being hit by line noise (one of its bytes
+        replaced with a random one). The recorder skips (and counts) the
+        garbled lines or frames. In text, the new byte is never a digit,
+        sign or whitespace, since the recorder has no way to tell that a
+        line garbled into another number is wrong.
+    pause_every: float
+        Go quiet every this many seconds, as if the cable was pulled out.
+    pause_for: float
+        How long each pause lasts, in seconds.
+    binary: bool
+        Send binary frames instead of lines of text.
+    gates: int
+        How many timing gates the binary frames come from.
+    seed: int
+        Seed for the random numbers, so a run can be repeated exactly.
+
+    Attributes
+    ----------
+    port: str
+        The name of the serial port to record from, e.g. "/dev/pts/5".
+    """
+    def __init__(self, rate=10.0, jitter=0.0, burst=0.0, burst_size=10,
+                 corruption=0.0, pause_every=None, pause_for=1.0,
+                 binary=False, gates=1, seed=None):
+        import pty
+        import tty
+
+        self.rate = rate
+        self.jitter = jitter
+        self.burst = burst
+        self.burst_size = burst_size
+        self.corruption = corruption
+        self.pause_every = pause_every
+        self.pause_for = pause_for
+        self.binary = binary
+        self.gates = gates
+        self.seed = seed
+
+        self.master, slave = pty.openpty()
+        # No echoing and no newline translation, just the bytes
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        # Until the recorder opens its end, the pty reports a hang-up,
+        # which is how we know when someone's listening
+        os.close(slave)
+        os.set_blocking(self.master, False)
+        self._poll = select.poll()
+        self._poll.register(self.master, select.POLLOUT)
+
+        self.events = 0
+        self.bytes = 0
+        self.corrupted = 0
+        self.max_lag = 0.0
+        self._sequence = 0
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def schedule(self):
+        """
+        Generate every event that will be sent, forever.
+
+        Yields
+        ------
+        tuple
+            `(when, data, corrupted)`, where `when` is how many seconds after
+            starting the event is due, `data` is the bytes to send and
+            `corrupted` says whether they were garbled.
+        """
+        rng = random.Random(self.seed)
+        when = 0.0
+        next_pause = self.pause_every
+        burst_left = 0
+        index = 0
+
+        while True:
+            if burst_left:
+                burst_left -= 1
+            else:
+                if self.rate:
+                    gap = 1 / self.rate
+                    if self.jitter:
+                        gap *= 1 + rng.uniform(-self.jitter, self.jitter)
+                    when += max(gap, 0)
+
+                if next_pause is not None and when >= next_pause:
+                    when += self.pause_for
+                    next_pause = when + self.pause_every
+
+                if self.burst and rng.random() < self.burst:
+                    burst_left = self.burst_size - 1
+
+            # The arduino's clock started a second before we did, so a
+            # reading is never 0 (which means stop). Flat out, pretend each
+            # event took a millisecond.
+            index += 1
+            millis = 1000 + (int(when * 1000) if self.rate else index)
+            gate = rng.randrange(self.gates) if self.gates > 1 else 0
+            data = self._encode(gate, millis)
+
+            corrupted = self.corruption and rng.random() < self.corruption
+            if corrupted:
+                noisy = bytearray(data)
+                noise = (rng.randrange(256) if self.binary
+                         else rng.choice(_TEXT_NOISE))
+                noisy[rng.randrange(len(noisy))] = noise
+                data = bytes(noisy)
+
+            yield when, data, bool(corrupted)
+
+    def _encode(self, gate, millis):
+        if self.binary:
+            data = encode_frame(gate, millis & 0xFFFFFFFF,
+                                self._sequence & 0xFFFF)
+            self._sequence += 1
+            return data
+        return str(millis).encode('ascii') + b'\n'
+
+    def _hung_up(self):
+        return any(event & select.POLLHUP for _, event in self._poll.poll(0))
+
+    def wait_for_reader(self, timeout=None):
+        """
+        Wait until something opens the serial port.
+
+        Returns
+        -------
+        bool
+            False if it timed out (or `stop()` was called) first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while self._hung_up():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            if self._stopping.wait(0.05):
+                return False
+
+        return True
+
+    def _send(self, data):
+        view = memoryview(data)
+        while view:
+            try:
+                written = os.write(self.master, view)
+            except BlockingIOError:
+                # The reader's falling behind, give it a chance to catch up
+                # (unless it's gone away altogether)
+                events = self._poll.poll(100)
+                if self._stopping.is_set() or any(
+                        event & select.POLLHUP for _, event in events):
+                    return False
+                continue
+
+            view = view[written:]
+            self.bytes += written
+
+        return True
+
+    def run(self, count=None, duration=None, stop=True, batch_size=256,
+            wait=True):
+        """
+        Send events until `count` of them have been sent, `duration`
+        seconds have passed or `stop()` is called.
+
+        Events which are due at the same time (or have fallen behind, because
+        the reader isn't keeping up) are sent together in one write. If the
+        reader stops reading, sending waits until it catches up. If it
+        closes the port, sending stops.
+
+        Parameters
+        ----------
+        count: int
+            The most events to send.
+        duration: float
+            The longest to keep sending for, in seconds.
+        stop: bool
+            Finish by sending a 0, which tells the recorder to stop.
+        batch_size: int
+            The most events to send in one go.
+        wait: bool
+            Don't start until something opens the serial port (anything
+            sent before then would be thrown away when it's opened).
+        """
+        if wait and not self.wait_for_reader():
+            return
+
+        start = time.monotonic()
+        pending = []
+
+        for when, data, corrupted in self.schedule():
+            if self._stopping.is_set():
+                break
+            if count is not None and self.events >= count:
+                break
+            if duration is not None and when > duration:
+                break
+
+            now = time.monotonic() - start
+            if when > now:
+                if pending and not self._send(b''.join(pending)):
+                    return
+                pending = []
+                if self._stopping.wait(when - now):
+                    break
+            else:
+                self.max_lag = max(self.max_lag, now - when)
+
+            pending.append(data)
+            self.events += 1
+            self.corrupted += corrupted
+            if len(pending) >= batch_size:
+                if not self._send(b''.join(pending)):
+                    return
+                pending = []
+
+        if pending and not self._send(b''.join(pending)):
+            return
+        if stop:
+            self._send(self._encode(0, 0))
+
+    def start(self, **kwargs):
+        """
+        Send events from a background thread, see `run()`.
+        """
+        self._thread = threading.Thread(target=self.run, kwargs=kwargs,
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop sending events (which still sends the final 0).
+        """
+        self._stopping.set()
+
+    def join(self, timeout=None):
+        """
+        Wait for the background thread to finish sending.
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def close(self):
+        self.stop()
+        self.join()
+        os.close(self.master)
+
+    def stats(self):
+        """
+        What's been sent so far.
+        """
+        return {
+            'events': self.events,
+            'bytes': self.bytes,
+            'corrupted': self.corrupted,
+            'max_lag': self.max_lag,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog='laptime simulate',
+        description=('Pretend to be a timing gate on a pseudo-terminal, for '
+                     'recording from with "laptime --port"'))
+    parser.add_argument('-r', '--rate', dest='rate', type=float, default=10,
+            help=('Events per second, or 0 for as fast as they can be read '
+                  '(default: 10)'))
+    parser.add_argument('--jitter', dest='jitter', type=float, default=0,
+            help='How much the gaps between events vary, as a fraction')
+    parser.add_argument('--burst', dest='burst', type=float, default=0,
+            help='The chance of each event starting a burst')
+    parser.add_argument('--burst-size', dest='burst_size', type=int,
+            default=10, help='How many events are in a burst (default: 10)')
+    parser.add_argument('--corrupt', dest='corruption', type=float,
+            default=0,
+            help='The chance of each event being garbled by line noise')
+    parser.add_argument('--pause-every', dest='pause_every', type=float,
+            help='Go quiet every this many seconds')
+    parser.add_argument('--pause-for', dest='pause_for', type=float,
+            default=1, help='How long each pause lasts (default: 1 second)')
+    parser.add_argument('-b', '--binary', dest='binary', action='store_true',
+            help='Send binary frames instead of lines of text')
+    parser.add_argument('-g', '--gates', dest='gates', type=int, default=1,
+            help='How many timing gates send binary frames (default: 1)')
+    parser.add_argument('-n', '--count', dest='count', type=int,
+            help='Stop after this many events')
+    parser.add_argument('-d', '--duration', dest='duration', type=float,
+            help='Stop after this many seconds')
+    parser.add_argument('--seed', dest='seed', type=int,
+            help='Seed the random numbers, to repeat a run exactly')
+
+    args = parser.parse_args(argv)
+
+    gate = VirtualGate(rate=args.rate or None, jitter=args.jitter,
+                       burst=args.burst, burst_size=args.burst_size,
+                       corruption=args.corruption,
+                       pause_every=args.pause_every, pause_for=args.pause_for,
+                       binary=args.binary, gates=args.gates, seed=args.seed)
+
+    with gate:
+        print('Virtual timing gate on {}'.format(gate.port), flush=True)
+        print('Waiting for a reader...', file=sys.stderr)
+        try:
+            gate.run(count=args.count, duration=args.duration)
+
+            # Closing the pty would throw away anything not read yet, so
+            # give the recorder time to finish up and close its end first
+            while not gate._hung_up():
+                time.sleep(0.1)
+        except KeyboardInterrupt:
+            pass
+
+        stats = gate.stats()
+        print('Sent {events} events ({bytes} bytes, {corrupted} corrupted), '
+              'at most {max_lag:.3f}s behind'.format(**stats),
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+The base class every sink builds on, see `laptime.sinks`.
+
+This is kept apart from the sinks themselves so the offline tools can
+build on it without importing `laptime.writer` and its thread.
+"""
+import abc
+import time
+
+
+class Sink(abc.ABC):
+    """
+    The base class for all sinks, which keeps track of how many laps were
+    written and how long writing (and flushing) took.
+
+    Subclasses should override `_write()` and, if they buffer anything,
+    `_flush()`.
+    """
+    def __init__(self):
+        self.laps_written = 0
+        self.write_time = 0.0
+        # A laptime.latency.SinkLatency, when something is watching
+        self.latency = None
+
+    def writerow(self, lap):
+        self.writerows([lap])
+
+    def writerows(self, laps):
+        start = time.perf_counter()
+        self._write(laps)
+        self.write_time += time.perf_counter() - start
+        self.laps_written += len(laps)
+
+        latency = self.latency
+        if latency is not None:
+            # Only every so often, see laptime.latency
+            latency.countdown -= len(laps)
+            if latency.countdown <= 0:
+                latency.on_write(laps)
+
+    def flush(self):
+        start = time.perf_counter()
+        self._flush()
+        self.write_time += time.perf_counter() - start
+
+        if self.latency is not None:
+            self.latency.on_flush()
+
+    def close(self):
+        self.flush()
+
+    @abc.abstractmethod
+    def _write(self, laps):
+        """
+        Write a batch of laps.
+        """
+
+    def _flush(self):
+        pass
+
+    def stats(self):
+        """
+        How much work the sink has done.
+        """
+        return {
+            'laps_written': self.laps_written,
+            'write_time': self.write_time,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
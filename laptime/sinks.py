@@ -0,0 +1,296 @@
+"""
+Places recorded laps can be written to.
+
+Every sink has the same interface:
+
+* `writerows(laps)` writes a batch of `laptime.laps.Lap` objects (and
+  `writerow(lap)` writes just the one)
+* `flush()` pushes anything buffered out to its destination
+* `close()` flushes and releases whatever the sink is holding on to
+
+which matches the `csv.writer` style interface used by
+`laptime.writer.BackgroundWriter`, so any sink can be moved onto a
+background thread. Use a `Tee` to send laps to several sinks at once.
+"""
+import csv
+import json
+import logging
+
+from .laps import HEADER, MULTI_HEADER
+from .sink import Sink
+from .writer import BackgroundWriter
+
+
+class CSVSink(Sink):
+    """
+    Write laps as rows of a csv file (see `laptime.laps.HEADER`).
+
+    Parameters
+    ----------
+    fp: file-like object
+        An object that behaves like a file (i.e. has a read() and write()
+        method). Most commonly created with `open(some_filename, 'w')`.
+    gate: bool
+        Add a "Gate" column saying which timing gate each lap came from.
+    write_header: bool
+        Write the csv header straight away.
+    index: laptime.index.IndexWriter
+        Keep a seek index for the file as it's written.
+    """
+    def __init__(self, fp, gate=False, write_header=True, index=None):
+        super().__init__()
+        self.fp = fp
+        self.gate = gate
+        self.header = MULTI_HEADER if gate else HEADER
+        self.writer = csv.writer(fp)
+        self.index = index
+
+        if write_header:
+            self.writer.writerow(self.header)
+
+    def _rows(self, laps):
+        if self.gate:
+            return [lap.row() + [lap.gate] for lap in laps]
+        return [lap.row() for lap in laps]
+
+    def _write(self, laps):
+        # Every row is made before any are written, so a lap which can't be
+        # written (e.g. a negative laptime) leaves the file untouched
+        rows = self._rows(laps)
+        if self.index is None:
+            self.writer.writerows(rows)
+            return
+
+        # Write the rows in runs, noting where each indexed row starts
+        lap_number = self.laps_written
+        run = 0
+
+        for i, lap in enumerate(laps):
+            if self.index.wants(lap_number + i):
+                self.writer.writerows(rows[run:i])
+                self.index.add(lap_number + i, lap.timestamp, self.fp.tell())
+                run = i
+
+        self.writer.writerows(rows[run:])
+
+    def _flush(self):
+        self.fp.flush()
+        if self.index is not None:
+            self.index.flush()
+
+    def close(self):
+        super().close()
+        self.fp.close()
+        if self.index is not None:
+            self.index.close()
+
+
+class JSONLinesSink(Sink):
+    """
+    Write each lap as a JSON object on its own line.
+
+    Parameters
+    ----------
+    fp: file-like object
+        A file opened for writing text.
+    """
+    def __init__(self, fp):
+        super().__init__()
+        self.fp = fp
+
+    def _write(self, laps):
+        self.fp.writelines(json.dumps(lap._asdict()) + '\n' for lap in laps)
+
+    def _flush(self):
+        self.fp.flush()
+
+    def close(self):
+        super().close()
+        self.fp.close()
+
+
+# The output formats which can be picked from the command line, and the file
+# extension each one uses
+FORMATS = {
+    'csv': 'csv',
+    'jsonl': 'jsonl',
+    'columnar': 'laps',
+    'sqlite': 'db',
+}
+
+
+def open_sink(filename, fmt='csv', gate=False, compression=None,
+              index=False, car=None):
+    """
+    Create a sink which writes to a new file.
+
+    Parameters
+    ----------
+    filename: str
+        The file to write to.
+    fmt: str
+        One of the keys of `FORMATS`.
+    gate: bool
+        Whether laps will come from more than one timing gate.
+    compression: str
+        Compress the file as it's written, see `laptime.rotation.COMPRESSION`
+        (text formats only).
+    index: bool
+        Keep a seek index alongside the file, see `laptime.index` (plain
+        csv files only).
+    car: int
+        The car being timed, if it's known (only saved by the sqlite
+        format).
+
+    Returns
+    -------
+    Sink
+        The new sink, which owns (and will close) the file.
+    """
+    # The other modules are imported here because they build on this one
+    if index and (fmt != 'csv' or compression is not None):
+        raise ValueError('Only plain csv files can be indexed')
+
+    if fmt in ('csv', 'jsonl'):
+        from .rotation import open_output
+        fp = open_output(filename, compression)
+        if fmt == 'jsonl':
+            return JSONLinesSink(fp)
+        elif index:
+            from .index import IndexWriter, index_filename
+            index = IndexWriter(open(index_filename(filename), 'wb'))
+            return CSVSink(fp, gate=gate, index=index)
+        return CSVSink(fp, gate=gate)
+
+    if compression is not None:
+        raise ValueError("The {} format can't be compressed".format(fmt))
+
+    if fmt == 'columnar':
+        from .columnar import ColumnarSink
+        return ColumnarSink(open(filename, 'w+b'), gate=gate)
+    elif fmt == 'sqlite':
+        from .database import SQLiteSink
+        return SQLiteSink(filename, gate=gate, car=car)
+    else:
+        raise ValueError('Unknown output format: {}'.format(fmt))
+
+
+class Tee:
+    """
+    Send every lap to several sinks.
+
+    Each sink gets its own `laptime.writer.BackgroundWriter`, so a slow sink
+    only ever holds up itself until its queue fills up. After that, laps
+    wait for room in its queue, unless the sink is one of the `lossy` ones,
+    whose laps are dropped (and counted) instead of holding up anything
+    else.
+
+    If a sink fails, the error is logged and that sink gets no more laps,
+    but the others carry on. The errors are raised by `close()` (or straight
+    away, if every sink has failed).
+
+    Parameters
+    ----------
+    sinks: list of Sink
+        Where laps should be sent.
+    lossy: list of Sink
+        Sinks which may lose laps when they can't keep up, e.g. a live
+        display. Everything else is sent every lap.
+    **kwargs
+        Passed on to each `BackgroundWriter` (e.g. `max_queue`,
+        `batch_size`, `batch_interval`).
+
+    Attributes
+    ----------
+    errors: list of tuple
+        A `(sink, error)` for every sink which has failed.
+    """
+    def __init__(self, sinks, lossy=(), **kwargs):
+        self.sinks = list(sinks)
+        self.writers = [BackgroundWriter(sink, flush=sink.flush,
+                                         block=not any(sink is other
+                                                       for other in lossy),
+                                         **kwargs)
+                        for sink in self.sinks]
+        # The writers whose sinks haven't failed
+        self.active = list(self.writers)
+        self.errors = []
+
+        for writer in self.writers:
+            writer.start()
+
+    def _failed(self, writer, error):
+        sink = writer.writer
+        logging.getLogger(__name__).error(
+            'Stopped writing to %s: %s', type(sink).__name__, error)
+        self.errors.append((sink, error))
+        self.active = [other for other in self.active if other is not writer]
+
+        if not self.active:
+            raise error
+
+    def writerow(self, lap):
+        for writer in self.active:
+            try:
+                writer.writerow(lap)
+            except Exception as e:
+                self._failed(writer, e)
+
+    def writerows(self, laps):
+        for writer in self.active:
+            try:
+                writer.writerows(laps)
+            except Exception as e:
+                self._failed(writer, e)
+
+    def flush(self):
+        # Each sink is flushed by its writer after every batch
+        pass
+
+    def close(self):
+        """
+        Write out everything still queued for each sink, then close them.
+
+        Raises
+        ------
+        Exception
+            The first error from any of the sinks, if there were any.
+        """
+        errors = [error for _, error in self.errors]
+
+        for writer, sink in zip(self.writers, self.sinks):
+            failed = writer not in self.active
+            try:
+                # A failed sink's error has already been dealt with
+                writer.stop(raise_error=not failed)
+            except Exception as e:
+                errors.append(e)
+
+            try:
+                sink.close()
+            except Exception as e:
+                if not failed:
+                    errors.append(e)
+
+        if errors:
+            raise errors[0]
+
+    def stats(self):
+        """
+        The stats for each sink (plus its queue), keyed by the sink's class
+        name and position.
+        """
+        stats = {}
+
+        for i, (writer, sink) in enumerate(zip(self.writers, self.sinks)):
+            name = '{}_{}'.format(type(sink).__name__, i)
+            stats[name] = dict(sink.stats(), **writer.stats())
+            stats[name]['failed'] = writer not in self.active
+
+        return stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,258 @@
+"""
+Running statistics for a session, updated as each lap comes in rather than
+by re-reading the whole file.
+"""
+from collections import namedtuple
+import math
+import threading
+
+from .sink import Sink
+
+
+class QuantileSketch:
+    """
+    Estimate quantiles of a stream of positive numbers in bounded memory.
+
+    Values are counted in logarithmically sized buckets, so any quantile is
+    accurate to within `relative_accuracy` of the true value (e.g. 1% of a
+    90 second lap is under a second) no matter how many values there are.
+    Laptimes from 1ms up to an hour need fewer than 800 buckets at 1%, and
+    once there are more than `max_buckets` the smallest buckets are merged
+    together, which only costs accuracy at the very bottom end.
+
+    Parameters
+    ----------
+    relative_accuracy: float
+        How close estimates are to the real value, relative to its size.
+    max_buckets: int
+        The most buckets to keep.
+    """
+    def __init__(self, relative_accuracy=0.01, max_buckets=2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._multiplier = 1 / math.log(self.gamma)
+
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+        self._keys = None
+
+    def add(self, value, count=1):
+        if value <= 0:
+            self.zeros += count
+        else:
+            key = math.ceil(math.log(value) * self._multiplier)
+            buckets = self.buckets
+
+            if key in buckets:
+                buckets[key] += count
+            else:
+                buckets[key] = count
+                self._keys = None
+                if len(buckets) > self.max_buckets:
+                    self._collapse()
+
+        self.count += count
+
+    def _collapse(self):
+        keys = sorted(self.buckets)
+        excess = len(keys) - self.max_buckets
+        lowest = keys[excess]
+
+        for key in keys[:excess]:
+            self.buckets[lowest] += self.buckets.pop(key)
+
+    def merge(self, other):
+        """
+        Add everything counted by another sketch (with the same accuracy)
+        to this one.
+        """
+        if other.gamma != self.gamma:
+            raise ValueError("Can't merge sketches with different accuracies")
+
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        self._keys = None
+
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def quantile(self, q):
+        """
+        Estimate the value below which a fraction `q` of the values fall,
+        e.g. 0.5 for the median. Returns None when nothing has been added.
+        """
+        if not self.count:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0
+
+        if self._keys is None:
+            self._keys = sorted(self.buckets)
+
+        for key in self._keys:
+            seen += self.buckets[key]
+            if rank < seen:
+                break
+
+        # The middle of the bucket, in relative terms
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def __len__(self):
+        return self.count
+
+
+Snapshot = namedtuple('Snapshot', ['count', 'best', 'worst', 'last', 'mean',
+                                   'variance', 'stdev', 'median', 'p90'])
+
+
+class SessionStats(Sink):
+    """
+    Keep track of a session's laptimes as they arrive.
+
+    Every lap updates the count, best, worst, mean and variance (using
+    Welford's algorithm) in constant time, and adds the laptime to a
+    `QuantileSketch` for the median and other percentiles. Nothing is ever
+    recomputed from scratch.
+
+    This is a `laptime.sinks.Sink`, so it can be handed to `record()` (or
+    put in a `laptime.sinks.Tee` next to a file) to see every lap as it's
+    recorded. It's safe to call `snapshot()` from another thread while laps
+    are being added.
+
+    Parameters
+    ----------
+    relative_accuracy: float
+        How accurate the median and other percentiles should be, see
+        `QuantileSketch`.
+    """
+    def __init__(self, relative_accuracy=0.01):
+        super().__init__()
+        self.sketch = QuantileSketch(relative_accuracy)
+        self.count = 0
+        self.best = None
+        self.worst = None
+        self.last = None
+        self.mean = 0.0
+        self._m2 = 0.0
+
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def _write(self, laps):
+        self.update_many(lap.laptime for lap in laps)
+
+    def update(self, laptime):
+        """
+        Add a single laptime, in milliseconds.
+        """
+        with self._lock:
+            self._update(laptime)
+
+    def update_many(self, laptimes):
+        """
+        Add several laptimes at once (e.g. a column from `laptime.load()`).
+        """
+        with self._lock:
+            for laptime in laptimes:
+                self._update(laptime)
+
+    def _update(self, laptime):
+        self.count += 1
+        delta = laptime - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (laptime - self.mean)
+
+        if self.best is None or laptime < self.best:
+            self.best = laptime
+        if self.worst is None or laptime > self.worst:
+            self.worst = laptime
+        self.last = laptime
+
+        self.sketch.add(laptime)
+        self._snapshot = None
+
+    def merge(self, other):
+        """
+        Add the laps counted by another `SessionStats` to this one (e.g. to
+        combine several sessions), as if they'd been added here after this
+        object's own laps.
+        """
+        with self._lock:
+            count = self.count + other.count
+            if not other.count:
+                return
+
+            delta = other.mean - self.mean
+            self.mean += delta * other.count / count
+            self._m2 += other._m2 + delta**2 * self.count * other.count / count
+            self.count = count
+
+            if self.best is None or other.best < self.best:
+                self.best = other.best
+            if self.worst is None or other.worst > self.worst:
+                self.worst = other.worst
+            self.last = other.last
+
+            self.sketch.merge(other.sketch)
+            self._snapshot = None
+
+    def __getstate__(self):
+        # Locks can't be pickled (e.g. to send stats between processes)
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def variance(self):
+        """
+        The sample variance of the laptimes (0 with fewer than two laps).
+        """
+        if self.count < 2:
+            return 0.0
+        return self._m2 / (self.count - 1)
+
+    def quantile(self, q):
+        """
+        Estimate a percentile of the laptimes, e.g. 0.9 for the 90th.
+        """
+        with self._lock:
+            return self.sketch.quantile(q)
+
+    def snapshot(self):
+        """
+        The current statistics, as a `Snapshot`.
+
+        The snapshot is only worked out again after a new lap arrives, so
+        this can be called as often as a display likes.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+
+        with self._lock:
+            variance = self.variance
+            snapshot = Snapshot(
+                count=self.count,
+                best=self.best,
+                worst=self.worst,
+                last=self.last,
+                mean=self.mean if self.count else None,
+                variance=variance,
+                stdev=math.sqrt(variance),
+                median=self.sketch.quantile(0.5),
+                p90=self.sketch.quantile(0.9),
+            )
+            self._snapshot = snapshot
+
+        return snapshot
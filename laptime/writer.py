@@ -0,0 +1,202 @@
+"""
+Move writing results out of the serial reading loop, so a slow disk or
+network share can't delay the next read.
+"""
+import logging
+import queue
+import threading
+import time
+
+
+# Put on the queue to tell the writer thread to finish up
+_STOP = object()
+
+
+class BackgroundWriter:
+    """
+    Write rows on a background thread, fed through a bounded queue.
+
+    Rows are collected into batches and handed to the underlying writer
+    with a single `writerows()` call once a batch has `batch_size` rows in
+    it, or its oldest row has been waiting for `batch_interval` seconds,
+    whichever comes first.
+
+    This has the same `writerow()`/`writerows()` methods as a `csv.writer`,
+    so it can be used as a drop-in replacement for one.
+
+    Parameters
+    ----------
+    writer: csv.writer
+        Anything with a `writerows()` method.
+    flush: callable
+        Called after each batch is written (e.g. `fp.flush`).
+    max_queue: int
+        The most rows which can be waiting to be written. Once the queue is
+        full, `writerow()` will block until the writer catches up (or drop
+        the row, see `block`).
+    batch_size: int
+        The most rows written in one go.
+    batch_interval: float
+        The longest a row may wait, in seconds, before its batch is written.
+    block: bool
+        Whether `writerow()` should wait for room when the queue is full.
+        If not, the row is thrown away and counted in `dropped` so a writer
+        which can't keep up never holds up the caller.
+    """
+    def __init__(self, writer, flush=None, max_queue=10000, batch_size=256,
+                 batch_interval=0.5, block=True):
+        self.writer = writer
+        self.flush = flush
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.block = block
+
+        self.high_water = 0
+        self.dropped = 0
+        self.rows_written = 0
+        self.batches_written = 0
+        self.error = None
+        self.thread = None
+
+    @property
+    def depth(self):
+        """
+        The number of rows currently waiting to be written.
+        """
+        return self.queue.qsize()
+
+    def stats(self):
+        """
+        A snapshot of how the writer is doing.
+        """
+        return {
+            'depth': self.depth,
+            'high_water': self.high_water,
+            'rows_written': self.rows_written,
+            'batches_written': self.batches_written,
+            'dropped': self.dropped,
+        }
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run,
+                                           name='laptime-writer',
+                                           daemon=True)
+            self.thread.start()
+
+    def stop(self, raise_error=True):
+        """
+        Write out everything which is still queued, then stop the thread.
+
+        Parameters
+        ----------
+        raise_error: bool
+            Re-raise whatever went wrong on the writer thread. Pass False
+            while handling some other error, so it isn't replaced by this
+            one (which has already been logged).
+
+        Raises
+        ------
+        Exception
+            Whatever went wrong on the writer thread, if anything did.
+        """
+        if self.thread is not None:
+            self.queue.put(_STOP)
+            self.thread.join()
+            self.thread = None
+
+        if raise_error:
+            self._check()
+        else:
+            self.error = None
+
+    def writerow(self, row):
+        self._check()
+
+        try:
+            self.queue.put(row, block=self.block)
+        except queue.Full:
+            self.dropped += 1
+            return
+
+        depth = self.queue.qsize()
+        if depth > self.high_water:
+            self.high_water = depth
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def _check(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _run(self):
+        batch = []
+        deadline = None
+
+        while True:
+            timeout = None
+            if deadline is not None:
+                timeout = max(0, deadline - time.monotonic())
+
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                break
+            elif item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.batch_interval
+
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._write(batch)
+                batch = []
+                deadline = None
+
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            self.writer.writerows(batch)
+            written = len(batch)
+        except Exception:
+            # Go through the batch a row at a time, so one bad row (e.g. a
+            # negative laptime after the arduino resets) doesn't take the
+            # rest of the batch with it
+            written = 0
+            for row in batch:
+                try:
+                    self.writer.writerows([row])
+                    written += 1
+                except Exception as e:
+                    error = e
+            if written < len(batch):
+                self._failed(error, 'Dropped %d of %d rows: %s',
+                             len(batch) - written, len(batch))
+
+        try:
+            if self.flush is not None:
+                self.flush()
+        except Exception as e:
+            self._failed(e, 'Failed to flush %d rows: %s', written)
+        else:
+            self.rows_written += written
+            self.batches_written += 1
+
+    def _failed(self, error, message, *args):
+        logging.getLogger(__name__).error(message, *(args + (error,)))
+        self.error = error
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -19,6 +19,8 @@ def setup_package():
     setup(setup_requires=['six', 'pyscaffold>=2.5a0,<2.6a0'] + sphinx,
           version=versioneer.get_version(),
           cmdclass=versioneer.get_cmdclass(),
+          # time.monotonic_ns(), module __getattr__, asyncio.run(), ...
+          python_requires='>=3.7',
           use_pyscaffold=True)
 
 
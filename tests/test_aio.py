@@ -0,0 +1,90 @@
+import asyncio
+import csv
+from io import StringIO
+import os
+
+import pytest
+from serial import Serial
+
+from laptime.aio import AsyncRecorder, record_async
+from laptime.reader import record
+
+
+@pytest.fixture
+def pty(request):
+    """
+    A pseudo-terminal standing in for the arduino. Bytes written to the
+    master end can be read from the serial port opened on the slave end.
+    """
+    master, slave = os.openpty()
+    ser = Serial(os.ttyname(slave), baudrate=19600, timeout=1)
+
+    def cleanup():
+        ser.close()
+        os.close(master)
+        os.close(slave)
+
+    request.addfinalizer(cleanup)
+    return master, ser
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, timeout=5))
+
+
+class TestAsyncRecorder:
+    def test_laps_are_delivered(self, pty):
+        master, ser = pty
+        os.write(master, b'1000\n2500\n')
+
+        async def collect():
+            laps = []
+            async for lap in AsyncRecorder(ser):
+                laps.append(lap)
+                if len(laps) == 2:
+                    os.write(master, b'4000\n0\n')
+            return laps
+
+        laps = run(collect())
+        assert [(lap.millis, lap.laptime) for lap in laps] == [
+            (1000, 1000), (2500, 1500), (4000, 1500)]
+
+    def test_invalid_messages_are_skipped(self, pty):
+        master, ser = pty
+        os.write(master, b'1000\nfoo\n2500\n0\n')
+        recorder = AsyncRecorder(ser)
+
+        async def collect():
+            return [lap.millis async for lap in recorder]
+
+        assert run(collect()) == [1000, 2500]
+        assert recorder.parse_errors == 1
+
+    def test_stop(self, pty):
+        master, ser = pty
+
+        async def collect():
+            recorder = AsyncRecorder(ser)
+            async with recorder:
+                asyncio.get_event_loop().call_later(0.01, recorder.stop)
+                return [lap async for lap in recorder]
+
+        assert run(collect()) == []
+
+    def test_same_rows_as_record(self, pty):
+        master, ser = pty
+        data = b'123\n45678\n99999\n0\n'
+
+        os.write(master, data)
+        sync_fp = StringIO()
+        record(ser, sync_fp)
+
+        os.write(master, data)
+        async_fp = StringIO()
+        run(record_async(ser, async_fp))
+
+        # Everything except the timestamps should match
+        sync_rows = [row[1:] for row in csv.reader(StringIO(sync_fp.getvalue()))]
+        async_rows = [row[1:] for row in csv.reader(StringIO(async_fp.getvalue()))]
+        assert len(sync_rows) == 4
+        assert sync_rows == async_rows
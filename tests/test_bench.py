@@ -0,0 +1,142 @@
+from collections import OrderedDict
+import io
+import sys
+
+import pytest
+
+from laptime import bench
+from laptime.bench import (ChunkedStream, compare, direction, frame_stream,
+                           load_baseline, millis_stream, save_baseline)
+from laptime.reader import record
+
+
+def test_streams_are_seeded():
+    assert millis_stream(100) == millis_stream(100)
+    assert millis_stream(100) != millis_stream(100, seed=1)
+    assert frame_stream(100) == frame_stream(100)
+
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_record_from_a_chunked_stream(binary):
+    data = frame_stream(500) if binary else millis_stream(500)
+    fp = io.StringIO()
+
+    record(ChunkedStream(data, 64), fp, binary=binary)
+
+    assert len(fp.getvalue().splitlines()) == 501
+
+
+def test_readline():
+    stream = ChunkedStream(b'12\n345\n6')
+
+    assert stream.in_waiting == 8
+    assert [stream.readline() for _ in range(4)] == [b'12\n', b'345\n',
+                                                     b'6', b'']
+    assert stream.in_waiting == 0
+
+
+@pytest.mark.parametrize('measurement, better', [
+    ('events_per_sec', 1),
+    ('rows_per_sec_load', 1),
+    ('speedup_array', 1),
+    ('us_per_row', -1),
+    ('batch_ms', -1),
+    ('cpu_percent', -1),
+    ('laptime_budget_ms', 0),
+    ('laps', 0),
+    ('ascii_bytes_per_event', 0),
+])
+def test_direction(measurement, better):
+    assert direction(measurement) == better
+
+
+def test_compare():
+    baseline = {'thing': {'events_per_sec': 1000, 'batch_ms': 10, 'laps': 5},
+                'gone': {'events_per_sec': 1}}
+    results = {'thing': {'events_per_sec': 850, 'batch_ms': 10.5,
+                         'laps': 50},
+               'new': {'events_per_sec': 1}}
+
+    comparisons = compare(results, baseline, threshold=0.1)
+
+    assert [(c.measurement, c.regressed) for c in comparisons] == [
+        ('events_per_sec', True), ('batch_ms', False)]
+    assert not any(c.regressed
+                   for c in compare(results, baseline, threshold=0.2))
+
+
+def test_compare_with_a_zero_baseline():
+    baseline = {'thing': {'overhead_ms': 0, 'lag_ms': -2,
+                          'events_per_sec': 0}}
+    results = {'thing': {'overhead_ms': 5, 'lag_ms': 3,
+                         'events_per_sec': 100}}
+
+    comparisons = compare(results, baseline, threshold=0.1)
+
+    assert [(c.measurement, c.regressed) for c in comparisons] == [
+        ('overhead_ms', False), ('lag_ms', False), ('events_per_sec', False)]
+
+
+def test_percentages_are_compared_in_points():
+    baseline = {'latency': {'ascii_overhead_percent': 0.5,
+                            'binary_overhead_percent': -1.0}}
+    results = {'latency': {'ascii_overhead_percent': 4.0,
+                           'binary_overhead_percent': 12.0}}
+
+    comparisons = compare(results, baseline, threshold=0.1)
+
+    assert [(c.measurement, c.regressed) for c in comparisons] == [
+        ('ascii_overhead_percent', False), ('binary_overhead_percent', True)]
+
+
+def test_baseline_round_trip(tmpdir):
+    filename = str(tmpdir.join('baseline.json'))
+    results = OrderedDict([('thing', OrderedDict([('events_per_sec', 1.5)]))])
+
+    save_baseline(filename, results)
+
+    assert load_baseline(filename) == results
+
+
+def test_main_flags_regressions(tmpdir, monkeypatch, capsys):
+    filename = str(tmpdir.join('baseline.json'))
+    speed = {'events_per_sec': 1000}
+    monkeypatch.setattr(bench, 'BENCHMARKS',
+                        OrderedDict([('fake', lambda: dict(speed))]))
+
+    assert bench.main(['--save', filename]) == 0
+    assert bench.main(['--compare', filename]) == 0
+
+    speed['events_per_sec'] = 800
+    assert bench.main(['--compare', filename]) == 1
+    assert bench.main(['--compare', filename, '--threshold', '0.5']) == 0
+    assert 'REGRESSION' in capsys.readouterr().out
+
+
+def test_benchmarks_without_their_modules_are_skipped(monkeypatch, capsys):
+    monkeypatch.setitem(sys.modules, 'numpy', None)
+    monkeypatch.setattr(bench, 'BENCHMARKS', OrderedDict([
+        ('fake', lambda: {'events_per_sec': 1000}),
+        ('human_readable', bench.BENCHMARKS['human_readable']),
+    ]))
+
+    assert bench.missing('human_readable') == ['numpy']
+    assert bench.main([]) == 0
+
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == 'fake'
+    assert lines[-1] == 'Skipped human_readable: needs numpy'
+
+
+def test_main_prints_na_against_a_zero_baseline(tmpdir, monkeypatch, capsys):
+    filename = str(tmpdir.join('baseline.json'))
+    result = {'overhead_ms': 0.0}
+    monkeypatch.setattr(bench, 'BENCHMARKS',
+                        OrderedDict([('fake', lambda: dict(result))]))
+
+    assert bench.main(['--save', filename]) == 0
+    result['overhead_ms'] = 1.5
+    assert bench.main(['--compare', filename]) == 0
+
+    line = capsys.readouterr().out.splitlines()[-1]
+    assert line.split()[1:] == ['1.5', '0.0', 'n/a']
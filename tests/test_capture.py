@@ -0,0 +1,170 @@
+import csv
+from io import BytesIO, StringIO
+import time
+
+import pytest
+
+from laptime.capture import (CaptureWriter, CapturingSerial, ReplaySerial,
+                             capture_channels, read_capture, MAGIC)
+from laptime.reader import record, Recorder
+
+
+class ScriptedSerial:
+    def __init__(self, lines):
+        self.lines = list(lines)
+        self.is_open = True
+        self.timeout = None
+
+    def readline(self):
+        return self.lines.pop(0) if self.lines else b''
+
+
+def make_capture(chunks, interval=1000000):
+    fp = BytesIO()
+    capture = CaptureWriter(fp)
+    for i, chunk in enumerate(chunks):
+        capture.write(chunk, timestamp=i*interval)
+    fp.seek(0)
+    return fp
+
+
+class TestCaptureFile:
+    def test_round_trip(self):
+        fp = BytesIO()
+        capture = CaptureWriter(fp)
+        capture.write(b'123\n', channel=0, timestamp=10)
+        capture.write(b'45', channel=3, timestamp=20)
+
+        fp.seek(0)
+        assert list(read_capture(fp)) == [(10, 0, b'123\n'), (20, 3, b'45')]
+
+    def test_appending_doesnt_rewrite_the_header(self, tmp_path):
+        filename = str(tmp_path / 'capture.bin')
+        for chunk in [b'1\n', b'2\n']:
+            with open(filename, 'ab') as fp:
+                CaptureWriter(fp).write(chunk)
+
+        with open(filename, 'rb') as fp:
+            assert [c for _, _, c in read_capture(fp)] == [b'1\n', b'2\n']
+
+    def test_truncated_record_is_ignored(self):
+        fp = make_capture([b'100\n', b'200\n'])
+        truncated = BytesIO(fp.getvalue()[:-2])
+        assert [c for _, _, c in read_capture(truncated)] == [b'100\n']
+
+    def test_small_blocks(self):
+        fp = make_capture([b'100\n', b'200\n', b'300\n'])
+        got = [c for _, _, c in read_capture(fp, block_size=5)]
+        assert got == [b'100\n', b'200\n', b'300\n']
+
+    def test_not_a_capture(self):
+        with pytest.raises(ValueError):
+            list(read_capture(BytesIO(b'Timestamp,Millis\n')))
+
+    def test_capturing_serial(self):
+        fp = BytesIO()
+        ser = CapturingSerial(ScriptedSerial([b'100\n', b'250\n']),
+                              CaptureWriter(fp), channel=2)
+        ser.timeout = 5
+
+        assert ser.readline() == b'100\n'
+        assert ser.readline() == b'250\n'
+        assert ser.is_open
+        assert ser.ser.timeout == 5
+
+        fp.seek(0)
+        assert [(ch, c) for _, ch, c in read_capture(fp)] == [
+            (2, b'100\n'), (2, b'250\n')]
+
+
+class TestReplaySerial:
+    def test_record_gives_the_same_rows(self):
+        lines = [b'100\n', b'250\n', b'400\n']
+        original = StringIO()
+        capture = BytesIO()
+        ser = CapturingSerial(ScriptedSerial(lines), CaptureWriter(capture))
+        record(ser, original)
+
+        capture.seek(0)
+        replayed = StringIO()
+        record(ReplaySerial(capture), replayed)
+
+        def rows(fp):
+            return [row[1:] for row in csv.reader(StringIO(fp.getvalue()))]
+
+        assert len(rows(original)) == 4
+        assert rows(replayed) == rows(original)
+
+    def test_chunks_are_reframed(self):
+        ser = ReplaySerial(make_capture([b'10', b'0\n20', b'0\n']))
+        assert ser.readline() == b'100\n'
+        assert ser.readline() == b'200\n'
+        assert ser.readline() == b''
+
+    def test_only_the_requested_channel(self):
+        fp = BytesIO()
+        capture = CaptureWriter(fp)
+        capture.write(b'1\n', channel=0)
+        capture.write(b'2\n', channel=1)
+        fp.seek(0)
+
+        assert ReplaySerial(fp, channel=1).read(10) == b'2\n'
+
+    def test_recorder_can_replay(self, tmp_path):
+        ser = ReplaySerial(make_capture([b'100\n200\n', b'300\n']))
+        recorder = Recorder(ser, StringIO(),
+                            log_file=str(tmp_path / 'timer.log'))
+
+        got = []
+        for message in recorder.get_millis():
+            got.append(message)
+            if len(got) == 3:
+                recorder.stop()
+
+        assert got == [b'100', b'200', b'300']
+
+    def test_real_time_pacing(self):
+        # 3 chunks 20ms apart, replayed at double speed
+        fp = make_capture([b'1\n', b'2\n', b'3\n'], interval=20*1000*1000)
+        ser = ReplaySerial(fp, speed=2)
+
+        start = time.monotonic()
+        lines = [ser.readline() for _ in range(3)]
+        duration = time.monotonic() - start
+
+        assert lines == [b'1\n', b'2\n', b'3\n']
+        assert 0.015 < duration < 0.2
+
+    def test_non_blocking_reads_wait_for_the_data_to_be_due(self):
+        fp = make_capture([b'1\n', b'2\n'], interval=10*1000*1000*1000)
+        ser = ReplaySerial(fp, speed=1)
+        ser.timeout = 0
+
+        assert ser.read(10) == b'1\n'
+        assert ser.in_waiting == 0
+        assert ser.read(10) == b''
+
+
+def test_capture_channels(tmp_path):
+    filename = tmp_path / 'session.cap'
+    filename.write_bytes(make_capture([b'1\n', b'2\n']).read())
+    with open(str(filename), 'ab') as fp:
+        CaptureWriter(fp).write(b'3\n', channel=2)
+
+    assert capture_channels(str(filename)) == [0, 2]
+
+
+def test_cli_rejects_multi_port_captures(tmp_path, capsys):
+    from laptime.__main__ import main
+
+    filename = str(tmp_path / 'session.cap')
+    with open(filename, 'wb') as fp:
+        capture = CaptureWriter(fp)
+        capture.write(b'1\n', channel=0)
+        capture.write(b'2\n', channel=1)
+
+    with pytest.raises(SystemExit):
+        main(['--replay', filename, '-o', str(tmp_path / 'out')])
+
+    assert 'several serial ports' in capsys.readouterr().err
+    assert not list(tmp_path.glob('out*'))
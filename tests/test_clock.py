@@ -0,0 +1,66 @@
+import csv
+from datetime import datetime
+from io import StringIO
+import time
+from unittest.mock import patch
+
+from laptime.clock import SessionClock, to_datetime, format_timestamp
+from laptime.reader import record, LapTimer
+
+
+class TestSessionClock:
+    def test_anchored_to_the_wall_clock(self):
+        clock = SessionClock()
+        assert abs(clock.now() - time.time_ns()) < 10**9
+
+    def test_explicit_anchor(self):
+        clock = SessionClock(wall_anchor=5000, monotonic_anchor=200)
+        assert clock.from_monotonic(300) == 5100
+
+    def test_unaffected_by_wall_clock_changes(self):
+        clock = SessionClock()
+        before = clock.now()
+
+        # Pretend somebody set the system clock back an hour
+        with patch('time.time_ns', return_value=before - 3600*10**9):
+            after = clock.now()
+
+        assert 0 <= after - before < 10**9
+
+    def test_laps_are_stamped_with_the_clock(self):
+        clock = SessionClock(wall_anchor=10**18, monotonic_anchor=0)
+        timer = LapTimer(clock=clock)
+
+        with patch('time.monotonic_ns', return_value=42):
+            lap = timer.lap(b'1000')
+
+        assert lap.timestamp == 10**18 + 42
+
+
+def test_to_datetime():
+    timestamp = int(datetime(2016, 4, 19, 12, 16, 47).timestamp()) * 10**9
+    timestamp += 123456789
+
+    got = to_datetime(timestamp)
+
+    assert got == datetime(2016, 4, 19, 12, 16, 47, 123456)
+    assert format_timestamp(timestamp, '%H:%M:%S') == '12:16:47'
+
+
+def test_record_writes_integer_timestamps():
+    class Arduino:
+        is_open = True
+        lines = [b'100\n', b'250\n', b'0\n']
+
+        def readline(self):
+            return self.lines.pop(0)
+
+    fp = StringIO()
+    start = time.time_ns()
+    record(Arduino(), fp)
+
+    rows = list(csv.reader(StringIO(fp.getvalue())))[1:]
+    timestamps = [int(row[0]) for row in rows]
+
+    assert len(timestamps) == 2
+    assert start <= timestamps[0] <= timestamps[1] < start + 10**9
@@ -0,0 +1,162 @@
+import csv
+from datetime import datetime
+import struct
+
+import numpy as np
+import pytest
+
+from laptime.columnar import (write_session, read_session, convert_csv,
+                              ColumnarSink, MAGIC_V1, NO_GATE)
+from laptime.laps import Lap, HEADER, MULTI_HEADER
+
+
+@pytest.fixture
+def session_file(tmp_path):
+    filename = str(tmp_path / 'session.laps')
+    with open(filename, 'wb') as fp:
+        write_session(fp, {
+            'timestamp': [10, 20, 30],
+            'millis': [100, 250, 400],
+            'laptime': [100, 150, 150],
+        }, {'track': 'Barbagallo'})
+    return filename
+
+
+class TestSessionFile:
+    def test_round_trip(self, session_file):
+        with read_session(session_file) as session:
+            assert len(session) == 3
+            assert session.metadata['track'] == 'Barbagallo'
+            assert session.metadata['columns'] == ['timestamp', 'millis',
+                                                   'laptime']
+            assert list(session['millis']) == [100, 250, 400]
+            assert session['laptime'].sum() == 400
+
+    def test_columns_are_views_onto_the_file(self, session_file):
+        session = read_session(session_file)
+        millis = session['millis']
+
+        assert isinstance(millis, np.ndarray)
+        assert not millis.flags.owndata
+        assert not millis.flags.writeable
+
+    def test_numpy_columns(self, tmp_path):
+        filename = str(tmp_path / 'numpy.laps')
+        with open(filename, 'wb') as fp:
+            write_session(fp, {'millis': np.arange(1000, dtype=np.int32)})
+
+        assert read_session(filename)['millis'][-1] == 999
+
+    def test_mismatched_columns(self, tmp_path):
+        with open(str(tmp_path / 'bad.laps'), 'wb') as fp:
+            with pytest.raises(ValueError):
+                write_session(fp, {'millis': [1, 2], 'laptime': [1]})
+
+    def test_not_a_session_file(self, tmp_path):
+        filename = tmp_path / 'nope.laps'
+        filename.write_bytes(b'Timestamp,Millis\n')
+
+        with pytest.raises(ValueError):
+            read_session(str(filename))
+
+
+def test_version_1_files(tmp_path):
+    filename = tmp_path / 'old.laps'
+    meta = b'{"columns": ["millis", "laptime"]}'
+    meta += b' ' * (-len(meta) % 8)
+    filename.write_bytes(MAGIC_V1 + struct.pack('<QII', 2, 2, len(meta)) +
+                         meta + struct.pack('<4q', 100, 250, 100, 150))
+
+    with read_session(str(filename)) as session:
+        assert list(session['millis']) == [100, 250]
+        assert list(session['laptime']) == [100, 150]
+
+
+class TestColumnarSink:
+    def test_write(self, tmp_path):
+        filename = str(tmp_path / 'sink.laps')
+        sink = ColumnarSink(open(filename, 'w+b'), gate=True)
+        sink.writerows([Lap(1, 100, 100, 0), Lap(2, 300, 200, None)])
+        sink.close()
+
+        session = read_session(filename)
+        assert list(session['timestamp']) == [1, 2]
+        assert list(session['gate']) == [0, NO_GATE]
+
+    def test_laps_are_on_disk_after_each_flush(self, tmp_path):
+        filename = str(tmp_path / 'sink.laps')
+        sink = ColumnarSink(open(filename, 'w+b'), capacity=4)
+        laps = [Lap(i, 100 * i, 100, None) for i in range(1, 11)]
+
+        for batch in [laps[:3], laps[3:8], laps[8:]]:
+            sink.writerows(batch)
+            sink.flush()
+
+            # As if the recorder had been killed right now
+            with read_session(filename) as session:
+                assert list(session['timestamp']) == list(
+                    range(1, sink.count + 1))
+                assert list(session['millis']) == [lap.millis for lap in
+                                                   laps[:sink.count]]
+
+        sink.close()
+
+    def test_columns_grow_and_are_packed_on_close(self, tmp_path):
+        filename = tmp_path / 'sink.laps'
+        sink = ColumnarSink(open(str(filename), 'w+b'), capacity=16)
+        for i in range(1000):
+            sink.writerow(Lap(i, i, i % 7, None))
+        sink.close()
+
+        with read_session(str(filename)) as session:
+            assert list(session['timestamp']) == list(range(1000))
+            assert list(session['laptime']) == [i % 7 for i in range(1000)]
+        with open(str(filename), 'rb') as fp:
+            packed = fp.read()
+
+        with open(str(tmp_path / 'packed.laps'), 'wb') as fp:
+            write_session(fp, {'timestamp': range(1000),
+                               'millis': range(1000),
+                               'laptime': [i % 7 for i in range(1000)]})
+        assert packed == (tmp_path / 'packed.laps').read_bytes()
+
+    def test_empty_session(self, tmp_path):
+        filename = str(tmp_path / 'sink.laps')
+        ColumnarSink(open(filename, 'w+b')).close()
+
+        assert len(read_session(filename)) == 0
+
+
+class TestConvertCSV:
+    def test_new_style(self, tmp_path):
+        source = str(tmp_path / 'track_times.csv')
+        with open(source, 'w') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(MULTI_HEADER)
+            writer.writerow([1000, 100, 100, '0:0.100', 1])
+            writer.writerow([2000, 250, 150, '0:0.150', 2])
+
+        target = str(tmp_path / 'track_times.laps')
+        assert convert_csv(source, target) == 2
+
+        session = read_session(target)
+        assert list(session['timestamp']) == [1000, 2000]
+        assert list(session['gate']) == [1, 2]
+        assert session.metadata['source'] == source
+
+    def test_old_style_timestamps(self, tmp_path):
+        moment = datetime(2016, 4, 19, 12, 16, 47, 123456)
+        source = str(tmp_path / 'old.csv')
+        with open(source, 'w') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(HEADER)
+            writer.writerow([moment, 100, 100, '0:0.100'])
+            writer.writerow([moment.replace(microsecond=0), 250, 150,
+                             '0:0.150'])
+
+        target = str(tmp_path / 'old.laps')
+        convert_csv(source, target)
+
+        timestamps = read_session(target)['timestamp']
+        assert timestamps[0] == int(moment.timestamp()) * 10**9 + 123456000
+        assert timestamps[0] - timestamps[1] == 123456000
@@ -0,0 +1,144 @@
+import sqlite3
+
+import pytest
+
+from laptime.laps import Lap
+from laptime.database import SQLiteSink, connect, best_laps, last_laps
+from laptime.sinks import open_sink
+
+
+LAPS = [
+    Lap(1000, 100, 100, None),
+    Lap(2000, 250, 150, None),
+    Lap(3000, 330, 80, None),
+]
+
+
+@pytest.fixture
+def filename(tmp_path):
+    return str(tmp_path / 'laps.db')
+
+
+def test_schema(filename):
+    db = connect(filename)
+
+    assert db.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    indexes = {row[1] for row in db.execute('PRAGMA index_list(laps)')}
+    assert {'laps_session', 'laps_session_id', 'laps_car',
+            'laps_laptime'} <= indexes
+
+
+def test_last_laps_of_a_session_dont_sort_the_table(filename):
+    db = connect(filename)
+
+    plan = ' '.join(row[-1] for row in db.execute(
+        'EXPLAIN QUERY PLAN SELECT * FROM laps WHERE session = ? '
+        'ORDER BY id DESC LIMIT 10', (1,)))
+
+    assert 'laps_session_id' in plan
+    assert 'TEMP B-TREE' not in plan
+
+
+def test_cli_saves_the_car(tmp_path, monkeypatch):
+    from laptime.__main__ import main
+    from laptime.capture import CaptureWriter
+
+    replay = str(tmp_path / 'session.cap')
+    with open(replay, 'wb') as fp:
+        CaptureWriter(fp).write(b'1000\n2000\n0\n', timestamp=0)
+    monkeypatch.chdir(tmp_path)
+
+    main(['--replay', replay, '-f', 'sqlite', '--car', '7'])
+
+    db_file, = tmp_path.glob('*.db')
+    db = connect(str(db_file))
+    assert [row[2] for row in last_laps(db)] == [7, 7]
+
+
+class TestSQLiteSink:
+    def test_write(self, filename):
+        sink = SQLiteSink(filename, car=7)
+        sink.writerows(LAPS)
+        sink.close()
+
+        db = sqlite3.connect(filename)
+        rows = db.execute('SELECT session, gate, car, timestamp, millis, '
+                          'laptime FROM laps').fetchall()
+        assert rows == [(sink.session, None, 7) + tuple(lap[:3])
+                        for lap in LAPS]
+
+    def test_batched_transactions(self, filename):
+        sink = SQLiteSink(filename, batch_size=2, batch_interval=60)
+        reader = connect(filename)
+
+        for lap in LAPS:
+            sink.writerow(lap)
+
+        # The first two laps are committed, the third is still waiting
+        assert sink.transactions == 1
+        assert len(last_laps(reader)) == 2
+
+        sink.flush()
+        assert sink.transactions == 2
+        assert len(last_laps(reader)) == 3
+        sink.close()
+
+    def test_interval(self, filename):
+        sink = SQLiteSink(filename, batch_size=100, batch_interval=0)
+        sink.writerow(LAPS[0])
+
+        assert sink.transactions == 1
+        sink.close()
+
+    def test_recovers_from_a_failed_write(self, filename):
+        sink = SQLiteSink(filename, batch_size=100, batch_interval=60)
+        sink.writerow(LAPS[0])
+
+        with pytest.raises(sqlite3.IntegrityError):
+            sink.writerows([LAPS[1], Lap(None, 300, 50, None)])
+        sink.writerow(LAPS[2])
+        sink.close()
+
+        db = connect(filename)
+        assert [row[3] for row in last_laps(db)] == [3000, 1000]
+
+    def test_recovers_once_the_database_is_unlocked(self, filename):
+        sink = SQLiteSink(filename, batch_size=100, batch_interval=60)
+        sink.db.execute('PRAGMA busy_timeout = 0')
+        other = connect(filename)
+        other.execute('BEGIN IMMEDIATE')
+
+        with pytest.raises(sqlite3.OperationalError):
+            sink.writerow(LAPS[0])
+        other.execute('COMMIT')
+        sink.writerow(LAPS[1])
+        sink.close()
+
+        assert [row[3] for row in last_laps(other)] == [2000]
+
+    def test_sessions(self, filename):
+        first = SQLiteSink(filename, name='practice')
+        first.writerows(LAPS)
+        first.close()
+
+        second = open_sink(filename, 'sqlite', gate=True)
+        second.writerow(Lap(4000, 50, 50, 1))
+        second.close()
+
+        assert second.session != first.session
+
+        db = connect(filename)
+        assert len(last_laps(db, session=first.session)) == 3
+        assert last_laps(db, limit=1)[0][:2] == (second.session, 1)
+
+
+def test_best_laps(filename):
+    sink = SQLiteSink(filename, car=3)
+    sink.writerows(LAPS)
+    sink.close()
+
+    db = connect(filename)
+    assert [row[-1] for row in best_laps(db, limit=2)] == [80, 100]
+    assert [row[-1] for row in best_laps(db, car=3, session=sink.session,
+                                         limit=1)] == [80]
+    assert best_laps(db, car=4) == []
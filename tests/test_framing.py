@@ -0,0 +1,188 @@
+import csv
+from io import StringIO
+import random
+
+import pytest
+
+from laptime.framing import (LineFramer, BinaryFramer, Frame, encode_frame,
+                             FRAME)
+from laptime.bench import ChunkedStream, millis_stream, deque_frames
+from laptime.reader import record, MULTI_HEADER
+
+
+class BinaryArduino:
+    """
+    A stand-in for a timing gate speaking the binary protocol.
+
+    The reference sketch sends one 10 byte frame per beam break::
+
+        struct __attribute__((packed)) Frame {
+            uint8_t  sync;      // always 0xA5
+            uint8_t  gate;      // which gate this is
+            uint32_t millis;    // millis() when the beam was broken
+            uint16_t sequence;  // incremented for every frame sent
+            uint16_t crc;       // CRC-16/XMODEM over gate, millis, sequence
+        };
+
+        void send_frame(uint32_t now) {
+            Frame frame = {0xA5, GATE_ID, now, sequence++, 0};
+            uint16_t crc = 0;
+            uint8_t *body = (uint8_t *) &frame + 1;
+            for (int i = 0; i < 7; i++) {
+                crc = _crc_xmodem_update(crc, body[i]);
+            }
+            frame.crc = crc;
+            Serial.write((uint8_t *) &frame, sizeof(frame));
+        }
+
+    Everything is little endian, which is what the AVR gives you for free.
+    Sending a millis of 0 tells the recorder to stop.
+    """
+    def __init__(self, count=5, gates=(0,), seed=42):
+        rng = random.Random(seed)
+        frames = []
+        millis = {gate: rng.randint(1, 20000) for gate in gates}
+
+        for sequence in range(count):
+            for gate in gates:
+                millis[gate] += rng.randint(30*1000, 250*1000)
+                frames.append(encode_frame(gate, millis[gate], sequence))
+
+        frames.append(encode_frame(gates[0], 0, count))
+        self.data = b''.join(frames)
+        self.is_open = True
+        self.in_waiting = len(self.data)
+
+    def read(self, num_bytes=1):
+        chunk, self.data = self.data[:num_bytes], self.data[num_bytes:]
+        self.in_waiting = len(self.data)
+        return chunk
+
+
+@pytest.fixture
+def framer(request):
+    return LineFramer(buffer_size=16)
+
+
+class TestLineFramer:
+    def test_single_line(self, framer):
+        assert framer.feed(b'12345\n') == [b'12345']
+        assert framer.pending == b''
+
+    def test_partial_line_is_kept(self, framer):
+        assert framer.feed(b'123') == []
+        assert framer.feed(b'45\n67') == [b'12345']
+        assert framer.pending == b'67'
+
+    def test_multiple_lines_in_one_chunk(self, framer):
+        got = framer.feed(b'1\n22\n333\n4')
+        assert got == [b'1', b'22', b'333']
+        assert framer.pending == b'4'
+
+    def test_line_noise_is_discarded(self):
+        framer = LineFramer(max_line_length=4)
+        assert framer.feed(b'123456') == []
+        assert framer.discarded == 6
+        assert framer.feed(b'7\n') == [b'7']
+
+    def test_read_from_uses_readinto(self, framer):
+        data = millis_stream(100)
+        stream = ChunkedStream(data, chunk_size=7)
+        lines = []
+
+        while not stream.exhausted():
+            lines.extend(framer.read_from(stream))
+
+        assert lines == data.split(b'\n')[:-1]
+
+    def test_read_from_falls_back_to_read(self, framer):
+        class ReadOnly:
+            def read(self, num_bytes=1):
+                return b'10\n20\n3'
+
+        assert framer.read_from(ReadOnly()) == [b'10', b'20']
+        assert framer.pending == b'3'
+
+    def test_same_as_deque_framing(self):
+        # The deque loop only handles one newline per read, so keep the
+        # chunks small enough that it never sees two
+        data = millis_stream(100)
+        stream = ChunkedStream(data, chunk_size=4)
+        should_be = [bytes(m) for m in deque_frames(stream)]
+
+        framer = LineFramer()
+        got = framer.feed(data)
+
+        assert got == should_be
+
+
+class TestBinaryFramer:
+    def test_round_trip(self):
+        framer = BinaryFramer()
+        data = encode_frame(3, 123456, 7) + encode_frame(4, 2**32 - 1, 8)
+
+        assert framer.feed(data) == [Frame(3, 123456, 7),
+                                     Frame(4, 2**32 - 1, 8)]
+        assert framer.errors == 0
+
+    def test_partial_frames_are_kept(self):
+        framer = BinaryFramer()
+        data = encode_frame(1, 1000, 0) + encode_frame(1, 2000, 1)
+
+        assert framer.feed(data[:13]) == [Frame(1, 1000, 0)]
+        assert framer.feed(data[13:]) == [Frame(1, 2000, 1)]
+        assert framer.pending == b''
+
+    def test_resync_after_garbage(self):
+        framer = BinaryFramer()
+        data = (b'\x00\x01' + encode_frame(1, 1000, 0) + b'\xa5\xff'
+                + encode_frame(1, 2000, 1))
+
+        got = framer.feed(data)
+
+        assert got == [Frame(1, 1000, 0), Frame(1, 2000, 1)]
+        assert framer.errors == 1
+        assert framer.discarded == 4
+
+    def test_corrupted_frame_is_skipped(self):
+        framer = BinaryFramer()
+        bad = bytearray(encode_frame(1, 2000, 1))
+        bad[3] ^= 0xFF
+        data = encode_frame(1, 1000, 0) + bad + encode_frame(1, 3000, 2)
+
+        got = framer.feed(data)
+
+        assert got == [Frame(1, 1000, 0), Frame(1, 3000, 2)]
+        assert framer.errors >= 1
+        assert framer.missed == 1
+
+    def test_sequence_wraps_around(self):
+        framer = BinaryFramer()
+        framer.feed(encode_frame(0, 1, 0xFFFF) + encode_frame(0, 2, 0))
+        assert framer.missed == 0
+
+
+def test_record_binary():
+    fp = StringIO()
+    record(BinaryArduino(count=3, gates=(0, 1)), fp, binary=True)
+
+    rows = list(csv.reader(StringIO(fp.getvalue())))
+    assert rows[0] == MULTI_HEADER
+    assert len(rows) == 1 + 3*2
+    assert sorted(set(row[-1] for row in rows[1:])) == ['0', '1']
+
+    # Laptimes are calculated separately for each gate
+    for gate in '01':
+        millis = [int(row[1]) for row in rows[1:] if row[-1] == gate]
+        laptimes = [int(row[2]) for row in rows[1:] if row[-1] == gate]
+        assert laptimes[1:] == [b - a for a, b in zip(millis, millis[1:])]
+
+
+def test_a_framer_has_to_frame():
+    from laptime.framing import _Framer
+
+    class Lazy(_Framer):
+        pass
+
+    with pytest.raises(TypeError):
+        Lazy(16)
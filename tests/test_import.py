@@ -0,0 +1,69 @@
+import subprocess
+import sys
+
+import pytest
+
+import laptime
+from laptime.bench import IMPORT_BUDGETS, import_time, import_times
+
+
+# Only recording needs these
+RECORDING = ['serial', 'laptime.reader', 'laptime.multi', 'laptime.capture',
+             'laptime.framing']
+
+OFFLINE = ['laptime', 'laptime.misc', 'laptime.loader', 'laptime.columnar',
+           'laptime.index', 'laptime.report']
+
+
+def loaded_after(statement):
+    output = subprocess.check_output(
+        [sys.executable, '-c',
+         statement + '; import sys; print("\\n".join(sys.modules))'],
+        universal_newlines=True)
+    return set(output.split())
+
+
+def test_import_doesnt_run_git():
+    modules = loaded_after('import laptime')
+
+    assert 'laptime' in modules
+    assert 'pkg_resources' not in modules
+    assert 'subprocess' not in modules
+    assert 'laptime._version' not in modules
+
+
+def test_version_is_looked_up_on_demand():
+    assert isinstance(laptime.__version__, str)
+    assert laptime.__version__
+    # Only worked out once
+    assert laptime.__dict__['__version__'] == laptime.__version__
+
+
+@pytest.mark.parametrize('module', OFFLINE)
+def test_offline_tools_dont_import_the_recording_stack(module):
+    imported = import_times(module)
+
+    assert module in imported
+    for name in RECORDING + ['laptime.writer', 'argparse', 'logging']:
+        assert name not in imported
+
+
+def test_cli_only_imports_serial_to_record():
+    imported = import_times('laptime.__main__')
+
+    for name in RECORDING:
+        assert name not in imported
+
+
+def test_misc_still_has_the_logging_helpers():
+    from laptime import logs, misc
+
+    assert misc.get_logger is logs.get_logger
+    assert misc.stop_logging is logs.stop_logging
+    with pytest.raises(AttributeError):
+        misc.not_a_thing
+
+
+@pytest.mark.parametrize('module', list(IMPORT_BUDGETS))
+def test_import_is_within_budget(module):
+    assert import_time(module) < IMPORT_BUDGETS[module]
@@ -0,0 +1,103 @@
+import csv
+import os
+
+import pytest
+
+from laptime.laps import Lap, HEADER
+from laptime.sinks import open_sink
+from laptime.index import (SeekIndex, build_index, read_laps, read_between,
+                           index_filename)
+
+
+LAPS = [Lap(1000 * i, 100 * i, 100, None) for i in range(25)]
+
+
+@pytest.fixture
+def recorded(tmp_path):
+    filename = str(tmp_path / 'session.csv')
+    sink = open_sink(filename, index=True)
+    sink.index.every = 10
+
+    # Several batches, so index entries land at different places in them
+    for start in range(0, len(LAPS), 7):
+        sink.writerows(LAPS[start:start + 7])
+    sink.close()
+
+    return filename
+
+
+def test_index_while_recording(recorded):
+    index = SeekIndex(recorded)
+
+    assert list(index.laps) == [0, 10, 20]
+    assert list(index.timestamps) == [0, 10000, 20000]
+
+    with open(recorded, 'rb') as fp:
+        fp.seek(index.offsets[1])
+        assert fp.readline().startswith(b'10000,1000,')
+
+
+def test_rebuild_matches(recorded):
+    with open(index_filename(recorded), 'rb') as fp:
+        original = fp.read()
+    os.remove(index_filename(recorded))
+
+    assert build_index(recorded, every=10) == len(LAPS)
+    with open(index_filename(recorded), 'rb') as fp:
+        assert fp.read() == original
+
+
+def test_rebuild_old_style_file(tmp_path):
+    filename = str(tmp_path / 'old.csv')
+    with open(filename, 'w') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(HEADER)
+        for i in range(5):
+            writer.writerow(['2016-04-19 12:16:4{}'.format(i), i, 1, '0:0.1'])
+
+    build_index(filename, every=2)
+    index = SeekIndex(filename)
+    assert list(index.laps) == [0, 2, 4]
+    assert index.timestamps[1] - index.timestamps[0] == 2 * 10**9
+
+
+def test_read_laps(recorded):
+    assert list(read_laps(recorded, 12, 15)) == LAPS[12:15]
+    assert list(read_laps(recorded, 5, 6)) == LAPS[5:6]
+    assert list(read_laps(recorded, 22)) == LAPS[22:]
+    assert list(read_laps(recorded, 30)) == []
+
+
+def test_read_between(recorded):
+    assert list(read_between(recorded, 11000, 14000)) == LAPS[11:14]
+    assert list(read_between(recorded, 10000, 10001)) == [LAPS[10]]
+    assert list(read_between(recorded, -5, 2500)) == LAPS[:3]
+
+
+def test_truncated_index(recorded):
+    with open(index_filename(recorded), 'ab') as fp:
+        fp.write(b'\x01\x02\x03')
+
+    assert len(SeekIndex(recorded)) == 3
+
+
+def test_only_plain_csv_is_indexed(tmp_path):
+    with pytest.raises(ValueError):
+        open_sink(str(tmp_path / 'x.csv.gz'), compression='gzip', index=True)
+
+
+@pytest.mark.parametrize('options, message', [
+    (['-f', 'csv', '-f', 'jsonl', '--index'], "jsonl output can't be indexed"),
+    (['-f', 'sqlite', '--index'], "sqlite output can't be indexed"),
+    (['--index', '-z', 'gzip'], "compressed output can't be indexed"),
+])
+def test_cli_rejects_what_cant_be_indexed(tmp_path, monkeypatch, capsys,
+                                          options, message):
+    from laptime.__main__ import main
+
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(SystemExit):
+        main(options)
+
+    assert message in capsys.readouterr().err
+    assert not list(tmp_path.iterdir())
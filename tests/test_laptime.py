@@ -1,5 +1,8 @@
 from io import StringIO
+import logging
+import os
 import sys
+import tempfile
 from unittest import TestCase
 from unittest.mock import patch
 import re
@@ -7,7 +10,9 @@ import random
 import time
 
 from laptime.reader import record
-from laptime.misc import generate_filename, human_readable
+from laptime.misc import (generate_filename, human_readable,
+                          human_readable_many, parse_human_readable,
+                          get_logger, stop_logging)
 
 
 class DummyArduino:
@@ -108,3 +113,101 @@ class HumanReadableTest(TestCase):
         
         with self.assertRaises(TypeError):
             stuff = human_readable(num_ms)
+
+    def test_padded(self):
+        self.assertEqual(human_readable(5050, padded=True), '0:05.050')
+        self.assertEqual(human_readable(1000*60*12 + 7, padded=True),
+                         '12:00.007')
+
+
+class HumanReadableManyTest(TestCase):
+    durations = [0, 7, 50, 124, 1234, 10050, 59999, 60000, 305657,
+                 1000*60*60*3 + 1, 10**10]
+
+    def test_matches_human_readable(self):
+        for padded in [False, True]:
+            expected = [human_readable(ms, padded) for ms in self.durations]
+            self.assertEqual(human_readable_many(self.durations, padded),
+                             expected)
+
+    def test_numpy_array(self):
+        import numpy as np
+
+        durations = np.array(self.durations[:7], dtype=np.int32)
+        self.assertEqual(human_readable_many(durations),
+                         [human_readable(ms) for ms in self.durations[:7]])
+
+    def test_array_output(self):
+        for padded in [False, True]:
+            for durations in [self.durations, self.durations[1:7]]:
+                got = human_readable_many(durations, padded, array=True)
+                self.assertEqual([text.decode() for text in got],
+                                 [human_readable(ms, padded)
+                                  for ms in durations])
+
+    def test_empty(self):
+        self.assertEqual(human_readable_many([]), [])
+        self.assertEqual(len(human_readable_many([], array=True)), 0)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            human_readable_many([5, -3])
+        with self.assertRaises(TypeError):
+            human_readable_many([1.5, 2.5])
+
+    def test_parse(self):
+        for ms in self.durations:
+            self.assertEqual(parse_human_readable(human_readable(ms)), ms)
+            self.assertEqual(
+                parse_human_readable(human_readable(ms, padded=True)), ms)
+
+
+class GetLoggerTest(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.log_file = os.path.join(directory, 'timer.log')
+        self.addCleanup(stop_logging)
+
+    def read_log(self):
+        with open(self.log_file) as fp:
+            return fp.read()
+
+    def test_only_one_handler(self):
+        with patch('logging.FileHandler') as file_handler:
+            get_logger('test_only_one_handler', self.log_file)
+            get_logger('test_only_one_handler', self.log_file)
+
+        self.assertEqual(file_handler.call_count, 1)
+
+    def test_synchronous(self):
+        logger = get_logger('test_synchronous', self.log_file)
+        logger.info('lap %d', 42)
+        logger.handlers[0].flush()
+
+        self.assertIn('lap 42', self.read_log())
+
+    def test_queued(self):
+        logger = get_logger('test_queued', self.log_file,
+                            log_level=logging.DEBUG, queued=True)
+        other = get_logger('test_queued.other', self.log_file, queued=True)
+
+        logger.debug('Got: "%s"', b'1234')
+        other.warning('sync lost')
+        stop_logging()
+
+        log = self.read_log()
+        self.assertIn('Got: "b\'1234\'"', log)
+        self.assertIn('WARNING: sync lost', log)
+        # The logger is set up again if it's needed after stopping
+        self.assertEqual(logger.handlers, [])
+
+    def test_queued_formatting_is_deferred(self):
+        logger = get_logger('test_queued_formatting', self.log_file,
+                            queued=True)
+        handler = logger.handlers[0]
+        record = logger.makeRecord(logger.name, logging.INFO, __file__, 0,
+                                   'lap %d', (42,), None)
+
+        prepared = handler.prepare(record)
+        self.assertEqual(prepared.msg, 'lap %d')
+        self.assertEqual(prepared.args, (42,))
@@ -0,0 +1,210 @@
+import io
+import random
+
+import pytest
+
+from laptime.bench import ChunkedStream, frame_stream, millis_stream
+from laptime.laps import Lap
+from laptime.latency import Histogram, PipelineStats, SinkLatency
+from laptime.reader import record
+from laptime.sinks import CSVSink, JSONLinesSink, Tee
+
+
+class FakeClock:
+    def __init__(self):
+        self.time = 0
+
+    def now(self):
+        return self.time
+
+
+def laps_at(*timestamps):
+    return [Lap(timestamp, 0, 0, 0) for timestamp in timestamps]
+
+
+def test_histogram_summary():
+    histogram = Histogram()
+    for value in range(1, 1001):
+        histogram.record(value * 1000)
+
+    summary = histogram.summary()
+
+    assert summary['count'] == len(histogram) == 1000
+    assert summary['mean'] == 500500
+    assert summary['min'] == pytest.approx(1000, rel=0.01)
+    assert summary['p50'] == pytest.approx(500000, rel=0.01)
+    assert summary['p99'] == pytest.approx(990000, rel=0.01)
+    assert summary['max'] == pytest.approx(1000000, rel=0.01)
+
+
+def test_histogram_stays_accurate_at_any_scale():
+    rng = random.Random(1)
+    values = sorted(int(10 ** rng.uniform(2, 11)) for _ in range(10000))
+    histogram = Histogram()
+    for value in values:
+        histogram.record(value)
+
+    for q in [0.1, 0.5, 0.9, 0.99]:
+        expected = values[int(q * (len(values) - 1))]
+        assert histogram.quantile(q) == pytest.approx(expected, rel=0.01)
+
+
+def test_empty_histogram():
+    summary = Histogram().summary()
+
+    assert summary['count'] == 0
+    assert all(value is None for key, value in summary.items()
+               if key != 'count')
+
+
+def test_merge_and_weights():
+    first, second = Histogram(), Histogram()
+    first.record(100, count=3)
+    second.record(-5)
+    second.record(200)
+
+    first.merge(second)
+
+    assert first.count == 5
+    assert first.total == 500
+    assert first.quantile(0) == 0
+    assert first.quantile(1) == pytest.approx(200, rel=0.01)
+
+
+def test_sink_latency_samples_every_nth_lap():
+    clock = FakeClock()
+    sink = CSVSink(io.StringIO())
+    sink.latency = latency = SinkLatency(clock, sample_every=4)
+
+    clock.time = 100
+    sink.writerows(laps_at(*range(10)))
+    sink.writerows(laps_at(*range(3)))
+    clock.time = 150
+    sink.flush()
+
+    # Laps 1, 5, 9 and 13 are timed (the first, then every 4th)
+    assert latency.written.count == 16
+    assert latency.written.quantile(0) == 100 - 8
+    assert latency.written.quantile(1) == 100
+    assert latency.flushed.count == 16
+    assert latency.flushed.quantile(0.5) == 50
+    assert latency.flushes == 1
+    # Lap 17 is next
+    assert latency.countdown == 4
+
+
+def test_sink_latency_keeps_count_across_small_batches():
+    sink = CSVSink(io.StringIO())
+    sink.latency = latency = SinkLatency(FakeClock(), sample_every=16)
+
+    for _ in range(100):
+        sink.writerow(Lap(0, 0, 0, 0))
+
+    # Laps 1, 17, 33, 49, 65, 81 and 97
+    assert latency.written.count == 7 * 16
+
+
+def test_unflushed_writes_are_bounded():
+    sink = CSVSink(io.StringIO())
+    sink.latency = latency = SinkLatency(FakeClock(), sample_every=1)
+
+    for _ in range(SinkLatency.MAX_UNFLUSHED * 2):
+        sink.writerow(Lap(0, 0, 0, 0))
+    sink.flush()
+
+    assert latency.flushed.count == SinkLatency.MAX_UNFLUSHED * 2
+    assert latency._unflushed == []
+
+
+def test_watch_each_sink_in_a_tee():
+    stats = PipelineStats()
+    stats.start(FakeClock())
+    sinks = [CSVSink(io.StringIO()), CSVSink(io.StringIO()),
+             JSONLinesSink(io.StringIO())]
+
+    with Tee(sinks) as tee:
+        stats.watch(tee)
+
+    assert list(stats.sinks) == ['CSVSink', 'CSVSink_2', 'JSONLinesSink']
+    assert [sink.latency for sink in sinks] == list(stats.sinks.values())
+
+
+@pytest.mark.parametrize('binary', [False, True])
+@pytest.mark.parametrize('background', [False, True])
+def test_record_measures_the_pipeline(binary, background):
+    data = frame_stream(1000) if binary else millis_stream(1000)
+    chunks = -(-len(data) // 256)
+
+    stats = record(ChunkedStream(data, 256), io.StringIO(), binary=binary,
+                   background=background)
+    summary = stats.stats()
+
+    assert summary['laps'] == 1000
+    assert summary['bytes_read'] == len(data)
+    # A read per chunk, or a readline() per line
+    assert summary['reads'] == (chunks if binary else 1000)
+    assert summary['parsed']['count'] == 1000 - 1000 % 16
+    if binary:
+        assert summary['framed']['count'] == 1000
+    else:
+        assert summary['framed']['count'] == 1000 - 1000 % 16
+
+    sink, = summary['sinks'].values()
+    assert sink['written']['count'] >= 992
+    assert sink['flushed']['count'] == sink['written']['count']
+
+    report = io.StringIO()
+    stats.report(report)
+    assert report.getvalue().startswith('1000 laps')
+    assert 'CSVSink flushed' in report.getvalue()
+
+
+class SlowSerial:
+    """
+    Sends a lap every 50ms, with nothing waiting in between.
+    """
+    def __init__(self, clock, lines):
+        self.clock = clock
+        self.lines = list(lines)
+        self.is_open = True
+        self.timeout = None
+        self.in_waiting = 0
+
+    def readline(self):
+        self.clock.time += 50 * 10**6
+        return self.lines.pop(0)
+
+
+def test_waiting_for_a_lap_isnt_framing():
+    clock = FakeClock()
+    stats = PipelineStats(sample_every=2)
+    lines = [str(1000 * i).encode('ascii') + b'\n' for i in range(1, 11)]
+    ser = SlowSerial(clock, lines + [b'0\n'])
+
+    record(ser, io.StringIO(), clock=clock, stats=stats)
+
+    assert stats.laps == 10
+    assert stats.framed.count == 0
+    assert stats.parsed.count == 10
+
+
+def test_record_without_stats():
+    stream = ChunkedStream(millis_stream(100))
+
+    assert record(stream, io.StringIO(), stats=False) is None
+
+
+def test_cli_reports_latencies_at_shutdown(tmp_path, monkeypatch, capsys):
+    from laptime.__main__ import main
+    from laptime.capture import CaptureWriter
+
+    replay = str(tmp_path / 'session.cap')
+    with open(replay, 'wb') as fp:
+        CaptureWriter(fp).write(b'1000\n2000\n3000\n0\n', timestamp=0)
+    monkeypatch.chdir(tmp_path)
+
+    main(['--replay', replay])
+
+    report = capsys.readouterr().err
+    assert report.startswith('3 laps')
+    assert 'CSVSink written' in report
@@ -0,0 +1,77 @@
+import random
+
+import pytest
+
+from laptime.laps import Lap
+from laptime.leaderboard import Leaderboard, Standing
+
+
+def brute_force(laps):
+    # Each car's best lap, and when it was set
+    bests = {}
+    for i, (car, laptime) in enumerate(laps):
+        if car not in bests or laptime < bests[car][0]:
+            bests[car] = (laptime, i)
+
+    ranking = sorted(bests.items(), key=lambda item: item[1])
+    return [(car, best) for car, (best, _) in ranking]
+
+
+def test_update():
+    board = Leaderboard()
+
+    assert board.update('red', 62000)
+    assert board.update('blue', 61000)
+    assert not board.update('red', 63000)
+    assert board.update('red', 60500)
+
+    assert board.leader() == 'red'
+    assert board.top() == [Standing(1, 'red', 60500, 0),
+                           Standing(2, 'blue', 61000, 500)]
+    assert board.position('blue') == 2
+    assert board.gap('blue') == 500
+    assert board.laps == {'red': 3, 'blue': 1}
+
+
+def test_ties_go_to_whoever_was_first():
+    board = Leaderboard()
+    board.update(1, 60000)
+    board.update(2, 60000)
+    board.update(0, 60000)
+
+    assert [standing.car for standing in board.top()] == [1, 2, 0]
+
+
+def test_matches_brute_force():
+    rng = random.Random(3)
+    laps = [(rng.randrange(200), rng.randint(50000, 70000))
+            for _ in range(5000)]
+
+    board = Leaderboard()
+    for car, laptime in laps:
+        board.update(car, laptime)
+
+    expected = brute_force(laps)
+    assert len(board) == len(expected)
+    assert [(s.car, s.best) for s in board.top(20)] == expected[:20]
+    for position, (car, best) in enumerate(expected, 1):
+        assert board.standing(car).position == position
+
+
+def test_empty():
+    board = Leaderboard()
+
+    assert board.leader() is None
+    assert board.top() == []
+    assert 'red' not in board
+    with pytest.raises(KeyError):
+        board.position('red')
+
+
+def test_as_a_sink():
+    board = Leaderboard()
+    board.writerows([Lap(0, 100, 100, 1), Lap(0, 150, 50, 2),
+                     Lap(0, 300, 200, 1)])
+
+    assert board.leader() == 2
+    assert board.bests == {1: 100, 2: 50}
@@ -0,0 +1,128 @@
+import csv
+import gzip
+
+import numpy as np
+import pytest
+
+import laptime
+from laptime.laps import Lap, HEADER
+from laptime.loader import parse_csv, _parse_rows, NO_GATE
+from laptime.sinks import open_sink
+
+
+LAPS = [Lap(1460000000000000000 + i, 100 * i, 100, i % 3 or None)
+        for i in range(1, 50)]
+
+
+def record(filename, gate=False, compression=None, fmt='csv'):
+    sink = open_sink(filename, fmt, gate=gate, compression=compression)
+    sink.writerows(LAPS)
+    sink.close()
+    return filename
+
+
+def expected(gate=False):
+    columns = {
+        'timestamp': [lap.timestamp for lap in LAPS],
+        'millis': [lap.millis for lap in LAPS],
+        'laptime': [lap.laptime for lap in LAPS],
+    }
+    if gate:
+        columns['gate'] = [NO_GATE if lap.gate is None else lap.gate
+                           for lap in LAPS]
+    return columns
+
+
+def as_lists(columns):
+    return {name: list(values) for name, values in columns.items()}
+
+
+@pytest.mark.parametrize('gate', [False, True])
+def test_load_csv(tmp_path, gate):
+    filename = record(str(tmp_path / 'session.csv'), gate=gate)
+    columns = laptime.load(filename)
+
+    assert columns['timestamp'].dtype == np.int64
+    assert as_lists(columns) == expected(gate)
+
+
+def test_vectorized_matches_csv_module(tmp_path):
+    filename = record(str(tmp_path / 'session.csv'), gate=True)
+    with open(filename, 'rb') as fp:
+        data = fp.read()
+
+    assert as_lists(parse_csv(data)) == as_lists(_parse_rows(data))
+    # Without a trailing newline, and with plain "\n" line endings
+    assert as_lists(parse_csv(data.rstrip())) == expected(gate=True)
+    assert as_lists(parse_csv(data.replace(b'\r\n', b'\n'))) == \
+        expected(gate=True)
+
+
+def test_old_style_timestamps():
+    data = ('{}\r\n2016-04-19 12:16:47.5,100,100,0:0.100\r\n'
+            .format(','.join(HEADER)).encode())
+    columns = parse_csv(data)
+
+    assert columns['millis'][0] == 100
+    assert columns['timestamp'][0] % 10**9 == 500000000
+
+
+def test_empty_files(tmp_path):
+    empty = tmp_path / 'empty.csv'
+    empty.write_bytes(b'')
+    assert as_lists(laptime.load(str(empty))) == {
+        'timestamp': [], 'millis': [], 'laptime': []}
+
+    header_only = tmp_path / 'header.csv'
+    header_only.write_text(','.join(HEADER) + '\n')
+    assert len(laptime.load(str(header_only))['millis']) == 0
+
+
+def test_load_compressed(tmp_path):
+    filename = record(str(tmp_path / 'session.csv.gz'), compression='gzip')
+    assert as_lists(laptime.load(filename)) == expected()
+
+
+def test_load_session_file(tmp_path):
+    filename = str(tmp_path / 'session.laps')
+    sink = open_sink(filename, 'columnar')
+    sink.writerows(LAPS)
+    sink.close()
+
+    assert as_lists(laptime.load(filename)) == expected()
+
+
+def test_load_many(tmp_path):
+    filenames = [record(str(tmp_path / 'session_{}.csv'.format(i)))
+                 for i in range(3)]
+
+    for processes in [1, 2]:
+        sessions = laptime.load_many(filenames, processes=processes)
+        assert len(sessions) == 3
+        assert all(as_lists(columns) == expected() for columns in sessions)
+
+
+def test_biggest_numbers():
+    header = b'Timestamp,Millis,Laptime,Human\n'
+
+    columns = parse_csv(header + b'9223372036854775807,1,1,x\n'
+                                 b'1000000000000000000,2,1,x\n')
+    assert list(columns['timestamp']) == [2**63 - 1, 10**18]
+
+    with pytest.raises(ValueError):
+        parse_csv(header + b'1,2,1,x\n9223372036854775808,1,1,x\n')
+
+
+def test_session_files_are_closed(tmp_path, monkeypatch):
+    from laptime import columnar
+
+    filename = record(str(tmp_path / 'session.laps'), fmt='columnar')
+    closed = []
+    close = columnar.SessionFile.close
+    monkeypatch.setattr(columnar.SessionFile, 'close',
+                        lambda self: closed.append(close(self)))
+
+    columns = laptime.load(filename)
+
+    assert closed
+    assert as_lists(columns) == expected()
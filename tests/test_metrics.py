@@ -0,0 +1,206 @@
+import io
+import os
+import threading
+import time
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+from laptime.bench import ChunkedStream, frame_stream, millis_stream
+from laptime.framing import encode_frame
+from laptime.latency import PipelineStats
+from laptime.metrics import CONTENT_TYPE, MetricsServer, render
+from laptime.reader import record
+from laptime.sinks import CSVSink, JSONLinesSink, Tee
+
+
+def parse(text):
+    """
+    The value of every sample, keyed by its name and labels.
+    """
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+def scrape(server):
+    with urlopen(server.url, timeout=5) as response:
+        assert response.headers['Content-Type'] == CONTENT_TYPE
+        return parse(response.read().decode('utf-8'))
+
+
+def test_render_a_recording():
+    data = millis_stream(1000)
+    stats = record(ChunkedStream(data, 256), io.StringIO(), background=True)
+
+    samples = parse(render(stats))
+
+    assert samples['laptime_events_total'] == 1000
+    assert samples['laptime_bytes_read_total'] == len(data)
+    assert samples['laptime_parse_errors_total'] == 0
+    assert samples['laptime_queue_depth{sink="CSVSink"}'] == 0
+    assert samples['laptime_sink_write_latency_seconds_count'
+                   '{sink="CSVSink"}'] >= 992
+    assert 0 < samples['laptime_sink_write_latency_seconds'
+                       '{sink="CSVSink",quantile="0.99"}'] < 60
+    assert samples['laptime_last_event_age_seconds'] >= 0
+
+
+def test_render_before_anything_happens():
+    samples = parse(render(PipelineStats()))
+
+    assert samples['laptime_events_total'] == 0
+    assert samples['laptime_event_rate'] == 0
+    assert str(samples['laptime_last_event_age_seconds']) == 'nan'
+
+
+@pytest.mark.parametrize('sample_every', [1, 16])
+def test_parse_errors_are_counted(sample_every):
+    data = b'1000\nnoise\n2000\n3x00\n3000\n0\n'
+    stats = PipelineStats(sample_every=sample_every)
+    record(ChunkedStream(data), io.StringIO(), stats=stats)
+
+    samples = parse(render(stats))
+
+    assert samples['laptime_parse_errors_total'] == 2
+    assert samples['laptime_events_total'] == 3
+    assert samples['laptime_reads_total'] == 6
+    assert samples['laptime_bytes_read_total'] == len(data)
+
+
+class QuietSerial:
+    """
+    Hands out some lines, then goes quiet. Notes the lap count when a read
+    would have to wait for more.
+    """
+    def __init__(self, lines, stats):
+        self.lines = list(lines)
+        self.stats = stats
+        self.laps_while_waiting = None
+        self.is_open = True
+        self.timeout = None
+
+    @property
+    def in_waiting(self):
+        return sum(len(line) for line in self.lines)
+
+    def readline(self):
+        if not self.lines:
+            self.laps_while_waiting = self.stats.laps
+            return b''
+        return self.lines.pop(0)
+
+
+def test_laps_are_counted_before_waiting_for_more():
+    stats = PipelineStats()
+    ser = QuietSerial([b'1000\n', b'2000\n', b'3000\n', b'4000\n',
+                       b'5000\n'], stats)
+
+    record(ser, io.StringIO(), stats=stats)
+
+    assert ser.laps_while_waiting == 5
+    assert stats.last_event is not None
+
+
+def test_bad_frames_are_counted():
+    data = bytearray(frame_stream(100))
+    data[7] ^= 0xFF
+
+    stats = record(ChunkedStream(bytes(data)), io.StringIO(), binary=True)
+
+    assert parse(render(stats))['laptime_parse_errors_total'] == 1
+
+
+def test_every_sink_in_a_tee():
+    stats = PipelineStats()
+    with Tee([CSVSink(io.StringIO()), JSONLinesSink(io.StringIO())]) as tee:
+        record(ChunkedStream(millis_stream(100)), None, sink=tee,
+               stats=stats)
+
+    samples = parse(render(stats))
+
+    assert samples['laptime_queue_dropped_total{sink="CSVSink"}'] == 0
+    assert 'laptime_queue_depth{sink="JSONLinesSink"}' in samples
+    assert samples['laptime_sink_flushes_total{sink="JSONLinesSink"}'] >= 1
+
+
+class PipeSerial:
+    def __init__(self, fd):
+        self.fd = fd
+        self.is_open = True
+        self.timeout = None
+
+    def read(self, size):
+        return os.read(self.fd, size)
+
+
+def test_serve_while_recording():
+    read, write = os.pipe()
+    stats = PipelineStats()
+    recording = threading.Thread(target=record,
+                                 args=(PipeSerial(read), io.StringIO()),
+                                 kwargs=dict(binary=True, stats=stats))
+
+    with MetricsServer(stats) as server:
+        recording.start()
+        os.write(write, b''.join(encode_frame(0, 1000 + i, i)
+                                 for i in range(50)))
+
+        # Wait for the laps to be counted
+        for _ in range(100):
+            samples = scrape(server)
+            if samples['laptime_events_total'] == 50:
+                break
+            time.sleep(0.05)
+
+        assert samples['laptime_events_total'] == 50
+        assert samples['laptime_event_rate'] > 0
+        assert samples['laptime_last_event_age_seconds'] < 5
+
+        os.write(write, encode_frame(0, 0, 50))
+        recording.join(5)
+
+    os.close(read)
+    os.close(write)
+    assert not recording.is_alive()
+
+
+def test_only_metrics_are_served():
+    with MetricsServer(PipelineStats()) as server:
+        assert server.url.startswith('http://127.0.0.1:')
+        with pytest.raises(HTTPError):
+            urlopen(server.url.replace('/metrics', '/nope'), timeout=5)
+
+
+def test_event_rate_over_a_window():
+    stats = PipelineStats()
+    server = MetricsServer(stats, window=10)
+    now = time.monotonic()
+    server.samples.extend([(now - 12, 0), (now - 8, 100), (now - 0.5, 200)])
+    stats.laps = 300
+
+    try:
+        rate = server.event_rate()
+    finally:
+        server.stop()
+
+    # Measured from the last reading before the window started
+    assert rate == pytest.approx(300 / 12, rel=0.05)
+
+
+def test_cli_serves_metrics_while_recording(tmp_path, monkeypatch, capsys):
+    from laptime.__main__ import main
+    from laptime.capture import CaptureWriter
+
+    replay = str(tmp_path / 'session.cap')
+    with open(replay, 'wb') as fp:
+        CaptureWriter(fp).write(b'1000\n2000\n0\n', timestamp=0)
+    monkeypatch.chdir(tmp_path)
+
+    main(['--replay', replay, '--metrics-port', '0'])
+
+    assert 'Serving metrics on http://127.0.0.1:' in capsys.readouterr().err
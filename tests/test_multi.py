@@ -0,0 +1,117 @@
+import csv
+from io import StringIO, UnsupportedOperation
+from itertools import islice
+
+import pytest
+
+from laptime.bench import PipeSerial
+from laptime.latency import PipelineStats
+from laptime.multi import MultiRecorder, record_many, MULTI_HEADER
+
+
+@pytest.fixture
+def gates(request):
+    connections = [PipeSerial() for _ in range(3)]
+    for ser in connections:
+        request.addfinalizer(ser.close)
+    return connections
+
+
+class TestMultiRecorder:
+    def test_laps_are_tagged_with_their_gate(self, gates):
+        gates[0].send(b'1000\n3000\n0\n')
+        gates[1].send(b'1500\n0\n')
+        gates[2].send(b'2000\n2600\n0\n')
+
+        recorder = MultiRecorder(gates, wait_timeout=0.01)
+        laps = sorted((lap.gate, lap.millis, lap.laptime)
+                      for lap in recorder.laps())
+
+        assert laps == [
+            (0, 1000, 1000), (0, 3000, 2000),
+            (1, 1500, 1500),
+            (2, 2000, 2000), (2, 2600, 600),
+        ]
+
+    def test_custom_gate_ids(self, gates):
+        gates[0].send(b'10\n0\n')
+        gates[1].send(b'0\n')
+        gates[2].send(b'0\n')
+
+        recorder = MultiRecorder(gates, gates=['start', 's1', 's2'])
+        assert [lap.gate for lap in recorder.laps()] == ['start']
+
+    def test_mismatched_gate_ids(self, gates):
+        with pytest.raises(ValueError):
+            MultiRecorder(gates, gates=['start'])
+
+    def test_stop(self, gates):
+        recorder = MultiRecorder(gates, wait_timeout=0.01)
+        gates[1].send(b'10\n')
+
+        for lap in recorder.laps():
+            recorder.stop()
+
+        assert not recorder.running
+
+
+class PolledSerial:
+    """
+    A serial stand-in without a file descriptor, like pyserial on Windows.
+    """
+    def __init__(self, data):
+        self.data = data
+        self.timeout = None
+        self.is_open = True
+
+    def fileno(self):
+        raise UnsupportedOperation('fileno')
+
+    @property
+    def in_waiting(self):
+        return len(self.data)
+
+    def read(self, num_bytes=1):
+        chunk, self.data = self.data[:num_bytes], self.data[num_bytes:]
+        return chunk
+
+
+def test_ports_without_file_descriptors_are_polled():
+    connections = [PolledSerial(b'1000\n3000\n0\n'), PolledSerial(b''),
+                   PolledSerial(b'1500\n0\n')]
+    recorder = MultiRecorder(connections, wait_timeout=0.01)
+    laps = recorder.laps()
+
+    assert sorted((lap.gate, lap.millis) for lap in islice(laps, 3)) == [
+        (0, 1000), (0, 3000), (2, 1500)]
+
+    connections[1].data = b'2000\n0\n'
+    assert [(lap.gate, lap.millis) for lap in laps] == [(1, 2000)]
+
+
+def test_parse_errors_are_skipped(gates):
+    gates[0].send(b'1000\nnoise\n2000\n0\n')
+    gates[1].send(b'0\n')
+    gates[2].send(b'0\n')
+    stats = PipelineStats()
+    recorder = MultiRecorder(gates, wait_timeout=0.01, stats=stats)
+
+    assert [lap.millis for lap in recorder.laps()] == [1000, 2000]
+    assert stats.parse_errors == 1
+    assert stats.laps == 2
+
+
+def test_record_many(gates):
+    for i, ser in enumerate(gates):
+        ser.send('{}\n0\n'.format(100*(i + 1)).encode('ascii'))
+
+    fp = StringIO()
+    record_many(gates, fp)
+
+    rows = list(csv.reader(StringIO(fp.getvalue())))
+    assert rows[0] == MULTI_HEADER
+    assert sorted(row[1:] for row in rows[1:]) == [
+        ['100', '100', '0:0.100', '0'],
+        ['200', '200', '0:0.200', '1'],
+        ['300', '300', '0:0.300', '2'],
+    ]
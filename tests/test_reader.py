@@ -1,8 +1,10 @@
 import pytest
 from collections import deque
+from io import StringIO
 import random
 
-from laptime.reader import Recorder
+from laptime.reader import Recorder, SerialWaiter
+from laptime.bench import PipeSerial
 
 
 class DummySerial:
@@ -51,6 +53,13 @@ def serial(request):
     return DummySerial()
 
 
+@pytest.fixture
+def pipe_serial(request):
+    ser = PipeSerial()
+    request.addfinalizer(ser.close)
+    return ser
+
+
 class TestDummySerial:
     def test_read_default(self, serial):
         should_be = [
@@ -86,5 +95,57 @@ class TestDummySerial:
 
 
 class TestRecorder:
-    pass
+    def test_get_millis(self, serial, tmp_path):
+        log_file = str(tmp_path / 'timer.log')
+        recorder = Recorder(serial, StringIO(), log_file=log_file)
+
+        should_be = [b'56048', b'69953']
+        got = []
+        for message in recorder.get_millis():
+            got.append(message)
+            if len(got) == len(should_be):
+                recorder.stop()
+
+        assert got == should_be
+
+
+    def test_get_millis_waits_for_data(self, pipe_serial, tmp_path):
+        log_file = str(tmp_path / 'timer.log')
+        recorder = Recorder(pipe_serial, StringIO(), log_file=log_file,
+                            wait_timeout=0.01)
+
+        # Everything sent before the first read should come out in one go
+        pipe_serial.send(b'100\n200\n30')
+        pipe_serial.send(b'0\n')
+
+        got = []
+        for message in recorder.get_millis():
+            got.append(message)
+            if len(got) == 3:
+                recorder.stop()
+
+        assert got == [b'100', b'200', b'300']
+
+
+class TestSerialWaiter:
+    def test_times_out_when_nothing_to_read(self, pipe_serial):
+        waiter = SerialWaiter(pipe_serial)
+        assert waiter.selector is not None
+        assert not waiter.wait(0.01)
+
+    def test_wakes_up_when_readable(self, pipe_serial):
+        waiter = SerialWaiter(pipe_serial)
+        pipe_serial.send(b'123\n')
+        assert waiter.wait(1)
+
+    def test_falls_back_to_in_waiting(self):
+        class Polled:
+            in_waiting = 0
+
+        ser = Polled()
+        waiter = SerialWaiter(ser, poll_interval=0.001)
+        assert waiter.selector is None
+        assert not waiter.wait(0.01)
 
+        ser.in_waiting = 4
+        assert waiter.wait(0.01)
@@ -0,0 +1,105 @@
+import csv
+from io import StringIO
+import os
+
+import pytest
+
+from laptime.laps import Lap
+from laptime.sinks import open_sink
+from laptime.report import find_sessions, report, summarise, REPORT_HEADER
+from laptime.__main__ import main
+
+
+DAY = 1460000000 * 10**9
+LAPTIMES = [60000, 61000, 59000, 60500, 120000, 60200]
+
+
+@pytest.fixture
+def archive(tmp_path):
+    sessions = [
+        ('2016-04-19/morning.csv', 'csv', None, 0),
+        ('2016-04-19/afternoon.csv.gz', 'csv', 'gzip', 3600),
+        ('2016-04-20/practice.laps', 'columnar', None, 86400),
+    ]
+
+    for name, fmt, compression, offset in sessions:
+        path = tmp_path / name
+        path.parent.mkdir(exist_ok=True)
+        sink = open_sink(str(path), fmt, compression=compression)
+        sink.writerows([Lap(DAY + (offset + i) * 10**9, 0, laptime, None)
+                        for i, laptime in enumerate(LAPTIMES)])
+        sink.close()
+
+    (tmp_path / 'notes.txt').write_text('not a session')
+    return tmp_path
+
+
+def read_report(text):
+    rows = list(csv.DictReader(StringIO(text)))
+    return ({row['Name']: row for row in rows if row['Scope'] == 'session'},
+            {row['Name']: row for row in rows if row['Scope'] == 'day'})
+
+
+def test_find_sessions(archive):
+    names = [os.path.relpath(path, str(archive))
+             for path in find_sessions(str(archive))]
+
+    assert names == [os.path.join('2016-04-19', 'afternoon.csv.gz'),
+                     os.path.join('2016-04-19', 'morning.csv'),
+                     os.path.join('2016-04-20', 'practice.laps')]
+
+
+def test_summarise(archive):
+    path, day, stats, outliers = summarise(
+        str(archive / '2016-04-19' / 'morning.csv'))
+
+    assert stats.count == len(LAPTIMES)
+    assert stats.best == 59000
+    # The 2 minute lap was a trip through the pits
+    assert outliers == 1
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_report(archive, processes):
+    fp = StringIO()
+    report(find_sessions(str(archive)), fp, processes=processes)
+
+    assert fp.getvalue().splitlines()[0] == ','.join(REPORT_HEADER)
+    sessions, days = read_report(fp.getvalue())
+
+    assert len(sessions) == 3
+    assert all(row['Laps'] == '6' and row['Best'] == '59000'
+               for row in sessions.values())
+
+    assert len(days) == 2
+    first, second = (days[day] for day in sorted(days))
+    assert first['Sessions'] == '2'
+    assert first['Laps'] == '12'
+    assert first['Outliers'] == '2'
+    assert second['Laps'] == '6'
+
+
+def test_report_command(archive, capsys):
+    main(['report', str(archive), '-j', '1'])
+
+    sessions, days = read_report(capsys.readouterr().out)
+    assert len(sessions) == 3
+    assert len(days) == 2
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_files_which_arent_sessions_are_skipped(archive, processes, capsys):
+    # e.g. last season's report
+    (archive / '2016-04-19' / 'report.csv').write_text(
+        'Scope,Name\nx,y\n')
+    (archive / 'broken.laps').write_bytes(b'nope')
+    fp = StringIO()
+
+    skipped = report(find_sessions(str(archive)), fp, processes=processes)
+
+    sessions, days = read_report(fp.getvalue())
+    assert len(sessions) == 3
+    assert len(days) == 2
+    assert sorted(os.path.basename(path) for path, _ in skipped) == [
+        'broken.laps', 'report.csv']
+    assert capsys.readouterr().err.count('Skipping') == 2
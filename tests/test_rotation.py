@@ -0,0 +1,138 @@
+import csv
+import gzip
+from io import StringIO
+import os
+import sys
+
+import pytest
+
+from laptime.laps import Lap, HEADER
+from laptime.rotation import RotatingSink, open_output, read_partial
+from laptime.sinks import open_sink
+
+
+LAPS = [Lap(i * 1000, i * 100, 100, None) for i in range(1, 6)]
+
+
+def rows(text):
+    return list(csv.reader(StringIO(text)))
+
+
+class TestCompression:
+    def test_gzip_round_trip(self, tmp_path):
+        filename = str(tmp_path / 'laps.csv.gz')
+        sink = open_sink(filename, 'csv', compression='gzip')
+        sink.writerows(LAPS)
+        sink.close()
+
+        with gzip.open(filename, 'rt') as fp:
+            assert rows(fp.read())[1] == ['1000', '100', '100', '0:0.100']
+
+    def test_recover_truncated_file(self, tmp_path):
+        filename = str(tmp_path / 'laps.csv.gz')
+        sink = open_sink(filename, 'csv', compression='gzip')
+        sink.writerows(LAPS[:3])
+        sink.flush()
+        flushed = os.path.getsize(filename)
+
+        # Simulate a crash partway through the next batch
+        sink.writerows(LAPS[3:])
+        with open(filename, 'rb') as fp:
+            partial = fp.read(flushed + 5)
+        truncated = str(tmp_path / 'crashed.csv.gz')
+        with open(truncated, 'wb') as fp:
+            fp.write(partial)
+        sink.close()
+
+        recovered = rows(read_partial(truncated).decode())
+        assert recovered[0] == HEADER
+        assert len(recovered) == 4
+
+    def test_uncompressed(self, tmp_path):
+        filename = str(tmp_path / 'plain.csv')
+        with open_output(filename) as fp:
+            fp.write('hello\n')
+
+        assert read_partial(filename) == b'hello\n'
+
+    def test_binary_formats_cant_be_compressed(self, tmp_path):
+        with pytest.raises(ValueError):
+            open_sink(str(tmp_path / 'x.laps'), 'columnar',
+                      compression='gzip')
+
+    def test_unknown_compression(self, tmp_path):
+        with pytest.raises(ValueError):
+            open_output(str(tmp_path / 'x'), 'lzma')
+
+
+class TestRotatingSink:
+    def test_rotate_by_size(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        sink = RotatingSink('session', max_bytes=1)
+
+        for lap in LAPS[:3]:
+            sink.writerow(lap)
+            sink.flush()
+        sink.close()
+
+        # Every file after the first gets a part number so names never
+        # clash, even when rotating more than once a second
+        assert len(sink.filenames) == 3
+        assert len(set(sink.filenames)) == 3
+        assert all(name.startswith('session_') for name in sink.filenames)
+
+        for name in sink.filenames:
+            with open(name) as fp:
+                assert rows(fp.read())[0] == HEADER
+
+    def test_rotate_by_time(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        sink = RotatingSink('session', fmt='jsonl', compression='gzip',
+                            max_seconds=0)
+        sink.writerows(LAPS[:2])
+        sink.writerows(LAPS[2:])
+        sink.close()
+
+        assert len(sink.filenames) == 3
+        assert sink.filenames[-1].endswith('.jsonl.gz')
+        assert read_partial(sink.filenames[0]) == b''
+        lines = read_partial(sink.filenames[-1]).splitlines()
+        assert len(lines) == 3
+
+    def test_no_limits(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        sink = RotatingSink('session')
+        sink.writerows(LAPS)
+        sink.close()
+
+        assert sink.stats()['files'] == 1
+        assert sink.stats()['laps_written'] == len(LAPS)
+
+
+@pytest.mark.parametrize('options, message', [
+    (['-f', 'csv', '-f', 'sqlite', '-z', 'gzip'],
+     "sqlite output can't be compressed"),
+    (['-f', 'columnar', '-z', 'gzip'], "columnar output can't be compressed"),
+])
+def test_cli_rejects_compressing_binary_formats(tmp_path, monkeypatch, capsys,
+                                                options, message):
+    from laptime.__main__ import main
+
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(SystemExit):
+        main(options)
+
+    assert message in capsys.readouterr().err
+    assert not list(tmp_path.iterdir())
+
+
+def test_cli_needs_zstandard_for_zstd(tmp_path, monkeypatch, capsys):
+    from laptime.__main__ import main
+
+    monkeypatch.setitem(sys.modules, 'zstandard', None)
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(SystemExit):
+        main(['-z', 'zstd'])
+
+    assert '"zstandard" package' in capsys.readouterr().err
+    assert not list(tmp_path.iterdir())
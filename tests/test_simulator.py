@@ -0,0 +1,144 @@
+from itertools import islice
+import io
+
+import pytest
+
+pytest.importorskip('pty')
+from serial import Serial
+
+from laptime.framing import BinaryFramer
+from laptime.reader import record
+from laptime.simulator import VirtualGate
+
+
+def take(gate, count):
+    return list(islice(gate.schedule(), count))
+
+
+@pytest.fixture
+def make_gate():
+    gates = []
+
+    def make(**kwargs):
+        gate = VirtualGate(**kwargs)
+        gates.append(gate)
+        return gate
+
+    yield make
+    for gate in gates:
+        gate.close()
+
+
+def test_steady_rate(make_gate):
+    events = take(make_gate(rate=100), 5)
+
+    assert [when for when, _, _ in events] == pytest.approx(
+        [0.01, 0.02, 0.03, 0.04, 0.05])
+    assert [data for _, data, _ in events] == [
+        b'1010\n', b'1020\n', b'1030\n', b'1040\n', b'1050\n']
+
+
+def test_seeded_runs_are_the_same(make_gate):
+    options = dict(rate=100, jitter=0.5, burst=0.1, corruption=0.1, seed=3)
+
+    assert take(make_gate(**options), 500) == take(make_gate(**options), 500)
+
+
+def test_jitter_and_bursts(make_gate):
+    events = take(make_gate(rate=100, jitter=0.5, burst=0.2, burst_size=5,
+                            seed=1), 1000)
+    gaps = [b[0] - a[0] for a, b in zip(events, events[1:])]
+
+    assert all(gap <= 0.015 + 1e-9 for gap in gaps)
+    assert any(0.005 - 1e-9 <= gap < 0.009 for gap in gaps)
+    # Everything in a burst is due at once
+    assert gaps.count(0) >= 4
+
+
+def test_pauses(make_gate):
+    events = take(make_gate(rate=10, pause_every=1, pause_for=5), 30)
+    gaps = [b[0] - a[0] for a, b in zip(events, events[1:])]
+
+    assert max(gaps) == pytest.approx(5.1)
+    assert sum(1 for gap in gaps if gap > 1) == 2
+
+
+def test_corruption(make_gate):
+    events = take(make_gate(rate=100, corruption=0.2, seed=1), 1000)
+    corrupted = [data for _, data, garbled in events if garbled]
+
+    assert 150 < len(corrupted) < 250
+    assert all(data[:-1].isdigit() and data.endswith(b'\n')
+               for _, data, garbled in events if not garbled)
+    for data in corrupted:
+        with pytest.raises(ValueError):
+            int(data)
+
+
+def test_binary_frames(make_gate):
+    gate = make_gate(rate=100, binary=True, gates=3, seed=1)
+    data = b''.join(data for _, data, _ in take(gate, 100))
+
+    frames = BinaryFramer().feed(data)
+
+    assert len(frames) == 100
+    assert {frame.gate for frame in frames} == {0, 1, 2}
+    assert [frame.millis for frame in frames[:3]] == [1010, 1020, 1030]
+
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_record_from_the_pty(make_gate, binary):
+    gate = make_gate(rate=None, binary=binary, seed=1)
+    ser = Serial(gate.port, timeout=5)
+    fp = io.StringIO()
+
+    gate.start(count=2000)
+    record(ser, fp, binary=binary)
+    gate.join()
+    ser.close()
+
+    assert gate.stats()['events'] == 2000
+    assert len(fp.getvalue().splitlines()) == 2001
+
+
+def test_record_skips_line_noise(make_gate):
+    gate = make_gate(rate=None, corruption=0.01, seed=2)
+    ser = Serial(gate.port, timeout=5)
+    fp = io.StringIO()
+
+    gate.start(count=5000)
+    stats = record(ser, fp)
+    gate.join()
+    ser.close()
+
+    corrupted = gate.stats()['corrupted']
+    assert 0 < stats.parse_errors <= corrupted
+    # A garbled newline takes the next reading down with it
+    assert 5000 - 2 * corrupted <= stats.laps <= 5000 - stats.parse_errors
+    assert len(fp.getvalue().splitlines()) == stats.laps + 1
+
+
+def test_stop(make_gate):
+    gate = make_gate(rate=1)
+    ser = Serial(gate.port, timeout=5)
+
+    gate.start()
+    gate.stop()
+    gate.join(5)
+
+    # Only the final 0
+    assert ser.read(2) == b'0\n'
+    ser.close()
+
+
+def test_waits_for_a_reader(make_gate):
+    gate = make_gate(rate=None)
+
+    assert not gate.wait_for_reader(timeout=0.1)
+
+    ser = Serial(gate.port, timeout=5)
+    assert gate.wait_for_reader(timeout=1)
+
+    gate.run(count=3)
+    assert ser.read(8) == b'1001\n100'
+    ser.close()
@@ -0,0 +1,190 @@
+import csv
+from io import StringIO
+import json
+import threading
+import time
+
+import pytest
+
+from laptime.laps import Lap, HEADER, MULTI_HEADER
+from laptime.sinks import CSVSink, JSONLinesSink, Sink, Tee, open_sink
+from laptime.reader import record
+
+
+LAPS = [
+    Lap(1000, 100, 100, None),
+    Lap(2000, 250, 150, None),
+    Lap(3000, 400, 150, None),
+]
+
+
+class KeepOpen(StringIO):
+    """
+    A StringIO which can still be read after the sink closes it.
+    """
+    def close(self):
+        pass
+
+
+class ListSink(Sink):
+    def __init__(self, delay=0):
+        super().__init__()
+        self.laps = []
+        self.delay = delay
+        self.closed = False
+
+    def _write(self, laps):
+        time.sleep(self.delay)
+        self.laps.extend(laps)
+
+    def close(self):
+        super().close()
+        self.closed = True
+
+
+class TestCSVSink:
+    def test_write(self):
+        fp = StringIO()
+        sink = CSVSink(fp)
+        sink.writerows(LAPS)
+
+        rows = list(csv.reader(StringIO(fp.getvalue())))
+        assert rows[0] == HEADER
+        assert rows[1] == ['1000', '100', '100', '0:0.100']
+        assert sink.laps_written == 3
+
+    def test_gate_column(self):
+        fp = StringIO()
+        sink = CSVSink(fp, gate=True)
+        sink.writerow(Lap(1000, 100, 100, 2))
+
+        rows = list(csv.reader(StringIO(fp.getvalue())))
+        assert rows == [MULTI_HEADER, ['1000', '100', '100', '0:0.100', '2']]
+
+
+def test_json_lines_sink():
+    fp = KeepOpen()
+    with JSONLinesSink(fp) as sink:
+        sink.writerows(LAPS)
+
+    lines = [json.loads(line) for line in fp.getvalue().splitlines()]
+    assert lines[1] == {'timestamp': 2000, 'millis': 250, 'laptime': 150,
+                        'gate': None}
+
+
+def test_open_sink(tmp_path):
+    filename = str(tmp_path / 'laps.jsonl')
+    with open_sink(filename, 'jsonl') as sink:
+        sink.writerows(LAPS)
+
+    with open(filename) as fp:
+        assert len(fp.readlines()) == 3
+
+    with pytest.raises(ValueError):
+        open_sink(filename, 'xml')
+
+
+class TestTee:
+    def test_every_sink_gets_every_lap(self):
+        sinks = [ListSink(), ListSink()]
+
+        with Tee(sinks) as tee:
+            tee.writerows(LAPS)
+
+        assert sinks[0].laps == LAPS
+        assert sinks[1].laps == LAPS
+        assert all(sink.closed for sink in sinks)
+
+    def test_slow_sink_doesnt_stall_the_others(self):
+        fast, slow = ListSink(), ListSink(delay=0.1)
+        tee = Tee([fast, slow], lossy=[slow], max_queue=5, batch_size=1,
+                  batch_interval=0.001)
+
+        start = time.perf_counter()
+        for i in range(20):
+            tee.writerow(Lap(i, i, 1, None))
+            time.sleep(0.002)
+        duration = time.perf_counter() - start
+
+        assert duration < 0.4
+
+        stats = tee.stats()
+        tee.close()
+
+        assert len(fast.laps) == 20
+        assert len(slow.laps) < 20
+        assert stats['ListSink_1']['dropped'] > 0
+        assert stats['ListSink_0']['dropped'] == 0
+        assert slow.write_time > fast.write_time
+
+    def test_laps_arent_dropped_by_default(self):
+        fast, slow = ListSink(), ListSink(delay=0.01)
+
+        with Tee([fast, slow], max_queue=5, batch_size=1,
+                 batch_interval=0.001) as tee:
+            for i in range(30):
+                tee.writerow(Lap(i, i, 1, None))
+
+        assert len(slow.laps) == 30
+        assert tee.stats()['ListSink_1']['dropped'] == 0
+
+    def test_failing_sink_doesnt_stop_the_others(self, caplog):
+        class BrokenSink(ListSink):
+            def _write(self, laps):
+                raise IOError('Disk full')
+
+        good, broken = ListSink(), BrokenSink()
+        tee = Tee([good, broken], batch_size=1, batch_interval=0.001)
+
+        for i in range(300):
+            tee.writerow(Lap(i, i, 1, None))
+            if i == 10:
+                # Give the broken sink a chance to fail
+                time.sleep(0.05)
+
+        assert tee.stats()['BrokenSink_1']['failed']
+        assert 'Stopped writing to BrokenSink' in caplog.text
+
+        with pytest.raises(IOError):
+            tee.close()
+
+        assert len(good.laps) == 300
+        assert good.closed and broken.closed
+
+    def test_every_sink_failing_is_raised(self):
+        class BrokenSink(ListSink):
+            def _write(self, laps):
+                raise IOError('Disk full')
+
+        tee = Tee([BrokenSink()], batch_size=1, batch_interval=0.001)
+        tee.writerow(LAPS[0])
+        time.sleep(0.05)
+
+        with pytest.raises(IOError):
+            tee.writerow(LAPS[1])
+        with pytest.raises(IOError):
+            tee.close()
+
+    def test_record_into_a_tee(self):
+        class Arduino:
+            is_open = True
+            lines = [b'100\n', b'250\n', b'0\n']
+
+            def readline(self):
+                return self.lines.pop(0)
+
+        csv_fp, json_fp = KeepOpen(), KeepOpen()
+        tee = Tee([CSVSink(csv_fp), JSONLinesSink(json_fp)])
+        record(Arduino(), None, sink=tee)
+        tee.close()
+
+        assert len(csv_fp.getvalue().splitlines()) == 3
+        assert len(json_fp.getvalue().splitlines()) == 2
+
+
+def test_a_sink_has_to_write():
+    class Lazy(Sink):
+        pass
+
+    with pytest.raises(TypeError):
+        Lazy()
@@ -0,0 +1,139 @@
+import pickle
+import random
+import statistics
+import threading
+
+import pytest
+
+from laptime.laps import Lap
+from laptime.stats import QuantileSketch, SessionStats
+from laptime.sinks import Tee
+
+
+def laptimes(count=5000, seed=1):
+    rng = random.Random(seed)
+    return [int(rng.gauss(60000, 4000)) for _ in range(count)]
+
+
+class TestQuantileSketch:
+    @pytest.mark.parametrize('q', [0, 0.1, 0.5, 0.9, 0.99, 1])
+    def test_accuracy(self, q):
+        values = laptimes()
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        for value in values:
+            sketch.add(value)
+
+        exact = sorted(values)[int(q * (len(values) - 1))]
+        assert sketch.quantile(q) == pytest.approx(exact, rel=0.01)
+
+    def test_bounded(self):
+        sketch = QuantileSketch(max_buckets=50)
+        for value in range(1, 100000, 7):
+            sketch.add(value)
+
+        assert len(sketch.buckets) <= 50
+        # The top end is still accurate
+        assert sketch.quantile(1) == pytest.approx(99996, rel=0.01)
+
+    def test_merge(self):
+        first, second, both = (QuantileSketch() for _ in range(3))
+        for i, value in enumerate(laptimes(1000)):
+            (first if i % 2 else second).add(value)
+            both.add(value)
+
+        first.merge(second)
+        assert first.count == both.count
+        assert first.quantile(0.5) == both.quantile(0.5)
+
+        with pytest.raises(ValueError):
+            first.merge(QuantileSketch(relative_accuracy=0.05))
+
+    def test_empty_and_zero(self):
+        sketch = QuantileSketch()
+        assert sketch.quantile(0.5) is None
+
+        sketch.add(0)
+        sketch.add(0)
+        sketch.add(100)
+        assert sketch.quantile(0.5) == 0
+        assert sketch.quantile(1) == pytest.approx(100, rel=0.01)
+
+
+class TestSessionStats:
+    def test_matches_statistics_module(self):
+        values = laptimes()
+        stats = SessionStats()
+        for value in values:
+            stats.update(value)
+
+        snapshot = stats.snapshot()
+        assert snapshot.count == len(values)
+        assert snapshot.best == min(values)
+        assert snapshot.worst == max(values)
+        assert snapshot.last == values[-1]
+        assert snapshot.mean == pytest.approx(statistics.mean(values))
+        assert snapshot.stdev == pytest.approx(statistics.stdev(values))
+        assert snapshot.median == pytest.approx(statistics.median(values),
+                                                rel=0.01)
+
+    def test_empty(self):
+        snapshot = SessionStats().snapshot()
+
+        assert snapshot.count == 0
+        assert snapshot.best is None
+        assert snapshot.mean is None
+        assert snapshot.median is None
+
+    def test_snapshots_are_cached(self):
+        stats = SessionStats()
+        stats.update_many([100, 200])
+
+        first = stats.snapshot()
+        assert stats.snapshot() is first
+
+        stats.update(50)
+        assert stats.snapshot().best == 50
+
+    def test_as_a_sink(self):
+        stats = SessionStats()
+        tee = Tee([stats])
+        tee.writerows([Lap(0, 100, 100, None), Lap(0, 350, 250, None)])
+        tee.close()
+
+        assert stats.snapshot().mean == 175
+        assert stats.stats()['laps_written'] == 2
+
+    def test_snapshot_while_updating(self):
+        stats = SessionStats()
+        values = laptimes(20000)
+        thread = threading.Thread(target=lambda: [stats.update(value)
+                                                  for value in values])
+        thread.start()
+
+        while thread.is_alive():
+            snapshot = stats.snapshot()
+            if snapshot.count:
+                assert snapshot.best <= snapshot.mean <= snapshot.worst
+        thread.join()
+
+        assert stats.snapshot().count == len(values)
+
+
+def test_merge_and_pickle():
+    values = laptimes(3000)
+    first, second, both = SessionStats(), SessionStats(), SessionStats()
+    first.update_many(values[:1000])
+    second.update_many(values[1000:])
+    both.update_many(values)
+
+    first.merge(pickle.loads(pickle.dumps(second)))
+    merged, expected = first.snapshot(), both.snapshot()
+
+    assert merged.count == expected.count
+    assert merged.mean == pytest.approx(expected.mean)
+    assert merged.variance == pytest.approx(expected.variance)
+    assert merged[:4] == expected[:4]
+    assert merged.median == expected.median
+
+    first.merge(SessionStats())
+    assert first.snapshot() == merged
@@ -0,0 +1,161 @@
+import csv
+from io import StringIO
+import threading
+import time
+
+import pytest
+
+from laptime.writer import BackgroundWriter
+from laptime.reader import record
+
+
+class ListWriter:
+    def __init__(self, delay=0):
+        self.batches = []
+        self.delay = delay
+
+    def writerows(self, rows):
+        time.sleep(self.delay)
+        self.batches.append(list(rows))
+
+
+class ScriptedSerial:
+    def __init__(self, lines):
+        self.lines = list(lines)
+        self.is_open = True
+
+    def readline(self):
+        return self.lines.pop(0)
+
+
+class BrokenWriter:
+    def writerows(self, rows):
+        raise IOError('Disk full')
+
+
+class TestBackgroundWriter:
+    def test_everything_is_written_on_stop(self):
+        target = ListWriter()
+
+        with BackgroundWriter(target, batch_size=10) as writer:
+            for i in range(25):
+                writer.writerow([i])
+
+        rows = [row for batch in target.batches for row in batch]
+        assert rows == [[i] for i in range(25)]
+        assert all(len(batch) <= 10 for batch in target.batches)
+        assert writer.rows_written == 25
+
+    def test_batches_are_flushed_after_interval(self):
+        target = ListWriter()
+        flushed = threading.Event()
+        writer = BackgroundWriter(target, flush=flushed.set,
+                                  batch_size=1000, batch_interval=0.01)
+        writer.start()
+
+        writer.writerow(['a'])
+        assert flushed.wait(1)
+        assert target.batches == [[['a']]]
+
+        writer.stop()
+
+    def test_high_water_mark(self):
+        target = ListWriter(delay=0.05)
+
+        with BackgroundWriter(target, batch_size=1) as writer:
+            for i in range(5):
+                writer.writerow([i])
+            assert writer.depth > 0
+
+        assert writer.high_water >= 3
+        assert writer.stats()['depth'] == 0
+
+    def test_errors_are_raised_on_stop(self):
+        writer = BackgroundWriter(BrokenWriter(), batch_size=1)
+        writer.start()
+        writer.writerow(['a'])
+
+        with pytest.raises(IOError):
+            writer.stop()
+
+
+def test_record_in_the_background():
+    fp = StringIO()
+    ser = ScriptedSerial([b'100\n', b'250\n', b'400\n', b'0\n'])
+    record(ser, fp, background=True)
+
+    rows = list(csv.reader(StringIO(fp.getvalue())))
+    assert [row[1:] for row in rows[1:]] == [
+        ['100', '100', '0:0.100'],
+        ['250', '150', '0:0.150'],
+        ['400', '150', '0:0.150'],
+    ]
+
+
+def test_a_bad_row_only_drops_itself(caplog):
+    target = ListWriter()
+
+    class PickyWriter:
+        def writerows(self, rows):
+            if any(row[0] < 0 for row in rows):
+                raise ValueError('millis must be a positive integer')
+            target.writerows(rows)
+
+    writer = BackgroundWriter(PickyWriter(), batch_size=10)
+    writer.start()
+    writer.writerows([[1], [2], [-3], [4]])
+
+    with pytest.raises(ValueError):
+        writer.stop()
+
+    assert [row for batch in target.batches for row in batch] == [
+        [1], [2], [4]]
+    assert writer.rows_written == 3
+    assert 'Dropped 1 of 4 rows' in caplog.text
+
+
+def test_laps_around_an_arduino_reset_are_kept():
+    fp = StringIO()
+    ser = ScriptedSerial([b'1000\n', b'2000\n', b'3000\n', b'4000\n',
+                          b'500\n', b'600\n', b'0\n'])
+
+    with pytest.raises(ValueError):
+        record(ser, fp, background=True)
+
+    rows = list(csv.reader(StringIO(fp.getvalue())))
+    assert [row[1] for row in rows[1:]] == [
+        '1000', '2000', '3000', '4000', '600']
+
+
+def test_writer_errors_dont_hide_a_recording_error(caplog):
+    from laptime.sinks import Sink
+
+    class BrokenSink(Sink):
+        def _write(self, laps):
+            raise IOError('Disk full')
+
+    class UnpluggedSerial(ScriptedSerial):
+        def readline(self):
+            if not self.lines:
+                raise RuntimeError('Device disconnected')
+            return super().readline()
+
+    ser = UnpluggedSerial([b'100\n', b'200\n'])
+
+    with pytest.raises(RuntimeError):
+        record(ser, None, background=True, sink=BrokenSink())
+
+    assert 'Disk full' in caplog.text
+
+
+def test_writer_errors_are_raised_after_recording():
+    from laptime.sinks import Sink
+
+    class BrokenSink(Sink):
+        def _write(self, laps):
+            raise IOError('Disk full')
+
+    ser = ScriptedSerial([b'100\n', b'0\n'])
+
+    with pytest.raises(IOError):
+        record(ser, None, background=True, sink=BrokenSink())